@@ -3,11 +3,15 @@ FastAPI main application entry point
 Designed for AWS Lambda deployment via Mangum adapter
 """
 
+import asyncio
+
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from mangum import Mangum
 from app.config import settings
-from app.routes import tickets, webhooks, customers, health
+from app.routes import tickets, webhooks, customers, health, inbox, broadcasts
+from app.services import db_service, kafka_producer, messaging_service
+from app.services.delivery import delivery_queue
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -32,6 +36,9 @@ app.include_router(health.router, prefix="/api", tags=["Health"])
 app.include_router(tickets.router, prefix="/api/tickets", tags=["Tickets"])
 app.include_router(webhooks.router, prefix="/api/webhooks", tags=["Webhooks"])
 app.include_router(customers.router, prefix="/api/customers", tags=["Customers"])
+app.include_router(inbox.router, prefix="/api/inbox", tags=["Inbox"])
+if settings.BROADCASTS_ENABLED:
+    app.include_router(broadcasts.router, prefix="/api/broadcasts", tags=["Broadcasts"])
 
 @app.get("/")
 async def root():
@@ -41,5 +48,31 @@ async def root():
         "version": "1.0.0"
     }
 
+@app.on_event("shutdown")
+async def shutdown():
+    """Release connections when running as a long-lived server (uvicorn)"""
+    await delivery_queue.drain()
+    await kafka_producer.close()
+    await messaging_service.close()
+    db_service.close()
+
 # Lambda handler via Mangum
-handler = Mangum(app, lifespan="off")
+_mangum_handler = Mangum(app, lifespan="off")
+
+
+def handler(event, context):
+    """
+    Lambda entry point.
+    Lambda freezes the process between invocations. A reply's first delivery attempt
+    still running would be frozen holding its lease, delaying the reply by
+    DELIVERY_LEASE_SECONDS, so wait for it (only requests that sent a reply have one).
+    The serverless deployment records ticket events in the outbox, published by the
+    outboxRelay worker, so there is nothing to flush; without the outbox, events still
+    in the producer's buffer would be stranded, so they are flushed before returning.
+    """
+    response = _mangum_handler(event, context)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(delivery_queue.drain())
+    if not settings.EVENT_OUTBOX_ENABLED:
+        loop.run_until_complete(kafka_producer.flush())
+    return response
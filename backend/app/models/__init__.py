@@ -2,8 +2,19 @@ from app.models.ticket import (
     Ticket,
     TicketCreateRequest,
     TicketUpdateRequest,
+    BulkTicketUpdateRequest,
+    BulkTicketUpdateResult,
+    BulkTicketUpdateResponse,
     MessageCreateRequest,
     TicketListResponse,
+    MessageListResponse,
+    InboxEntry,
+    InboxResponse,
+    Delivery,
+    DeliveryListResponse,
+    DeliveryStatus,
+    BroadcastRecipient,
+    BroadcastRequest,
     TicketStatus,
     TicketPriority,
     Channel,
@@ -18,8 +29,19 @@ __all__ = [
     "Ticket",
     "TicketCreateRequest",
     "TicketUpdateRequest",
+    "BulkTicketUpdateRequest",
+    "BulkTicketUpdateResult",
+    "BulkTicketUpdateResponse",
     "MessageCreateRequest",
     "TicketListResponse",
+    "MessageListResponse",
+    "InboxEntry",
+    "InboxResponse",
+    "Delivery",
+    "DeliveryListResponse",
+    "DeliveryStatus",
+    "BroadcastRecipient",
+    "BroadcastRequest",
     "TicketStatus",
     "TicketPriority",
     "Channel",
@@ -2,7 +2,7 @@
 Pydantic models for ticket management
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional, Literal
 from datetime import datetime
 from enum import Enum
@@ -32,6 +32,14 @@ class Channel(str, Enum):
     INSTAGRAM = "instagram"
 
 
+class DeliveryStatus(str, Enum):
+    PENDING = "pending"
+    SENDING = "sending"
+    RETRYING = "retrying"
+    DELIVERED = "delivered"
+    FAILED = "failed"
+
+
 class SenderType(str, Enum):
     CUSTOMER = "customer"
     AGENT = "agent"
@@ -59,10 +67,18 @@ class Customer(BaseModel):
 
 
 class Attachment(BaseModel):
-    url: str
+    url: Optional[str] = Field(
+        None,
+        description="External link; stored attachments are fetched by attachment_id instead"
+    )
     file_type: str
     file_name: Optional[str] = None
     size_bytes: Optional[int] = None
+    # Attachments received by email are kept in object storage, not on the ticket
+    attachment_id: Optional[str] = None
+    storage_key: Optional[str] = None
+    sha256: Optional[str] = None
+    content_id: Optional[str] = Field(None, description="Content-ID for inline images referenced by the HTML body")
 
 
 class Message(BaseModel):
@@ -89,6 +105,9 @@ class Ticket(BaseModel):
     customer: Customer
     subject: str
     timeline: List[Message] = []
+    last_message: Optional[Message] = None
+    last_agent_message: Optional[Message] = None
+    message_count: int = 0
 
 
 class TicketCreateRequest(BaseModel):
@@ -109,6 +128,27 @@ class TicketUpdateRequest(BaseModel):
     tags: Optional[List[str]] = None
 
 
+class BulkTicketUpdateRequest(BaseModel):
+    """Request body for applying one update to many tickets"""
+    ticket_ids: List[str] = Field(..., min_length=1, max_length=500)
+    updates: TicketUpdateRequest
+
+
+class BulkTicketUpdateResult(BaseModel):
+    """Outcome for a single ticket in a bulk update"""
+    ticket_id: str
+    success: bool
+    error: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+
+class BulkTicketUpdateResponse(BaseModel):
+    """Response for a bulk update - per-ticket results, no ticket bodies"""
+    results: List[BulkTicketUpdateResult]
+    succeeded: int
+    failed: int
+
+
 class MessageCreateRequest(BaseModel):
     """Request body for adding a message to a ticket"""
     content: str
@@ -118,9 +158,82 @@ class MessageCreateRequest(BaseModel):
     attachments: List[Attachment] = []
 
 
+class MessageListResponse(BaseModel):
+    """Response for paging through a ticket's messages"""
+    messages: List[Message]
+    next_cursor: Optional[str] = None
+
+
 class TicketListResponse(BaseModel):
     """Response for listing tickets"""
     tickets: List[Ticket]
     total_count: int
     page: int
     page_size: int
+    next_cursor: Optional[str] = Field(
+        None,
+        description="Opaque token for the next page; absent on the last page"
+    )
+
+
+class InboxEntry(BaseModel):
+    """A ticket as it appears in a precomputed inbox (built from the event stream)"""
+    ticket_id: str
+    subject: Optional[str] = None
+    status: Optional[TicketStatus] = None
+    priority: Optional[TicketPriority] = None
+    channel: Optional[Channel] = None
+    customer_id: Optional[str] = None
+    assigned_agent_id: Optional[str] = None
+    message_count: int = 0
+    last_sender_type: Optional[SenderType] = None
+    created_at: Optional[datetime] = None
+    updated_at: datetime
+
+
+class InboxResponse(BaseModel):
+    """One page of an inbox, most recently updated first"""
+    entries: List[InboxEntry]
+    next_cursor: Optional[str] = None
+
+
+class Delivery(BaseModel):
+    """Delivery state of an agent reply sent to the customer's channel"""
+    ticket_id: str
+    message_id: str
+    channel: Channel
+    recipient_id: str
+    status: DeliveryStatus
+    attempts: int = 0
+    last_error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    due_at: Optional[datetime] = Field(
+        None,
+        description="Next attempt (or lease expiry while sending); meaningless once delivered or failed"
+    )
+    delivered_at: Optional[datetime] = None
+
+
+class DeliveryListResponse(BaseModel):
+    """Deliveries for a ticket's outbound messages, oldest first"""
+    deliveries: List[Delivery]
+
+
+class BroadcastRecipient(BaseModel):
+    """One broadcast recipient: a ticket (notified on its channel) or a customer"""
+    ticket_id: Optional[str] = None
+    customer_id: Optional[str] = None
+    message: str
+
+    @model_validator(mode="after")
+    def _one_target(self):
+        if bool(self.ticket_id) == bool(self.customer_id):
+            raise ValueError("Give exactly one of ticket_id or customer_id")
+        return self
+
+
+class BroadcastRequest(BaseModel):
+    """Request body for notifying many tickets or customers at once"""
+    recipients: List[BroadcastRecipient] = Field(..., min_length=1, max_length=10000)
+    subject: Optional[str] = Field(None, description="Subject for email recipients")
@@ -1,3 +1,3 @@
-from app.routes import tickets, webhooks, customers, health
+from app.routes import tickets, webhooks, customers, health, inbox, broadcasts
 
-__all__ = ["tickets", "webhooks", "customers", "health"]
+__all__ = ["tickets", "webhooks", "customers", "health", "inbox", "broadcasts"]
@@ -0,0 +1,32 @@
+"""
+Broadcast endpoint
+Notifies many tickets or customers at once (e.g. during an incident)
+"""
+
+import json
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+
+from app.models import BroadcastRequest
+from app.services.broadcast import broadcast_service
+from app.utils.auth import get_current_user
+
+router = APIRouter()
+
+
+@router.post("/")
+async def send_broadcast(
+    request: BroadcastRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Send each recipient its message on its own channel.
+    Streams newline-delimited JSON as sends complete: a "result" line per recipient,
+    "progress" lines, then a "summary" line. Closing the connection cancels the rest.
+    """
+    async def lines():
+        async for record in broadcast_service.send(request.recipients, request.subject):
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -2,9 +2,16 @@
 Health check endpoints
 """
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from datetime import datetime
 
+from app.config import settings
+from app.services import db_service, messaging_service
+from app.services.delivery import delivery_queue
+from app.services.ingestion import webhook_ingestion
+from app.services.outbox import outbox_relay
+from app.utils.auth import get_current_user
+
 router = APIRouter()
 
 
@@ -26,3 +33,53 @@ async def readiness_check():
         "ready": True,
         "timestamp": datetime.utcnow().isoformat()
     }
+
+
+# The endpoints below expose internal counters and queue depths, and some query DynamoDB
+# or SQS on every call, so they are for signed-in agents and dashboards only
+
+@router.get("/health/cache")
+async def cache_stats(current_user: dict = Depends(get_current_user)):
+    """Hit/miss statistics for the in-process caches"""
+    return {
+        "ticket_cache": db_service.ticket_cache.stats(),
+        "customer_cache": db_service.customer_cache.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+@router.get("/health/outbox")
+async def outbox_lag(current_user: dict = Depends(get_current_user)):
+    """Event outbox backlog - how far the relay is behind"""
+    return {
+        "enabled": settings.EVENT_OUTBOX_ENABLED,
+        "outbox": await outbox_relay.lag() if settings.EVENT_OUTBOX_ENABLED else None,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+@router.get("/health/messaging")
+async def messaging_stats():
+    """Per-channel circuit breaker state, concurrency and send latency"""
+    return {
+        "channels": messaging_service.adapter_stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+@router.get("/health/deliveries")
+async def delivery_stats(current_user: dict = Depends(get_current_user)):
+    """Outbound delivery backlog per channel and this process's delivery counters"""
+    return {
+        "deliveries": await delivery_queue.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+@router.get("/health/ingest")
+async def ingest_stats(current_user: dict = Depends(get_current_user)):
+    """Inbound webhook queue depth (including dead letters) and this process's ingest counters"""
+    return {
+        "ingest": await webhook_ingestion.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
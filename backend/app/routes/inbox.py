@@ -0,0 +1,55 @@
+"""
+Agent inbox endpoints
+Served from the read models the inbox consumer materializes from the event stream.
+They trail ticket writes by the consumer lag; use /api/tickets for read-your-write views.
+"""
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Optional
+
+from app.models import InboxResponse, TicketStatus
+from app.services import db_service
+from app.services.inbox import agent_inbox, status_inbox
+from app.utils.auth import get_current_user
+from app.utils.pagination import encode_cursor, decode_cursor, InvalidCursorError
+
+router = APIRouter()
+
+
+async def _read_inbox(inbox_id: str, page_size: int, cursor: Optional[str]) -> dict:
+    filters = {"inbox_id": inbox_id}
+
+    last_evaluated_key = None
+    if cursor:
+        try:
+            last_evaluated_key = decode_cursor(cursor, filters)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    result = await db_service.list_inbox(inbox_id, page_size, last_evaluated_key)
+    return {
+        "entries": result["entries"],
+        "next_cursor": encode_cursor(result["last_evaluated_key"], filters)
+    }
+
+
+@router.get("/status/{status}", response_model=InboxResponse)
+async def get_status_inbox(
+    status: TicketStatus,
+    page_size: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Tickets currently in a status, most recently updated first"""
+    return await _read_inbox(status_inbox(status.value), page_size, cursor)
+
+
+@router.get("/agents/{agent_id}", response_model=InboxResponse)
+async def get_agent_inbox(
+    agent_id: str,
+    page_size: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Tickets currently assigned to an agent, most recently updated first"""
+    return await _read_inbox(agent_inbox(agent_id), page_size, cursor)
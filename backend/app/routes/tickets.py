@@ -3,21 +3,28 @@ Ticket management endpoints
 """
 
 from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import RedirectResponse, StreamingResponse
 from typing import Optional, List
-from datetime import datetime
-import uuid
+from urllib.parse import quote
 
 from app.models import (
     Ticket,
     TicketCreateRequest,
     TicketUpdateRequest,
+    BulkTicketUpdateRequest,
+    BulkTicketUpdateResponse,
     MessageCreateRequest,
     TicketListResponse,
-    SenderType,
-    Message
+    MessageListResponse,
+    DeliveryListResponse,
+    SenderType
 )
-from app.services import db_service, kafka_producer
+from app.config import settings
+from app.services import db_service
+from app.services.delivery import delivery_queue
+from app.services.object_store import object_store
 from app.utils.auth import get_current_user
+from app.utils.pagination import encode_cursor, decode_cursor, InvalidCursorError
 
 router = APIRouter()
 
@@ -36,10 +43,8 @@ async def create_ticket(request: TicketCreateRequest):
         primary_email=request.customer.primary_email
     )
 
-    # Prepare initial message
+    # Prepare initial message (ID and timestamp are assigned by the service)
     initial_message = {
-        "message_id": f"msg_{uuid.uuid4().hex[:12]}",
-        "timestamp": datetime.utcnow().isoformat(),
         "sender_type": SenderType.CUSTOMER,
         "content": request.initial_message,
         "content_type": "text",
@@ -63,10 +68,6 @@ async def create_ticket(request: TicketCreateRequest):
     }
 
     ticket = await db_service.create_ticket(ticket_data)
-
-    # Publish Kafka event
-    await kafka_producer.publish_ticket_created(ticket.dict())
-
     return ticket
 
 
@@ -79,6 +80,27 @@ async def get_ticket(ticket_id: str):
     return ticket
 
 
+@router.put("/bulk", response_model=BulkTicketUpdateResponse)
+async def bulk_update_tickets(
+    request: BulkTicketUpdateRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Apply one metadata update to many tickets (mass close, re-tag, reassign)"""
+    updates = {k: v for k, v in request.updates.dict().items() if v is not None}
+
+    if not updates:
+        raise HTTPException(status_code=400, detail="No updates provided")
+
+    results = await db_service.bulk_update_tickets(request.ticket_ids, updates)
+
+    succeeded = sum(1 for result in results if result["success"])
+    return {
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded
+    }
+
+
 @router.put("/{ticket_id}", response_model=Ticket)
 async def update_ticket(
     ticket_id: str,
@@ -95,9 +117,6 @@ async def update_ticket(
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
 
-    # Publish update event
-    await kafka_producer.publish_ticket_updated(ticket_id, ticket.dict())
-
     return ticket
 
 
@@ -107,7 +126,10 @@ async def add_message(
     request: MessageCreateRequest,
     current_user: dict = Depends(get_current_user)
 ):
-    """Add a new message to a ticket timeline"""
+    """
+    Add a new message to a ticket timeline; returns the ticket with it.
+    Public agent replies are queued for delivery to the customer's channel.
+    """
     message_data = {
         "sender_type": request.sender_type,
         "content": request.content,
@@ -117,37 +139,107 @@ async def add_message(
         "attachments": [att.dict() for att in request.attachments]
     }
 
-    ticket = await db_service.add_message_to_ticket(ticket_id, message_data)
+    message = await db_service.add_message_to_ticket(ticket_id, message_data)
+    if not message:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+
+    ticket = await db_service.get_ticket(ticket_id, consistent=True)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
 
-    # Publish message event
-    message_with_id = ticket.timeline[-1]
-    await kafka_producer.publish_message_added(ticket_id, message_with_id.dict())
+    if message.sender_type == SenderType.AGENT and message.visibility == "public":
+        await delivery_queue.enqueue(ticket, message)
 
     return ticket
 
 
+@router.get("/{ticket_id}/deliveries", response_model=DeliveryListResponse)
+async def list_deliveries(ticket_id: str, current_user: dict = Depends(get_current_user)):
+    """Delivery state of the ticket's outbound replies"""
+    return {"deliveries": await db_service.list_deliveries(ticket_id)}
+
+
+@router.get("/{ticket_id}/messages", response_model=MessageListResponse)
+async def list_messages(
+    ticket_id: str,
+    page_size: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Page backwards through a ticket's timeline, newest messages first"""
+    filters = {"ticket_id": ticket_id}
+
+    last_evaluated_key = None
+    if cursor:
+        try:
+            last_evaluated_key = decode_cursor(cursor, filters)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    result = await db_service.get_ticket_messages(
+        ticket_id,
+        limit=page_size,
+        last_evaluated_key=last_evaluated_key
+    )
+
+    return {
+        "messages": result["messages"],
+        "next_cursor": encode_cursor(result["last_evaluated_key"], filters)
+    }
+
+
+@router.get("/{ticket_id}/messages/{message_id}/attachments/{attachment_id}")
+async def get_attachment(
+    ticket_id: str,
+    message_id: str,
+    attachment_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Download an attachment kept in object storage: a redirect to a short-lived
+    presigned URL (S3), or the content streamed through the API (local store)
+    """
+    message = await db_service.get_ticket_message(ticket_id, message_id)
+    attachment = next(
+        (a for a in message.attachments if a.attachment_id == attachment_id and a.storage_key),
+        None
+    ) if message else None
+    if attachment is None:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+
+    url = await object_store.download_url(
+        attachment.storage_key, attachment.file_name, settings.OBJECT_STORE_DOWNLOAD_URL_SECONDS
+    )
+    if url:
+        return RedirectResponse(url)
+
+    try:
+        chunks = await object_store.open_read(attachment.storage_key)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Attachment content not found")
+    return StreamingResponse(
+        chunks,
+        media_type=attachment.file_type,
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(attachment.file_name or attachment_id)}"}
+    )
+
+
 @router.get("/{ticket_id}/status")
 async def get_ticket_status(ticket_id: str):
     """
     Get ticket status - lightweight endpoint for chatbot polling
     Returns only status and last message timestamp
     """
-    ticket = await db_service.get_ticket(ticket_id)
-    if not ticket:
+    status = await db_service.get_ticket_status(ticket_id)
+    if not status:
         raise HTTPException(status_code=404, detail="Ticket not found")
 
-    last_agent_message = None
-    for message in reversed(ticket.timeline):
-        if message.sender_type == SenderType.AGENT:
-            last_agent_message = message
-            break
+    last_agent_message = status["last_agent_message"]
 
     return {
-        "ticket_id": ticket.ticket_id,
-        "status": ticket.status,
-        "last_updated": ticket.updated_at,
+        "ticket_id": status["ticket_id"],
+        "status": status["status"],
+        "last_updated": status["updated_at"],
         "has_agent_reply": last_agent_message is not None,
         "last_agent_message": last_agent_message.dict() if last_agent_message else None
     }
@@ -159,41 +251,64 @@ async def assign_ticket(
     agent_id: str = Query(..., description="Agent ID to assign ticket to"),
     current_user: dict = Depends(get_current_user)
 ):
-    """Assign a ticket to an agent"""
-    ticket = await db_service.update_ticket(ticket_id, {"assigned_agent_id": agent_id})
-    if not ticket:
-        raise HTTPException(status_code=404, detail="Ticket not found")
-
-    # Add system message
+    """Assign a ticket to an agent and log the event in a single transactional write"""
     system_message = {
         "sender_type": SenderType.SYSTEM,
         "content": f"Ticket assigned to agent {agent_id}",
         "content_type": "event_log",
         "visibility": "internal"
     }
-    await db_service.add_message_to_ticket(ticket_id, system_message)
 
-    return {"success": True, "ticket": ticket}
+    event = await db_service.update_ticket_with_event(
+        ticket_id,
+        {"assigned_agent_id": agent_id},
+        system_message
+    )
+    if not event:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+
+    return {
+        "success": True,
+        "ticket_id": ticket_id,
+        "assigned_agent_id": agent_id,
+        "event": event
+    }
 
 
 @router.get("/", response_model=TicketListResponse)
 async def list_tickets(
     status: Optional[str] = Query(None, description="Filter by status"),
     assigned_agent_id: Optional[str] = Query(None, description="Filter by assigned agent"),
-    page: int = Query(1, ge=1),
+    page: int = Query(1, ge=1, description="Page number, echoed back for display"),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     current_user: dict = Depends(get_current_user)
 ):
-    """List tickets with optional filters and pagination"""
+    """List tickets with optional filters and cursor pagination"""
+    filters = {"status": status, "assigned_agent_id": assigned_agent_id}
+
+    last_evaluated_key = None
+    if cursor:
+        try:
+            last_evaluated_key = decode_cursor(cursor, filters)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     result = await db_service.list_tickets(
         status=status,
         assigned_agent_id=assigned_agent_id,
-        limit=page_size
+        limit=page_size,
+        last_evaluated_key=last_evaluated_key
+    )
+    total_count = await db_service.count_tickets(
+        status=status,
+        assigned_agent_id=assigned_agent_id
     )
 
     return {
         "tickets": result["tickets"],
-        "total_count": result["count"],
+        "total_count": total_count,
         "page": page,
-        "page_size": page_size
+        "page_size": page_size,
+        "next_cursor": encode_cursor(result["last_evaluated_key"], filters)
     }
@@ -1,19 +1,38 @@
 """
-Webhook receivers for social media platforms
-Normalizes incoming data from various sources into ticket format
+Webhook receivers for social media platforms and inbound email
+Messaging payloads are queued as received and acked; the ingest worker normalizes
+them into ticket format (see app.services.ingestion)
 """
 
-from fastapi import APIRouter, Request, HTTPException, Header
+from fastapi import APIRouter, Depends, Request, HTTPException, Header
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from typing import Optional
 import hmac
 import hashlib
 import logging
 
+from app.config import settings
 from app.models import TicketCreateRequest, Source, Customer, Channel, TicketPriority
-from app.services import db_service, kafka_producer
+from app.services.inbound_email import EmailTooLarge, InvalidEmail, discard_email, receive_email
+from app.services.ingestion import webhook_ingestion
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
+email_basic_auth = HTTPBasic(auto_error=False)
+
+
+def verify_email_webhook(credentials: Optional[HTTPBasicCredentials] = Depends(email_basic_auth)):
+    """Check the Inbound Parse post's basic auth before any of the body is read"""
+    if not settings.EMAIL_WEBHOOK_PASSWORD:
+        logger.error("Email webhook called but EMAIL_WEBHOOK_PASSWORD is not set")
+        raise HTTPException(status_code=503, detail="Inbound email is not configured")
+
+    valid = credentials is not None and all([
+        hmac.compare_digest(credentials.username.encode(), settings.EMAIL_WEBHOOK_USERNAME.encode()),
+        hmac.compare_digest(credentials.password.encode(), settings.EMAIL_WEBHOOK_PASSWORD.encode())
+    ])
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials", headers={"WWW-Authenticate": "Basic"})
 
 
 @router.post("/facebook")
@@ -22,60 +41,7 @@ async def facebook_webhook(request: Request):
     Facebook Messenger webhook
     Receives messages from Facebook Page
     """
-    try:
-        data = await request.json()
-
-        # Facebook sends test events during setup
-        if data.get("object") == "page":
-            for entry in data.get("entry", []):
-                for messaging_event in entry.get("messaging", []):
-                    sender_id = messaging_event["sender"]["id"]
-
-                    if "message" in messaging_event:
-                        message_text = messaging_event["message"].get("text", "")
-
-                        # Check if user has an open ticket
-                        existing_ticket = await _find_open_ticket_by_channel_id(
-                            sender_id, Channel.FACEBOOK
-                        )
-
-                        if existing_ticket:
-                            # Add message to existing ticket
-                            await db_service.add_message_to_ticket(
-                                existing_ticket.ticket_id,
-                                {
-                                    "sender_type": "customer",
-                                    "content": message_text,
-                                    "channel_specific_data": {
-                                        "facebook_message_id": messaging_event["message"]["mid"]
-                                    }
-                                }
-                            )
-                        else:
-                            # Create new ticket
-                            ticket_request = TicketCreateRequest(
-                                source=Source(
-                                    channel=Channel.FACEBOOK,
-                                    origin_platform_id=sender_id,
-                                    is_bot_handoff=False
-                                ),
-                                customer=Customer(
-                                    internal_id="",  # Will be created
-                                    channel_identity=sender_id
-                                ),
-                                subject=f"Facebook message from {sender_id}",
-                                initial_message=message_text,
-                                priority=TicketPriority.MEDIUM
-                            )
-
-                            # Create ticket via the service
-                            await _create_ticket_from_webhook(ticket_request)
-
-        return {"status": "ok"}
-
-    except Exception as e:
-        logger.error(f"Facebook webhook error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await _accept("facebook", request)
 
 
 @router.get("/facebook")
@@ -101,57 +67,7 @@ async def whatsapp_webhook(request: Request):
     WhatsApp Business API webhook
     Handles incoming WhatsApp messages
     """
-    try:
-        data = await request.json()
-
-        for entry in data.get("entry", []):
-            for change in entry.get("changes", []):
-                value = change.get("value", {})
-
-                if "messages" in value:
-                    for message in value["messages"]:
-                        from_number = message["from"]
-                        message_text = message.get("text", {}).get("body", "")
-
-                        # Check for existing open ticket
-                        existing_ticket = await _find_open_ticket_by_channel_id(
-                            from_number, Channel.WHATSAPP
-                        )
-
-                        if existing_ticket:
-                            await db_service.add_message_to_ticket(
-                                existing_ticket.ticket_id,
-                                {
-                                    "sender_type": "customer",
-                                    "content": message_text,
-                                    "channel_specific_data": {
-                                        "whatsapp_message_id": message["id"]
-                                    }
-                                }
-                            )
-                        else:
-                            ticket_request = TicketCreateRequest(
-                                source=Source(
-                                    channel=Channel.WHATSAPP,
-                                    origin_platform_id=from_number,
-                                    is_bot_handoff=False
-                                ),
-                                customer=Customer(
-                                    internal_id="",
-                                    channel_identity=from_number
-                                ),
-                                subject=f"WhatsApp message from {from_number}",
-                                initial_message=message_text,
-                                priority=TicketPriority.MEDIUM
-                            )
-
-                            await _create_ticket_from_webhook(ticket_request)
-
-        return {"status": "ok"}
-
-    except Exception as e:
-        logger.error(f"WhatsApp webhook error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return await _accept("whatsapp", request)
 
 
 @router.post("/twitter")
@@ -160,55 +76,32 @@ async def twitter_webhook(request: Request, x_twitter_webhooks_signature: Option
     Twitter/X DM webhook
     Handles incoming direct messages
     """
-    try:
-        data = await request.json()
-
-        # Twitter sends DM events
-        if "direct_message_events" in data:
-            for dm_event in data["direct_message_events"]:
-                sender_id = dm_event["message_create"]["sender_id"]
-                message_text = dm_event["message_create"]["message_data"]["text"]
+    return await _accept("twitter", request)
 
-                # Check for existing ticket
-                existing_ticket = await _find_open_ticket_by_channel_id(
-                    sender_id, Channel.TWITTER
-                )
-
-                if existing_ticket:
-                    await db_service.add_message_to_ticket(
-                        existing_ticket.ticket_id,
-                        {
-                            "sender_type": "customer",
-                            "content": message_text,
-                            "channel_specific_data": {
-                                "twitter_dm_id": dm_event["id"]
-                            }
-                        }
-                    )
-                else:
-                    ticket_request = TicketCreateRequest(
-                        source=Source(
-                            channel=Channel.TWITTER,
-                            origin_platform_id=sender_id,
-                            is_bot_handoff=False
-                        ),
-                        customer=Customer(
-                            internal_id="",
-                            channel_identity=sender_id
-                        ),
-                        subject=f"Twitter DM from {sender_id}",
-                        initial_message=message_text,
-                        priority=TicketPriority.MEDIUM
-                    )
-
-                    await _create_ticket_from_webhook(ticket_request)
-
-        return {"status": "ok"}
 
+@router.post("/email", dependencies=[Depends(verify_email_webhook)])
+async def email_webhook(request: Request):
+    """
+    SendGrid Inbound Parse webhook
+    Streams the email's bodies and attachments to object storage, then queues the rest
+    """
+    try:
+        payload = await receive_email(request.headers.get("content-type"), request.stream())
+    except EmailTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidEmail as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Twitter webhook error: {e}")
+        # Not acked, so SendGrid retries it
+        logger.error(f"email webhook error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    try:
+        return await _enqueue("email", payload)
+    except HTTPException:
+        await discard_email(payload)
+        raise
+
 
 @router.post("/chatbot")
 async def chatbot_handoff(request: Request):
@@ -237,7 +130,7 @@ async def chatbot_handoff(request: Request):
             tags=["chatbot_handoff"] + data.get("tags", [])
         )
 
-        ticket = await _create_ticket_from_webhook(ticket_request)
+        ticket = await webhook_ingestion.create_ticket(ticket_request)
 
         return {
             "success": True,
@@ -251,53 +144,22 @@ async def chatbot_handoff(request: Request):
 
 
 # Helper functions
-async def _find_open_ticket_by_channel_id(channel_id: str, channel: Channel):
-    """Find an open ticket for a given channel identity"""
-    # Query tickets by customer with open status
-    # This is a simplified version - in production, use a GSI on channel_identity
-    result = await db_service.list_tickets(status="open", limit=100)
-
-    for ticket in result["tickets"]:
-        if (ticket.customer.channel_identity == channel_id and
-            ticket.source.channel == channel and
-            ticket.status in ["new", "open", "pending_customer"]):
-            return ticket
-
-    return None
-
+async def _accept(platform: str, request: Request) -> dict:
+    """Enqueue the raw payload and ack; the ingest worker does the ticket work"""
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
 
-async def _create_ticket_from_webhook(ticket_request: TicketCreateRequest):
-    """Helper to create ticket from webhook data"""
-    # Get or create customer
-    customer_data = await db_service.get_or_create_customer(
-        channel_identity=ticket_request.customer.channel_identity,
-        channel=ticket_request.source.channel,
-        name=ticket_request.customer.name,
-        primary_email=ticket_request.customer.primary_email
-    )
+    return await _enqueue(platform, data)
 
-    # Prepare ticket data
-    ticket_data = {
-        "status": "new",
-        "priority": ticket_request.priority,
-        "tags": ticket_request.tags,
-        "source": ticket_request.source.dict(),
-        "customer": {
-            "internal_id": customer_data["internal_id"],
-            "name": customer_data.get("name"),
-            "primary_email": customer_data.get("primary_email"),
-            "channel_identity": customer_data["channel_identity"]
-        },
-        "subject": ticket_request.subject,
-        "timeline": [{
-            "sender_type": "customer",
-            "content": ticket_request.initial_message,
-            "content_type": "text",
-            "visibility": "public"
-        }]
-    }
 
-    ticket = await db_service.create_ticket(ticket_data)
-    await kafka_producer.publish_ticket_created(ticket.dict())
+async def _enqueue(platform: str, data: dict) -> dict:
+    try:
+        message_id = await webhook_ingestion.accept(platform, data)
+    except Exception as e:
+        # Not acked, so the platform redelivers it
+        logger.error(f"{platform} webhook error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-    return ticket
+    return {"status": "ok", "message_id": message_id}
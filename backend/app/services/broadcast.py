@@ -0,0 +1,213 @@
+"""
+Broadcast sends
+Notifies many tickets or customers at once. Recipients are grouped by channel: emails with
+the same body go out as SendGrid personalizations (up to 1000 per request), the other
+channels send one message per recipient. Each channel runs its own bounded pool of senders
+under the shared channel rate limits, and results stream back as they finish.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from app.config import settings
+from app.models import BroadcastRecipient, Channel
+from app.services.delivery import backoff_delay, delivery_queue
+from app.services.dynamodb import db_service
+from app.services.messaging import SENDGRID_MAX_PERSONALIZATIONS, SendResult, messaging_service
+
+logger = logging.getLogger(__name__)
+
+
+class _Job(NamedTuple):
+    """One provider call and the recipients whose result it decides"""
+    channel: Channel
+    message: str
+    targets: List[Dict[str, Any]]
+
+
+class BroadcastService:
+    async def _resolve(
+        self,
+        recipients: List[BroadcastRecipient]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Look up every recipient's channel and address; returns (targets, results for the unresolvable)"""
+        tickets, customers = await asyncio.gather(
+            db_service.get_ticket_contacts([r.ticket_id for r in recipients if r.ticket_id]),
+            db_service.get_customers([r.customer_id for r in recipients if r.customer_id])
+        )
+
+        targets, unresolved = [], []
+        for index, recipient in enumerate(recipients):
+            target = {"index": index, "ticket_id": recipient.ticket_id, "customer_id": recipient.customer_id}
+            not_sent = {**target, "channel": None, "recipient_id": None, "success": False, "attempts": 0}
+            if recipient.ticket_id:
+                ticket = tickets.get(recipient.ticket_id)
+                if ticket is None:
+                    unresolved.append({**not_sent, "error": "Ticket not found"})
+                    continue
+                target.update(
+                    channel=ticket["source"]["channel"],
+                    recipient_id=ticket["customer"]["channel_identity"],
+                    origin_platform_id=ticket["source"].get("origin_platform_id")
+                )
+            else:
+                customer = customers.get(recipient.customer_id)
+                if customer is None or not customer.get("channels"):
+                    unresolved.append({**not_sent, "error": "Customer not found"})
+                    continue
+                target.update(
+                    channel=customer["channels"][0],
+                    recipient_id=customer["channel_identity"],
+                    origin_platform_id=None
+                )
+            target["message"] = recipient.message
+            targets.append(target)
+
+        return targets, unresolved
+
+    @staticmethod
+    def _plan(targets: List[Dict[str, Any]]) -> Dict[str, Deque[_Job]]:
+        """Provider calls per channel: batched by body for email, one per recipient otherwise"""
+        jobs: Dict[str, Deque[_Job]] = {}
+        email_groups: Dict[str, List[Dict[str, Any]]] = {}
+
+        for target in targets:
+            if target["channel"] == Channel.EMAIL.value:
+                email_groups.setdefault(target["message"], []).append(target)
+            else:
+                jobs.setdefault(target["channel"], deque()).append(
+                    _Job(Channel(target["channel"]), target["message"], [target])
+                )
+
+        for message, group in email_groups.items():
+            for start in range(0, len(group), SENDGRID_MAX_PERSONALIZATIONS):
+                jobs.setdefault(Channel.EMAIL.value, deque()).append(
+                    _Job(Channel.EMAIL, message, group[start:start + SENDGRID_MAX_PERSONALIZATIONS])
+                )
+        return jobs
+
+    async def _send(self, job: _Job, subject: Optional[str]) -> Tuple[SendResult, int]:
+        """
+        Make one provider call, retrying retryable failures with backoff until
+        BROADCAST_MAX_ATTEMPTS or BROADCAST_MAX_WAIT_SECONDS. Calls shed by an open
+        circuit or a saturated channel are retried without using an attempt.
+        Returns (final result, attempts).
+        """
+        bucket = delivery_queue.bucket(job.channel.value)
+        deadline = time.monotonic() + settings.BROADCAST_MAX_WAIT_SECONDS
+        attempts = 0
+
+        while True:
+            if not await bucket.acquire(max(deadline - time.monotonic(), 0.0)):
+                return SendResult(False, retryable=True, error=f"{job.channel.value} rate limited"), attempts
+
+            if job.channel == Channel.EMAIL:
+                # Duplicate addresses get one copy
+                emails = list(dict.fromkeys(target["recipient_id"] for target in job.targets))
+                result = await messaging_service.send_email_batch(emails, job.message, subject)
+            else:
+                target = job.targets[0]
+                result = await messaging_service.send(
+                    job.channel, target["recipient_id"], job.message, target["origin_platform_id"]
+                )
+
+            if not result.shed:
+                attempts += 1
+            if result.success or not result.retryable or attempts >= settings.BROADCAST_MAX_ATTEMPTS:
+                return result, attempts
+
+            if result.retry_after:
+                bucket.pause(result.retry_after)
+            delay = result.retry_after or 0.0
+            if not result.shed:
+                delay = max(delay, backoff_delay(attempts))
+            delay = max(delay, 1 / bucket.rate)
+            if time.monotonic() + delay > deadline:
+                return result, attempts
+            await asyncio.sleep(delay)
+
+    async def _channel_worker(self, jobs: Deque[_Job], subject: Optional[str], results: asyncio.Queue):
+        try:
+            while jobs:
+                job = jobs.popleft()
+                result, attempts = await self._send(job, subject)
+                for target in job.targets:
+                    results.put_nowait({
+                        "index": target["index"],
+                        "ticket_id": target["ticket_id"],
+                        "customer_id": target["customer_id"],
+                        "channel": target["channel"],
+                        "recipient_id": target["recipient_id"],
+                        "success": result.success,
+                        "attempts": attempts,
+                        "error": result.error
+                    })
+        finally:
+            # End-of-worker marker
+            results.put_nowait(None)
+
+    async def send(self, recipients: List[BroadcastRecipient], subject: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Send every recipient its message, yielding one "result" record per recipient as
+        it completes (in completion order; "index" is the position in the request), a
+        "progress" record every BROADCAST_PROGRESS_EVERY results, and a final "summary".
+        Stopping the iteration early cancels the sends still pending.
+        """
+        started = time.monotonic()
+        total = len(recipients)
+        succeeded = failed = 0
+
+        targets, unresolved = await self._resolve(recipients)
+        plan = self._plan(targets)
+        provider_calls = {channel: len(jobs) for channel, jobs in plan.items()}
+        results: asyncio.Queue = asyncio.Queue()
+        workers = [
+            asyncio.create_task(self._channel_worker(jobs, subject, results))
+            for jobs in plan.values()
+            for _ in range(min(settings.BROADCAST_CONCURRENCY, len(jobs)))
+        ]
+        for item in unresolved:
+            results.put_nowait(item)
+
+        completed = 0
+        running = len(workers)
+        try:
+            while running or not results.empty():
+                item = await results.get()
+                if item is None:
+                    running -= 1
+                    continue
+
+                completed += 1
+                if item["success"]:
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield {"type": "result", **item}
+
+                if completed % settings.BROADCAST_PROGRESS_EVERY == 0 and completed < total:
+                    yield {"type": "progress", "completed": completed, "total": total, "succeeded": succeeded, "failed": failed}
+        finally:
+            pending = [worker for worker in workers if not worker.done()]
+            if pending:
+                logger.warning(f"Broadcast stopped after {completed} of {total} recipients; cancelling the rest")
+                for worker in pending:
+                    worker.cancel()
+
+        elapsed = time.monotonic() - started
+        logger.info(f"Broadcast to {total} recipients: {succeeded} succeeded, {failed} failed in {elapsed:.1f}s")
+        yield {
+            "type": "summary",
+            "total": total,
+            "succeeded": succeeded,
+            "failed": failed,
+            "provider_calls": provider_calls,
+            "elapsed_seconds": round(elapsed, 3)
+        }
+
+
+# Singleton instance
+broadcast_service = BroadcastService()
@@ -0,0 +1,282 @@
+"""
+Outbound delivery queue
+Agent replies are recorded in the deliveries table before anything is sent, then delivered
+with retries (exponential backoff with full jitter) under per-channel token-bucket rate
+limits that close for as long as a provider's Retry-After asks
+"""
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from app.config import settings
+from app.models import Channel, DeliveryStatus, Message, Ticket
+from app.services.dynamodb import db_service
+from app.services.messaging import messaging_service
+
+logger = logging.getLogger(__name__)
+
+
+def _timestamp(offset_seconds: float = 0.0) -> str:
+    """Fixed-width UTC timestamp, so due_at compares correctly as a string"""
+    return (datetime.utcnow() + timedelta(seconds=offset_seconds)).isoformat(timespec="microseconds")
+
+
+def backoff_delay(attempts: int) -> float:
+    """Full jitter: uniform between zero and the capped exponential delay"""
+    ceiling = min(settings.DELIVERY_BACKOFF_MAX_SECONDS, settings.DELIVERY_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return random.uniform(0, ceiling)
+
+
+class TokenBucket:
+    """Send rate limit for one channel; pause() closes it while a provider is throttling us"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        # Nothing accrues while paused
+        start = max(self.updated, self.paused_until)
+        if now > start:
+            self.tokens = min(self.capacity, self.tokens + (now - start) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> float:
+        """Take a token if one is free (returns 0), otherwise return the seconds until one is"""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now + 1 / self.rate
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self, max_wait: float) -> bool:
+        """Wait for a token; False (without taking one) if that would take longer than max_wait"""
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    def resume_in(self) -> float:
+        """Seconds until the bucket reopens after a pause"""
+        return max(self.paused_until - time.monotonic(), 0.0)
+
+
+class DeliveryQueue:
+    def __init__(self):
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._sends: Optional[asyncio.Semaphore] = None
+        # First attempts started by enqueue() in this process
+        self._in_flight: Set[asyncio.Task] = set()
+        self.delivered_total = 0
+        self.retried_total = 0
+        self.failed_total = 0
+        self.throttled_total = 0
+        self.last_run_at: str = None
+
+    def bucket(self, channel: str) -> TokenBucket:
+        """The channel's rate limit, shared by everything in this process that sends on it"""
+        bucket = self._buckets.get(channel)
+        if bucket is None:
+            bucket = TokenBucket(
+                settings.DELIVERY_RATE_LIMITS.get(channel, 10.0),
+                settings.DELIVERY_BURST.get(channel, 10)
+            )
+            self._buckets[channel] = bucket
+        return bucket
+
+    async def enqueue(self, ticket: Ticket, message: Message) -> Optional[Dict[str, Any]]:
+        """
+        Record an agent reply for delivery on the ticket's channel.
+        With DELIVERY_SEND_ON_ENQUEUE the record starts out leased to this process and the
+        first attempt begins immediately; if it doesn't finish, the worker picks it up when
+        the lease runs out. Returns None if the message was already queued.
+        """
+        now = _timestamp()
+        delivery = {
+            "ticket_id": ticket.ticket_id,
+            "message_id": message.message_id,
+            "channel": ticket.source.channel.value,
+            "recipient_id": ticket.customer.channel_identity,
+            "origin_platform_id": ticket.source.origin_platform_id,
+            "content": message.content,
+            "status": DeliveryStatus.PENDING.value,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+            "due_at": _timestamp(settings.DELIVERY_LEASE_SECONDS) if settings.DELIVERY_SEND_ON_ENQUEUE else now
+        }
+        if not await db_service.put_delivery(delivery):
+            return None
+
+        if settings.DELIVERY_SEND_ON_ENQUEUE:
+            task = asyncio.create_task(self._attempt(delivery))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+        return delivery
+
+    async def drain(self):
+        """Wait for first attempts started in this process (end of a Lambda invocation, shutdown)"""
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    async def _record(self, delivery: Dict[str, Any], fields: Dict[str, Any], dequeue: bool = False) -> Optional[Dict[str, Any]]:
+        """Conditional on the delivery still holding the due_at this worker last saw"""
+        return await db_service.update_delivery(
+            delivery["ticket_id"],
+            delivery["message_id"],
+            delivery["due_at"],
+            {**fields, "updated_at": _timestamp()},
+            dequeue
+        )
+
+    async def _attempt(self, delivery: Dict[str, Any]) -> Optional[str]:
+        """Send a delivery this worker holds the lease on and record the outcome"""
+        channel = delivery["channel"]
+        attempts = int(delivery["attempts"])
+        bucket = self.bucket(channel)
+
+        if not await bucket.acquire(settings.DELIVERY_MAX_THROTTLE_WAIT_SECONDS):
+            # Back in the queue until the channel reopens; this doesn't count as an attempt
+            self.throttled_total += 1
+            await self._record(delivery, {
+                "status": (DeliveryStatus.RETRYING if attempts else DeliveryStatus.PENDING).value,
+                "due_at": _timestamp(max(bucket.resume_in(), 1 / bucket.rate))
+            })
+            return None
+
+        if self._sends is None:
+            self._sends = asyncio.Semaphore(settings.DELIVERY_CONCURRENCY)
+        async with self._sends:
+            result = await messaging_service.send(
+                Channel(channel),
+                delivery["recipient_id"],
+                delivery["content"],
+                delivery.get("origin_platform_id")
+            )
+
+        if result.shed:
+            # Never left this process (circuit open or channel saturated): requeue without using an attempt
+            self.throttled_total += 1
+            if result.retry_after:
+                bucket.pause(result.retry_after)
+            await self._record(delivery, {
+                "status": (DeliveryStatus.RETRYING if attempts else DeliveryStatus.PENDING).value,
+                "due_at": _timestamp(max(result.retry_after or 0.0, 1 / bucket.rate)),
+                "last_error": result.error
+            })
+            return None
+
+        attempts += 1
+        if result.success:
+            status = DeliveryStatus.DELIVERED
+            fields = {"delivered_at": _timestamp()}
+            self.delivered_total += 1
+        elif result.retryable and attempts < settings.DELIVERY_MAX_ATTEMPTS:
+            if result.retry_after is not None:
+                bucket.pause(result.retry_after)
+            status = DeliveryStatus.RETRYING
+            delay = max(backoff_delay(attempts), result.retry_after or 0.0)
+            fields = {"due_at": _timestamp(delay), "last_error": result.error}
+            self.retried_total += 1
+        else:
+            status = DeliveryStatus.FAILED
+            fields = {"last_error": result.error}
+            self.failed_total += 1
+            logger.error(f"Delivery of {delivery['message_id']} via {channel} failed after {attempts} attempts: {result.error}")
+
+        recorded = await self._record(
+            delivery,
+            {**fields, "status": status.value, "attempts": attempts},
+            dequeue=status in (DeliveryStatus.DELIVERED, DeliveryStatus.FAILED)
+        )
+        if recorded is None:
+            logger.warning(f"Lease on delivery {delivery['message_id']} expired before its outcome was recorded")
+        return status.value
+
+    async def _claim_and_send(self, item: Dict[str, Any]) -> bool:
+        claimed = await self._record(item, {
+            "status": DeliveryStatus.SENDING.value,
+            "due_at": _timestamp(settings.DELIVERY_LEASE_SECONDS)
+        })
+        if claimed is None:
+            # Another worker got there first
+            return False
+        try:
+            await self._attempt(claimed)
+        except Exception as e:
+            # The lease expires and the delivery is retried
+            logger.error(f"Delivery of {item['message_id']} raised: {e}")
+        return True
+
+    async def run_once(self) -> int:
+        """Claim and send one batch of due deliveries from every open channel queue"""
+        now = _timestamp()
+        shards = [
+            shard
+            for channel in Channel
+            if not self.bucket(channel.value).resume_in()
+            for shard in db_service.delivery_shards(channel.value)
+        ]
+        batches: List[List[Dict[str, Any]]] = await asyncio.gather(*(
+            db_service.read_due_deliveries(shard, now, settings.DELIVERY_BATCH_SIZE) for shard in shards
+        ))
+        claimed = await asyncio.gather(*(self._claim_and_send(item) for batch in batches for item in batch))
+        self.last_run_at = datetime.utcnow().isoformat()
+        return sum(claimed)
+
+    async def run_forever(self):
+        """Long-running delivery loop; polls only when nothing was due"""
+        logger.info("Delivery worker started")
+        while True:
+            try:
+                processed = await self.run_once()
+            except Exception as e:
+                logger.error(f"Delivery worker error: {e}")
+                processed = 0
+
+            if not processed:
+                await asyncio.sleep(settings.DELIVERY_POLL_SECONDS)
+
+    async def stats(self) -> Dict[str, Any]:
+        """Queued deliveries per channel, outcome counters and throttled channels"""
+        queued = {}
+        for channel in Channel:
+            counts = await asyncio.gather(*(
+                db_service.count_queued_deliveries(shard) for shard in db_service.delivery_shards(channel.value)
+            ))
+            queued[channel.value] = sum(counts)
+
+        return {
+            "queued": queued,
+            "paused_channels": {
+                channel: round(bucket.resume_in(), 3)
+                for channel, bucket in self._buckets.items() if bucket.resume_in()
+            },
+            "delivered_total": self.delivered_total,
+            "retried_total": self.retried_total,
+            "failed_total": self.failed_total,
+            "throttled_total": self.throttled_total,
+            "last_run_at": self.last_run_at
+        }
+
+
+# Singleton instance
+delivery_queue = DeliveryQueue()
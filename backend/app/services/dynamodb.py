@@ -2,27 +2,147 @@
 DynamoDB service layer for ticket management
 """
 
+import asyncio
+import functools
+import hashlib
 import boto3
-from boto3.dynamodb.conditions import Key, Attr
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from botocore.config import Config
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from typing import Callable, List, Optional, Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import time
 import uuid
+import zlib
 from app.config import settings
-from app.models import Ticket, Customer, Message, TicketStatus
+from app.services import events
+from app.models import Ticket, Customer, Message, TicketStatus, SenderType
+from app.services.cache import build_cache
+from app.services.kafka_producer import kafka_producer
 
 
 class DynamoDBService:
+    # GSIs on the tickets table, all sorted by status_timestamp ("<status>#<iso ts>")
+    CUSTOMER_INDEX = "CustomerIndex"
+    STATUS_INDEX = "StatusIndex"
+    AGENT_INDEX = "AgentIndex"
+
+    # LSI on the inbox table, sorted by updated_at
+    INBOX_UPDATED_INDEX = "UpdatedIndex"
+
+    # Sparse GSI on the deliveries table: queued deliveries by queue_shard, sorted by due_at
+    DELIVERY_DUE_INDEX = "DueIndex"
+
+    # Statuses that keep a ticket as the routing target for its channel identity
+    ACTIVE_STATUSES = {"new", "open", "pending_customer"}
+
+    # Characters of message content kept in the ticket's last_message summary
+    MESSAGE_PREVIEW_LENGTH = 280
+
+    # Largest position within one write that fits the fixed-width field of a message ID
+    MESSAGE_POSITION_MAX = 0xffff
+
     def __init__(self):
-        self.dynamodb = boto3.resource('dynamodb', region_name=settings.AWS_REGION)
+        # boto3 is blocking, so every call runs on a bounded thread pool sized to
+        # match the HTTP connection pool; the event loop never waits on DynamoDB
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.DYNAMODB_MAX_WORKERS,
+            thread_name_prefix="dynamodb"
+        )
+        self.dynamodb = boto3.resource(
+            'dynamodb',
+            region_name=settings.AWS_REGION,
+            config=Config(
+                max_pool_connections=settings.DYNAMODB_MAX_WORKERS,
+                connect_timeout=settings.DYNAMODB_CONNECT_TIMEOUT_SECONDS,
+                read_timeout=settings.DYNAMODB_READ_TIMEOUT_SECONDS,
+                retries={"max_attempts": 3, "mode": "standard"}
+            )
+        )
         self.tickets_table = self.dynamodb.Table(settings.DYNAMODB_TICKETS_TABLE)
         self.customers_table = self.dynamodb.Table(settings.DYNAMODB_CUSTOMERS_TABLE)
+        self.conversations_table = self.dynamodb.Table(settings.DYNAMODB_CONVERSATIONS_TABLE)
+        self.channel_routes_table = self.dynamodb.Table(settings.DYNAMODB_CHANNEL_ROUTES_TABLE)
+        self.outbox_table = self.dynamodb.Table(settings.DYNAMODB_OUTBOX_TABLE)
+        self.inbox_table = self.dynamodb.Table(settings.DYNAMODB_INBOX_TABLE)
+        self.deliveries_table = self.dynamodb.Table(settings.DYNAMODB_DELIVERIES_TABLE)
+        self.webhook_receipts_table = self.dynamodb.Table(settings.DYNAMODB_WEBHOOK_RECEIPTS_TABLE)
+        self.email_threads_table = self.dynamodb.Table(settings.DYNAMODB_EMAIL_THREADS_TABLE)
+        self.ticket_cache = build_cache(
+            settings.TICKET_CACHE_BACKEND,
+            max_size=settings.TICKET_CACHE_MAX_SIZE,
+            ttl_seconds=settings.TICKET_CACHE_TTL_SECONDS
+        )
+        self.customer_cache = build_cache(
+            settings.TICKET_CACHE_BACKEND,
+            max_size=settings.CUSTOMER_CACHE_MAX_SIZE,
+            ttl_seconds=settings.CUSTOMER_CACHE_TTL_SECONDS
+        )
+        # (status, assigned_agent_id) -> (count, expires_at)
+        self._count_cache: Dict[Tuple[Optional[str], Optional[str]], Tuple[int, float]] = {}
+        # ticket_id -> event_seq after this process's last write to it, the expected value for
+        # the next transactional write (a wrong guess fails the condition and is re-read)
+        self._event_seqs = build_cache("memory", max_size=settings.TICKET_CACHE_MAX_SIZE, ttl_seconds=300.0)
+
+    async def _run(self, fn, *args, **kwargs):
+        """Run a blocking boto3 call on the DynamoDB executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    @staticmethod
+    def _batch_put(table, items: List[Dict[str, Any]]):
+        with table.batch_writer() as batch:
+            for item in items:
+                batch.put_item(Item=item)
+
+    @staticmethod
+    def _batch_delete(table, keys: List[Dict[str, Any]]):
+        with table.batch_writer() as batch:
+            for key in keys:
+                batch.delete_item(Key=key)
+
+    async def _transact(self, items: List[Dict[str, Any]]) -> bool:
+        """
+        Run a TransactWriteItems call.
+        Returns False if the first item's condition failed (by convention, the ticket-exists check).
+        """
+        try:
+            await self._run(self.dynamodb.meta.client.transact_write_items, TransactItems=items)
+        except ClientError as e:
+            reasons = e.response.get("CancellationReasons", [])
+            if (e.response["Error"]["Code"] == "TransactionCanceledException"
+                    and reasons and reasons[0].get("Code") == "ConditionalCheckFailed"):
+                return False
+            raise
+        return True
+
+    def close(self):
+        """Release executor threads (server shutdown)"""
+        self._executor.shutdown(wait=True)
 
     # Ticket Operations
-    async def create_ticket(self, ticket_data: Dict[str, Any]) -> Ticket:
-        """Create a new support ticket"""
+    async def create_ticket(
+        self,
+        ticket_data: Dict[str, Any],
+        claim_route: bool = False,
+        stale_route_ticket_id: Optional[str] = None
+    ) -> Optional[Ticket]:
+        """
+        Create a new support ticket.
+        With claim_route, the sender's channel route is written in the same transaction,
+        on condition that no other ticket holds it (other than stale_route_ticket_id, a
+        ticket the route was found pointing at that no longer exists); returns None without
+        creating anything if another ticket got there first.
+        """
         ticket_id = f"tkt_{uuid.uuid4().hex[:12]}"
         timestamp = datetime.utcnow().isoformat()
 
+        messages = [
+            self._build_message_item(ticket_id, message, position)
+            for position, message in enumerate(ticket_data.get("timeline", []))
+        ]
+
         ticket = {
             "ticket_id": ticket_id,
             "created_at": timestamp,
@@ -34,85 +154,710 @@ class DynamoDBService:
             "source": ticket_data["source"],
             "customer": ticket_data["customer"],
             "subject": ticket_data["subject"],
-            "timeline": ticket_data.get("timeline", []),
+            # Timeline lives in the conversations table; the ticket only keeps a summary
+            "last_message": self._message_summary(messages[-1]) if messages else None,
+            "last_agent_message": next(
+                (self._agent_message_copy(m) for m in reversed(messages) if m["sender_type"] == SenderType.AGENT),
+                None
+            ),
+            "message_count": len(messages),
             # GSI keys for querying
             "customer_id": ticket_data["customer"]["internal_id"],
-            "status_timestamp": f"{ticket_data.get('status', 'new')}#{timestamp}"
+            "status_timestamp": self._status_timestamp(ticket_data.get("status", "new"), timestamp)
         }
 
-        self.tickets_table.put_item(Item=ticket)
-        return Ticket(**ticket)
+        # GSI key attributes cannot be NULL, so leave unassigned tickets out of AgentIndex
+        if ticket["assigned_agent_id"] is None:
+            del ticket["assigned_agent_id"]
 
-    async def get_ticket(self, ticket_id: str) -> Optional[Ticket]:
-        """Retrieve a ticket by ID"""
-        response = self.tickets_table.get_item(Key={"ticket_id": ticket_id})
-        if "Item" in response:
-            return Ticket(**response["Item"])
-        return None
+        ticket["event_seq"] = 1
+        topic_events = events.sequenced([events.ticket_created(ticket)], 1)
+
+        created = Ticket(**ticket, timeline=messages)
+        route = []
+        if claim_route:
+            route_put = {
+                "TableName": self.channel_routes_table.name,
+                "Item": self._route_item(
+                    ticket_id, self._channel_key(created.source.channel, created.customer.channel_identity)
+                ),
+                "ConditionExpression": "attribute_not_exists(channel_key)"
+            }
+            if stale_route_ticket_id:
+                route_put["ConditionExpression"] += " OR ticket_id = :stale"
+                route_put["ExpressionAttributeValues"] = {":stale": stale_route_ticket_id}
+            # First item, so a lost race is the condition _transact reports
+            route = [{"Put": route_put}]
+
+        outbox = self._outbox_puts(*topic_events)
+        if outbox or route:
+            written = await self._transact(
+                route
+                + [{"Put": {"TableName": self.tickets_table.name, "Item": ticket}}]
+                + [{"Put": {"TableName": self.conversations_table.name, "Item": m}} for m in messages]
+                + outbox
+            )
+            if not written:
+                return None
+            if not outbox:
+                await self._publish_events(topic_events)
+        else:
+            await self._run(self.tickets_table.put_item, Item=ticket)
+            if messages:
+                await self._run(self._batch_put, self.conversations_table, messages)
+            await self._publish_events(topic_events)
+
+        if not route:
+            await self._sync_channel_route(
+                ticket_id,
+                ticket["status"],
+                created.source.channel,
+                created.customer.channel_identity
+            )
+
+        self._event_seqs.set(ticket_id, 1)
+        self._adjust_cached_counts(ticket["status"], ticket.get("assigned_agent_id"), 1)
+        return created
+
+    async def get_ticket(self, ticket_id: str, consistent: bool = False) -> Optional[Ticket]:
+        """
+        Retrieve a ticket by ID, with its most recent timeline messages (read-through cached).
+        consistent skips the cache and reads strongly consistently, to return a ticket
+        that includes a write just made.
+        """
+        if not consistent:
+            cached = self.ticket_cache.get(ticket_id)
+            if cached is not None:
+                return cached
+
+        ticket = await self._load_ticket(ticket_id, consistent)
+        if ticket:
+            self.ticket_cache.set(ticket_id, ticket)
+        return ticket
+
+    async def get_ticket_status(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Status fields for chatbot polling.
+        Projects only the denormalized attributes, so no timeline is read or parsed.
+        """
+        cache_key = f"status:{ticket_id}"
+        cached = self.ticket_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        response = await self._run(self.tickets_table.get_item,
+            Key={"ticket_id": ticket_id},
+            ProjectionExpression="ticket_id, #status, updated_at, last_agent_message",
+            ExpressionAttributeNames={"#status": "status"}
+        )
+        if "Item" not in response:
+            return None
+
+        item = response["Item"]
+        status = {
+            "ticket_id": item["ticket_id"],
+            "status": TicketStatus(item["status"]),
+            "updated_at": datetime.fromisoformat(item["updated_at"]),
+            "last_agent_message": Message(**item["last_agent_message"]) if item.get("last_agent_message") else None
+        }
+        self.ticket_cache.set(cache_key, status)
+        return status
+
+    async def _batch_get(
+        self,
+        table,
+        key_name: str,
+        ids: List[str],
+        projection: Optional[str] = None,
+        names: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """Items by hash key, keyed by ID (BatchGetItem, 100 keys per call)"""
+        items: Dict[str, Dict[str, Any]] = {}
+        unique_ids = list(dict.fromkeys(ids))
+
+        for start in range(0, len(unique_ids), 100):
+            keys_and_attributes = {"Keys": [{key_name: item_id} for item_id in unique_ids[start:start + 100]]}
+            if projection:
+                keys_and_attributes["ProjectionExpression"] = projection
+            if names:
+                keys_and_attributes["ExpressionAttributeNames"] = names
+
+            request = {table.name: keys_and_attributes}
+            while request:
+                response = await self._run(self.dynamodb.batch_get_item, RequestItems=request)
+                for item in response["Responses"].get(table.name, []):
+                    items[item[key_name]] = item
+                request = response.get("UnprocessedKeys")
+
+        return items
+
+    async def get_ticket_contacts(self, ticket_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Source and customer of many tickets, keyed by ticket ID; enough to reply on their channel"""
+        return await self._batch_get(
+            self.tickets_table, "ticket_id", ticket_ids,
+            projection="ticket_id, #source, customer",
+            names={"#source": "source"}
+        )
+
+    async def get_customers(self, customer_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Customer items keyed by internal_id"""
+        return await self._batch_get(self.customers_table, "internal_id", customer_ids)
+
+    def _invalidate_ticket(self, ticket_id: str):
+        self.ticket_cache.delete(ticket_id)
+        self.ticket_cache.delete(f"status:{ticket_id}")
+
+    async def _load_ticket(self, ticket_id: str, consistent: bool = False) -> Optional[Ticket]:
+        # Ticket item and recent messages are independent reads - overlap them
+        response, recent = await asyncio.gather(
+            self._run(self.tickets_table.get_item, Key={"ticket_id": ticket_id}, ConsistentRead=consistent),
+            self.get_ticket_messages(ticket_id, limit=settings.TICKET_TIMELINE_LIMIT, consistent=consistent)
+        )
+        if "Item" not in response:
+            return None
+        return self._ticket_with_timeline(response["Item"], recent["messages"])
+
+    @staticmethod
+    def _ticket_with_timeline(item: Dict[str, Any], recent: List[Message]) -> Ticket:
+        """Ticket from its item and its most recent messages (newest first)"""
+        # Tickets written before the conversations table carry an embedded timeline
+        timeline = item.pop("timeline", []) + list(reversed(recent))
+        return Ticket(**item, timeline=timeline)
+
+    @staticmethod
+    def _status_timestamp(status, timestamp: str) -> str:
+        """GSI sort key "<status>#<timestamp>", for a status given as a string or a TicketStatus"""
+        return f"{getattr(status, 'value', status)}#{timestamp}"
+
+    @staticmethod
+    def _ticket_update_fields(updates: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
+        """Ticket attributes written by a metadata update"""
+        fields = {"updated_at": timestamp}
+
+        if "status" in updates:
+            fields["status"] = getattr(updates["status"], "value", updates["status"])
+            fields["status_timestamp"] = DynamoDBService._status_timestamp(updates["status"], timestamp)
+
+        for name in ("priority", "assigned_agent_id", "tags"):
+            if name in updates:
+                fields[name] = updates[name]
+
+        return fields
+
+    def _ticket_update_expression(
+        self,
+        updates: Dict[str, Any],
+        timestamp: str
+    ) -> Tuple[List[str], Dict[str, Any], Dict[str, str]]:
+        """SET clauses, values and names for a metadata update"""
+        update_expression_parts = []
+        expression_attribute_values = {}
+        # Every attribute goes through a name placeholder ("status" is a reserved word)
+        expression_attribute_names = {}
+
+        for name, value in self._ticket_update_fields(updates, timestamp).items():
+            update_expression_parts.append(f"#{name} = :{name}")
+            expression_attribute_values[f":{name}"] = value
+            expression_attribute_names[f"#{name}"] = name
+
+        return update_expression_parts, expression_attribute_values, expression_attribute_names
+
+    async def _publish_events(self, topic_events: List[Tuple[str, Dict[str, Any]]]):
+        """Publish directly unless the outbox already captured these events"""
+        if not settings.EVENT_OUTBOX_ENABLED:
+            await kafka_producer.publish_events(topic_events)
+
+    async def _transact_ticket_change(
+        self,
+        ticket_id: str,
+        set_parts: List[str],
+        expression_attribute_values: Dict[str, Any],
+        expression_attribute_names: Dict[str, str],
+        add_parts: List[str],
+        other_items: List[Dict[str, Any]],
+        build_events: Callable[[Dict[str, Any]], List[Tuple[str, Dict[str, Any]]]],
+        read_attributes: Optional[List[str]] = None
+    ) -> Optional[Tuple[Dict[str, Any], List[Tuple[str, Dict[str, Any]]]]]:
+        """
+        Transactionally update a ticket together with other items, assigning its
+        next event sequence numbers (and writing the events to the outbox if enabled).
+
+        Transactions can't return values, so the update is conditional on event_seq
+        being what the writer expects, and a concurrent writer causes a re-read and retry.
+        read_attributes are the ticket attributes build_events (and the caller) need from
+        before the change; None reads the whole item. With an empty list nothing but
+        event_seq is needed, and when this process wrote the ticket last its event_seq is
+        already known, so the write is a single call.
+        Returns (ticket attributes before the change, sequenced events), or None if the
+        ticket doesn't exist.
+        """
+        known_seq = self._event_seqs.get(ticket_id) if read_attributes == [] else None
+        before = {"event_seq": known_seq} if known_seq is not None else None
+
+        for _ in range(settings.EVENT_SEQ_MAX_RETRIES):
+            if before is None:
+                before = await self._read_for_change(ticket_id, read_attributes)
+                if before is None:
+                    self._event_seqs.delete(ticket_id)
+                    return None
+
+            topic_events = build_events(before)
+            current_seq = int(before.get("event_seq", 0))
+            last_seq = current_seq + len(topic_events)
+            stamped = events.sequenced(topic_events, last_seq)
+
+            values = {**expression_attribute_values, ":event_seq": last_seq}
+            if "event_seq" in before:
+                seq_condition = "event_seq = :expected_seq"
+                values[":expected_seq"] = current_seq
+            else:
+                seq_condition = "attribute_not_exists(event_seq)"
+
+            update_expression = "SET " + ", ".join(set_parts + ["event_seq = :event_seq"])
+            if add_parts:
+                update_expression += " ADD " + ", ".join(add_parts)
+
+            ticket_update = {
+                "TableName": self.tickets_table.name,
+                "Key": {"ticket_id": ticket_id},
+                "UpdateExpression": update_expression,
+                "ConditionExpression": f"attribute_exists(ticket_id) AND {seq_condition}",
+                "ExpressionAttributeValues": values
+            }
+            if expression_attribute_names:
+                ticket_update["ExpressionAttributeNames"] = expression_attribute_names
+
+            if await self._transact([{"Update": ticket_update}] + other_items + self._outbox_puts(*stamped)):
+                self._event_seqs.set(ticket_id, last_seq)
+                await self._publish_events(stamped)
+                return before, stamped
+            # Another write got in first (or the ticket was deleted) - re-read and retry
+            before = None
+
+        raise RuntimeError(f"Ticket {ticket_id} changed concurrently {settings.EVENT_SEQ_MAX_RETRIES} times")
+
+    async def _read_for_change(self, ticket_id: str, attributes: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+        """Consistent read of a ticket's event_seq and the given attributes (None: the whole item)"""
+        read_kwargs: Dict[str, Any] = {"Key": {"ticket_id": ticket_id}, "ConsistentRead": True}
+        if attributes is not None:
+            names = {f"#r{n}": name for n, name in enumerate(["ticket_id", "event_seq", *attributes])}
+            read_kwargs["ProjectionExpression"] = ", ".join(names)
+            read_kwargs["ExpressionAttributeNames"] = names
+        response = await self._run(self.tickets_table.get_item, **read_kwargs)
+        return response.get("Item")
 
     async def update_ticket(self, ticket_id: str, updates: Dict[str, Any]) -> Optional[Ticket]:
-        """Update ticket metadata"""
+        """
+        Update ticket metadata; returns the updated ticket with its most recent timeline
+        messages, which the update doesn't touch, so they are read alongside it
+        """
+        result, recent = await asyncio.gather(
+            self._update_ticket(ticket_id, updates, whole_ticket=True),
+            self.get_ticket_messages(ticket_id, limit=settings.TICKET_TIMELINE_LIMIT)
+        )
+        if not result:
+            return None
+
+        ticket, topic_events = result
+        await self._publish_events(topic_events)
+        return self._ticket_with_timeline(ticket, recent["messages"])
+
+    @staticmethod
+    def _attributes_for_update(updates: Dict[str, Any]) -> List[str]:
+        """Ticket attributes an update needs from before the change: old values, and the route's key on a status change"""
+        attributes = list(updates)
+        if "status" in updates:
+            attributes += ["source", "customer"]
+        return attributes
+
+    async def _update_ticket(
+        self,
+        ticket_id: str,
+        updates: Dict[str, Any],
+        whole_ticket: bool = False
+    ) -> Optional[Tuple[Dict[str, Any], List[Tuple[str, Dict[str, Any]]]]]:
+        """
+        Apply a metadata update; returns the ticket's attributes after it and its
+        (unpublished) sequenced events. Only the attributes the update touches (plus
+        source and customer on a status change) are read unless whole_ticket is set.
+        """
         timestamp = datetime.utcnow().isoformat()
+        update_expression_parts, expression_attribute_values, expression_attribute_names = \
+            self._ticket_update_expression(updates, timestamp)
+        changed_fields = self._ticket_update_fields(updates, timestamp)
+
+        def build_events(before: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+            return [events.ticket_updated(ticket_id, before, updates, timestamp)]
+
+        if settings.EVENT_OUTBOX_ENABLED:
+            result = await self._transact_ticket_change(
+                ticket_id,
+                update_expression_parts,
+                expression_attribute_values,
+                expression_attribute_names,
+                add_parts=[],
+                other_items=[],
+                build_events=build_events,
+                read_attributes=None if whole_ticket else self._attributes_for_update(updates)
+            )
+            if not result:
+                return None
+            before, stamped = result
+        else:
+            expression_attribute_values[":one"] = 1
+            try:
+                response = await self._run(self.tickets_table.update_item,
+                    Key={"ticket_id": ticket_id},
+                    UpdateExpression="SET " + ", ".join(update_expression_parts) + " ADD event_seq :one",
+                    ConditionExpression="attribute_exists(ticket_id)",
+                    ExpressionAttributeValues=expression_attribute_values,
+                    ExpressionAttributeNames=expression_attribute_names,
+                    # The old image gives the event its before-values; the new one is derived below
+                    ReturnValues="ALL_OLD"
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                    return None
+                raise
+            before = response["Attributes"]
+            stamped = events.sequenced(build_events(before), int(before.get("event_seq", 0)) + 1)
+            self._event_seqs.set(ticket_id, stamped[-1][1]["sequence"])
 
-        update_expression_parts = ["updated_at = :updated_at"]
-        expression_attribute_values = {":updated_at": timestamp}
+        self._invalidate_ticket(ticket_id)
+        if "status" in updates or "assigned_agent_id" in updates:
+            # Old values aren't known here, so drop rather than adjust. Only after the
+            # write: a count read in between would cache the old value for the whole TTL
+            self._invalidate_cached_counts()
+        ticket = {**before, **changed_fields, "event_seq": stamped[-1][1]["sequence"]}
 
         if "status" in updates:
-            update_expression_parts.append("status = :status")
-            update_expression_parts.append("status_timestamp = :status_timestamp")
-            expression_attribute_values[":status"] = updates["status"]
-            expression_attribute_values[":status_timestamp"] = f"{updates['status']}#{timestamp}"
+            await self._sync_channel_route(
+                ticket_id,
+                ticket["status"],
+                ticket["source"]["channel"],
+                ticket["customer"]["channel_identity"]
+            )
 
-        if "priority" in updates:
-            update_expression_parts.append("priority = :priority")
-            expression_attribute_values[":priority"] = updates["priority"]
+        return ticket, stamped
 
-        if "assigned_agent_id" in updates:
-            update_expression_parts.append("assigned_agent_id = :agent_id")
-            expression_attribute_values[":agent_id"] = updates["assigned_agent_id"]
+    async def bulk_update_tickets(
+        self,
+        ticket_ids: List[str],
+        updates: Dict[str, Any],
+        concurrency: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Apply the same metadata update to many tickets with bounded parallelism.
+        The resulting events are published as one batch.
+        Returns one {ticket_id, success, error, updated_at} result per ID, in input order.
+        """
+        semaphore = asyncio.Semaphore(concurrency or settings.BULK_UPDATE_CONCURRENCY)
+        topic_events: List[Tuple[str, Dict[str, Any]]] = []
 
-        if "tags" in updates:
-            update_expression_parts.append("tags = :tags")
-            expression_attribute_values[":tags"] = updates["tags"]
+        async def apply(ticket_id: str) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    result = await self._update_ticket(ticket_id, updates)
+                except ClientError as e:
+                    return {"ticket_id": ticket_id, "success": False, "error": e.response["Error"]["Code"]}
 
-        update_expression = "SET " + ", ".join(update_expression_parts)
+            if not result:
+                return {"ticket_id": ticket_id, "success": False, "error": "Ticket not found"}
 
-        response = self.tickets_table.update_item(
-            Key={"ticket_id": ticket_id},
-            UpdateExpression=update_expression,
-            ExpressionAttributeValues=expression_attribute_values,
-            ReturnValues="ALL_NEW"
+            ticket, ticket_events = result
+            topic_events.extend(ticket_events)
+            return {"ticket_id": ticket_id, "success": True, "updated_at": ticket["updated_at"]}
+
+        # De-duplicate while keeping the caller's order
+        results = await asyncio.gather(*(apply(ticket_id) for ticket_id in dict.fromkeys(ticket_ids)))
+        await self._publish_events(topic_events)
+        return results
+
+    async def update_ticket_with_event(
+        self,
+        ticket_id: str,
+        updates: Dict[str, Any],
+        event: Dict[str, Any]
+    ) -> Optional[Message]:
+        """
+        Apply a metadata update and append an event message in one TransactWriteItems call.
+        Used for compound agent actions (assignment, status change + event log) so they
+        can't half-apply. Returns the stored event, or None if the ticket doesn't exist.
+        """
+        timestamp = datetime.utcnow().isoformat()
+        message_item = self._build_message_item(ticket_id, {"timestamp": timestamp, **event})
+
+        update_expression_parts, expression_attribute_values, expression_attribute_names = \
+            self._ticket_update_expression(updates, timestamp)
+        self._add_message_summary([message_item], update_expression_parts, expression_attribute_values)
+        expression_attribute_values[":one"] = 1
+
+        result = await self._transact_ticket_change(
+            ticket_id,
+            update_expression_parts,
+            expression_attribute_values,
+            expression_attribute_names,
+            add_parts=["message_count :one"],
+            other_items=[{"Put": {"TableName": self.conversations_table.name, "Item": message_item}}],
+            build_events=lambda before: [
+                events.ticket_updated(ticket_id, before, updates, timestamp),
+                events.message_added(ticket_id, message_item)
+            ],
+            read_attributes=self._attributes_for_update(updates)
         )
+        if not result:
+            return None
+
+        self._invalidate_ticket(ticket_id)
+        if "status" in updates or "assigned_agent_id" in updates:
+            self._invalidate_cached_counts()
 
-        if "Attributes" in response:
-            return Ticket(**response["Attributes"])
+        if "status" in updates:
+            before, _ = result
+            await self._sync_channel_route(
+                ticket_id,
+                updates["status"],
+                before["source"]["channel"],
+                before["customer"]["channel_identity"]
+            )
+
+        return Message(**message_item)
+
+    # Channel routing: (channel, channel_identity) -> active ticket
+    @staticmethod
+    def _channel_key(channel: str, channel_identity: str) -> str:
+        return f"{getattr(channel, 'value', channel)}#{channel_identity}"
+
+    @staticmethod
+    def _route_item(ticket_id: str, channel_key: str) -> Dict[str, Any]:
+        return {"channel_key": channel_key, "ticket_id": ticket_id, "updated_at": datetime.utcnow().isoformat()}
+
+    async def find_active_ticket_id(self, channel: str, channel_identity: str) -> Optional[str]:
+        """ID of the active (new/open/pending_customer) ticket for a sender, via a single key read"""
+        response = await self._run(self.channel_routes_table.get_item,
+            Key={"channel_key": self._channel_key(channel, channel_identity)},
+            ConsistentRead=True
+        )
+        if "Item" in response:
+            return response["Item"]["ticket_id"]
         return None
 
-    async def add_message_to_ticket(self, ticket_id: str, message: Dict[str, Any]) -> Optional[Ticket]:
-        """Append a message to the ticket timeline"""
-        message_id = f"msg_{uuid.uuid4().hex[:12]}"
-        timestamp = datetime.utcnow().isoformat()
+    async def _sync_channel_route(self, ticket_id: str, status: str, channel: str, channel_identity: str):
+        """Point the sender's route at this ticket while it's active, drop it once it isn't"""
+        channel_key = self._channel_key(channel, channel_identity)
 
-        message_item = {
-            "message_id": message_id,
-            "timestamp": timestamp,
-            **message
+        if getattr(status, "value", status) in self.ACTIVE_STATUSES:
+            await self._run(self.channel_routes_table.put_item, Item=self._route_item(ticket_id, channel_key))
+            return
+
+        try:
+            # Only remove the route if a newer ticket hasn't taken it over
+            await self._run(self.channel_routes_table.delete_item,
+                Key={"channel_key": channel_key},
+                ConditionExpression="ticket_id = :ticket_id",
+                ExpressionAttributeValues={":ticket_id": ticket_id}
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+    async def add_message_to_ticket(self, ticket_id: str, message: Dict[str, Any]) -> Optional[Message]:
+        """
+        Append a message to the ticket timeline.
+        Writes one conversations item and bumps the ticket summary, so the cost
+        doesn't grow with the length of the conversation.
+        Returns None if the ticket doesn't exist.
+        """
+        added = await self.add_messages_to_ticket(ticket_id, [message])
+        return added[0] if added is not None else None
+
+    async def add_messages_to_ticket(self, ticket_id: str, messages: List[Dict[str, Any]]) -> Optional[List[Message]]:
+        """
+        Append messages (oldest first) to the ticket timeline with a single ticket update
+        and one event: message.added for one message, message.batch_added for several.
+        Each message keeps its own ID and timestamp. The ticket summary is only updated
+        once the messages are written (in the same transaction with the outbox).
+        Returns None if the ticket doesn't exist.
+        """
+        message_items = [
+            self._build_message_item(ticket_id, message, position) for position, message in enumerate(messages)
+        ]
+
+        set_parts = ["updated_at = :updated_at"]
+        expression_attribute_values = {":updated_at": datetime.utcnow().isoformat(), ":count": len(message_items)}
+        self._add_message_summary(message_items, set_parts, expression_attribute_values)
+
+        if len(message_items) == 1:
+            topic_events = [events.message_added(ticket_id, message_items[0])]
+        else:
+            topic_events = [events.messages_added(ticket_id, message_items)]
+
+        if settings.EVENT_OUTBOX_ENABLED:
+            result = await self._transact_ticket_change(
+                ticket_id,
+                set_parts,
+                expression_attribute_values,
+                {},
+                add_parts=["message_count :count"],
+                other_items=[
+                    {"Put": {"TableName": self.conversations_table.name, "Item": item}} for item in message_items
+                ],
+                build_events=lambda before: topic_events,
+                read_attributes=[]
+            )
+            if not result:
+                return None
+        else:
+            # Messages first, so the ticket summary never points at messages not yet written
+            if len(message_items) == 1:
+                await self._run(self.conversations_table.put_item, Item=message_items[0])
+            else:
+                await self._run(self._batch_put, self.conversations_table, message_items)
+            try:
+                response = await self._run(self.tickets_table.update_item,
+                    Key={"ticket_id": ticket_id},
+                    UpdateExpression="SET " + ", ".join(set_parts) + " ADD message_count :count, event_seq :one",
+                    ConditionExpression="attribute_exists(ticket_id)",
+                    ExpressionAttributeValues={**expression_attribute_values, ":one": 1},
+                    ReturnValues="UPDATED_NEW"
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                    await self._run(self._batch_delete, self.conversations_table, [
+                        {"ticket_id": ticket_id, "message_id": item["message_id"]} for item in message_items
+                    ])
+                    return None
+                raise
+            self._event_seqs.set(ticket_id, int(response["Attributes"]["event_seq"]))
+            await self._publish_events(events.sequenced(topic_events, int(response["Attributes"]["event_seq"])))
+
+        self._invalidate_ticket(ticket_id)
+        return [Message(**item) for item in message_items]
+
+    async def get_ticket_messages(
+        self,
+        ticket_id: str,
+        limit: int = 50,
+        last_evaluated_key: Optional[Dict] = None,
+        newest_first: bool = True,
+        consistent: bool = False
+    ) -> Dict[str, Any]:
+        """Page through a ticket's messages in the conversations table"""
+        query_kwargs = {
+            "KeyConditionExpression": Key("ticket_id").eq(ticket_id),
+            "ScanIndexForward": not newest_first,
+            "Limit": limit,
+            "ConsistentRead": consistent
         }
+        if last_evaluated_key:
+            query_kwargs["ExclusiveStartKey"] = last_evaluated_key
 
-        response = self.tickets_table.update_item(
-            Key={"ticket_id": ticket_id},
-            UpdateExpression="SET timeline = list_append(if_not_exists(timeline, :empty_list), :message), updated_at = :updated_at",
-            ExpressionAttributeValues={
-                ":message": [message_item],
-                ":empty_list": [],
-                ":updated_at": timestamp
-            },
-            ReturnValues="ALL_NEW"
+        response = await self._run(self.conversations_table.query, **query_kwargs)
+
+        return {
+            "messages": [Message(**item) for item in response.get("Items", [])],
+            "last_evaluated_key": response.get("LastEvaluatedKey")
+        }
+
+    async def get_ticket_message(self, ticket_id: str, message_id: str) -> Optional[Message]:
+        response = await self._run(self.conversations_table.get_item,
+            Key={"ticket_id": ticket_id, "message_id": message_id}
         )
+        if "Item" not in response:
+            return None
+        return Message(**response["Item"])
 
-        if "Attributes" in response:
-            return Ticket(**response["Attributes"])
-        return None
+    @classmethod
+    def _new_message_id(cls, timestamp: datetime, position: int = 0) -> str:
+        """
+        Message IDs sort by creation time: millisecond epoch (hex), position within the
+        write (keeps messages written together in order when they share a millisecond),
+        random suffix. Both numbers are fixed-width so the IDs compare as strings.
+        """
+        if position > cls.MESSAGE_POSITION_MAX:
+            raise ValueError(f"At most {cls.MESSAGE_POSITION_MAX + 1} messages can be written at once")
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        millis = int(timestamp.timestamp() * 1000)
+        return f"msg_{millis:012x}{position:04x}{uuid.uuid4().hex[:6]}"
+
+    def _build_message_item(self, ticket_id: str, message: Dict[str, Any], position: int = 0) -> Dict[str, Any]:
+        """Conversations table item for a message, keeping any caller-supplied ID/timestamp"""
+        timestamp = message.get("timestamp") or datetime.utcnow().isoformat()
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.isoformat()
+
+        message_id = message.get("message_id") or self._new_message_id(datetime.fromisoformat(timestamp), position)
+
+        return {
+            **message,
+            "ticket_id": ticket_id,
+            "message_id": message_id,
+            "timestamp": timestamp
+        }
+
+    def _add_message_summary(
+        self,
+        message_items: List[Dict[str, Any]],
+        set_parts: List[str],
+        expression_attribute_values: Dict[str, Any]
+    ):
+        """Extend a ticket update with the summary fields for newly appended messages (oldest first)"""
+        set_parts.append("last_message = :last_message")
+        expression_attribute_values[":last_message"] = self._message_summary(message_items[-1])
+
+        agent_message = next((m for m in reversed(message_items) if m["sender_type"] == SenderType.AGENT), None)
+        if agent_message is not None:
+            # Denormalized for the chatbot status poll
+            set_parts.append("last_agent_message = :last_agent_message")
+            expression_attribute_values[":last_agent_message"] = self._agent_message_copy(agent_message)
+
+    @staticmethod
+    def _agent_message_copy(message_item: Dict[str, Any]) -> Dict[str, Any]:
+        """Full agent reply (chatbots relay it verbatim), minus the table key"""
+        return {k: v for k, v in message_item.items() if k != "ticket_id"}
+
+    def _message_summary(self, message_item: Dict[str, Any]) -> Dict[str, Any]:
+        """Small copy of a message for the ticket item's last_message field"""
+        return {
+            "message_id": message_item["message_id"],
+            "timestamp": message_item["timestamp"],
+            "sender_type": message_item["sender_type"],
+            "content": message_item.get("content", "")[:self.MESSAGE_PREVIEW_LENGTH],
+            "content_type": message_item.get("content_type", "text"),
+            "visibility": message_item.get("visibility", "public")
+        }
+
+    def _plan_ticket_query(
+        self,
+        status: Optional[str] = None,
+        assigned_agent_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Pick the cheapest access path for the requested filters.
+        Returns query/scan kwargs (without Limit or ExclusiveStartKey).
+        """
+        if assigned_agent_id:
+            # AgentIndex: assigned_agent_id (HASH), status_timestamp (RANGE)
+            key_condition = Key("assigned_agent_id").eq(assigned_agent_id)
+            if status:
+                key_condition = key_condition & Key("status_timestamp").begins_with(self._status_timestamp(status, ""))
+            return {
+                "IndexName": self.AGENT_INDEX,
+                "KeyConditionExpression": key_condition,
+                "ScanIndexForward": False  # Most recent first
+            }
+
+        if status:
+            # StatusIndex: status (HASH), status_timestamp (RANGE)
+            return {
+                "IndexName": self.STATUS_INDEX,
+                "KeyConditionExpression": Key("status").eq(getattr(status, "value", status)),
+                "ScanIndexForward": False  # Most recent first
+            }
+
+        # No selective filter - full table scan is the only option
+        return {}
 
     async def list_tickets(
         self,
@@ -121,33 +866,519 @@ class DynamoDBService:
         limit: int = 50,
         last_evaluated_key: Optional[Dict] = None
     ) -> Dict[str, Any]:
-        """List tickets with optional filters"""
-        scan_kwargs = {"Limit": limit}
+        """List tickets with optional filters, using a GSI query where possible"""
+        query_kwargs = self._plan_ticket_query(status, assigned_agent_id)
+        query_kwargs["Limit"] = limit
 
         if last_evaluated_key:
-            scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
-
-        filter_expressions = []
-        if status:
-            filter_expressions.append(Attr("status").eq(status))
-        if assigned_agent_id:
-            filter_expressions.append(Attr("assigned_agent_id").eq(assigned_agent_id))
+            query_kwargs["ExclusiveStartKey"] = last_evaluated_key
 
-        if filter_expressions:
-            combined_filter = filter_expressions[0]
-            for expr in filter_expressions[1:]:
-                combined_filter = combined_filter & expr
-            scan_kwargs["FilterExpression"] = combined_filter
-
-        response = self.tickets_table.scan(**scan_kwargs)
+        if "IndexName" in query_kwargs:
+            response = await self._run(self.tickets_table.query, **query_kwargs)
+        else:
+            response = await self._run(self.tickets_table.scan, **query_kwargs)
 
         return {
             "tickets": [Ticket(**item) for item in response.get("Items", [])],
             "last_evaluated_key": response.get("LastEvaluatedKey"),
-            "count": response.get("Count", 0)
+            "count": response.get("Count", 0),
+            "index": query_kwargs.get("IndexName")
+        }
+
+    async def count_tickets(
+        self,
+        status: Optional[str] = None,
+        assigned_agent_id: Optional[str] = None
+    ) -> int:
+        """
+        Total number of tickets matching the filters.
+        Served from a short-lived per-filter cache that create_ticket keeps up to date.
+        Unfiltered, it is DynamoDB's item count for the table, which is refreshed about
+        every six hours: approximate, but counting exactly would scan every ticket.
+        """
+        cache_key = (status, assigned_agent_id)
+        cached = self._count_cache.get(cache_key)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        query_kwargs = self._plan_ticket_query(status, assigned_agent_id)
+        if "IndexName" in query_kwargs:
+            query_kwargs["Select"] = "COUNT"
+            total = 0
+            while True:
+                response = await self._run(self.tickets_table.query, **query_kwargs)
+                total += response.get("Count", 0)
+                if "LastEvaluatedKey" not in response:
+                    break
+                query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        else:
+            response = await self._run(self.dynamodb.meta.client.describe_table, TableName=self.tickets_table.name)
+            total = int(response["Table"]["ItemCount"])
+
+        self._count_cache[cache_key] = (
+            total,
+            time.monotonic() + settings.TICKET_COUNT_CACHE_TTL_SECONDS
+        )
+        return total
+
+    def _adjust_cached_counts(self, status: str, assigned_agent_id: Optional[str], delta: int):
+        """Apply a known change to every cached count whose filters match"""
+        for key, (count, expires_at) in list(self._count_cache.items()):
+            key_status, key_agent = key
+            if key_status not in (None, status):
+                continue
+            if key_agent is not None and key_agent != assigned_agent_id:
+                continue
+            self._count_cache[key] = (count + delta, expires_at)
+
+    def _invalidate_cached_counts(self):
+        self._count_cache.clear()
+
+    async def backfill_ticket_index_keys(self, page_size: int = 500) -> Dict[str, int]:
+        """
+        One-off fix for tickets written before StatusIndex/AgentIndex: removes a NULL
+        assigned_agent_id (not a valid AgentIndex key) and rewrites a status_timestamp
+        that doesn't start with "<status>#" (older code could write the enum's name),
+        keeping its timestamp. Each item is updated on condition that its status and
+        assignment haven't changed since it was scanned; an item a live write got to
+        first already has valid keys. Safe to run again.
+        Returns {scanned, updated, skipped}.
+        """
+        counts = {"scanned": 0, "updated": 0, "skipped": 0}
+        scan_kwargs = {
+            "ProjectionExpression": "ticket_id, #status, status_timestamp, assigned_agent_id, created_at",
+            "ExpressionAttributeNames": {"#status": "status"},
+            "Limit": page_size
+        }
+
+        while True:
+            response = await self._run(self.tickets_table.scan, **scan_kwargs)
+            for item in response.get("Items", []):
+                counts["scanned"] += 1
+                update = self._index_key_fix(item)
+                if update is None:
+                    continue
+                try:
+                    await self._run(self.tickets_table.update_item, Key={"ticket_id": item["ticket_id"]}, **update)
+                    counts["updated"] += 1
+                except ClientError as e:
+                    if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                        raise
+                    counts["skipped"] += 1
+
+            if "LastEvaluatedKey" not in response:
+                return counts
+            scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    @classmethod
+    def _index_key_fix(cls, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """update_item arguments that give a scanned ticket valid index keys, or None"""
+        set_parts, remove_parts = [], []
+        status_timestamp = item.get("status_timestamp") or ""
+        conditions = ["#status = :status"]
+        values = {":status": item["status"]}
+        if "status_timestamp" in item:
+            conditions.append("status_timestamp = :scanned_status_timestamp")
+            values[":scanned_status_timestamp"] = item["status_timestamp"]
+        else:
+            conditions.append("attribute_not_exists(status_timestamp)")
+
+        if "assigned_agent_id" in item and item["assigned_agent_id"] is None:
+            remove_parts.append("assigned_agent_id")
+            conditions.append("attribute_type(assigned_agent_id, :null)")
+            values[":null"] = "NULL"
+
+        if not status_timestamp.startswith(cls._status_timestamp(item["status"], "")):
+            # Keep the original time so the ticket's position in the index doesn't move
+            _, _, timestamp = status_timestamp.rpartition("#")
+            set_parts.append("status_timestamp = :status_timestamp")
+            values[":status_timestamp"] = cls._status_timestamp(item["status"], timestamp or item["created_at"])
+
+        if not set_parts and not remove_parts:
+            return None
+
+        update_expression = " ".join(
+            f"{action} {', '.join(parts)}" for action, parts in (("SET", set_parts), ("REMOVE", remove_parts)) if parts
+        )
+        return {
+            "UpdateExpression": update_expression,
+            "ConditionExpression": " AND ".join(conditions),
+            "ExpressionAttributeNames": {"#status": "status"},
+            "ExpressionAttributeValues": values
+        }
+
+    # Outbox Operations
+    @staticmethod
+    def _outbox_shard(ticket_id: str) -> str:
+        """Stable shard per ticket, so one relay query sees a ticket's events in order"""
+        return f"shard#{zlib.crc32(ticket_id.encode('utf-8')) % settings.EVENT_OUTBOX_SHARDS}"
+
+    def outbox_shards(self) -> List[str]:
+        return [f"shard#{n}" for n in range(settings.EVENT_OUTBOX_SHARDS)]
+
+    @staticmethod
+    def _dead_letter_shard(shard: str) -> str:
+        """Partition holding a shard's dead-lettered events, which the relay doesn't read"""
+        return f"dead#{shard}"
+
+    def _outbox_puts(self, *topic_events: Tuple[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Transaction items that record events in the outbox; empty when the outbox is disabled"""
+        if not settings.EVENT_OUTBOX_ENABLED:
+            return []
+
+        now = datetime.now(timezone.utc).isoformat()
+        return [
+            {"Put": {"TableName": self.outbox_table.name, "Item": {
+                "shard": self._outbox_shard(event["ticket_id"]),
+                # Sort key: the ticket's event sequence, so its events are relayed in the order
+                # they were committed whatever the writers' clocks say
+                "event_id": f"{event['ticket_id']}#{event['sequence']:012d}",
+                "topic": topic,
+                "event": event,
+                "created_at": now
+            }}}
+            for topic, event in topic_events
+        ]
+
+    async def read_outbox(self, shard: str, limit: int, after_ticket_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Pending events in a shard, each ticket's in sequence order; after_ticket_id skips past that ticket's events"""
+        query_kwargs = {
+            "KeyConditionExpression": Key("shard").eq(shard),
+            "ConsistentRead": True,
+            "Limit": limit
+        }
+        if after_ticket_id is not None:
+            # "~" sorts after the zero-padded sequences and "#" before any longer ticket ID
+            query_kwargs["ExclusiveStartKey"] = {"shard": shard, "event_id": f"{after_ticket_id}#~"}
+        response = await self._run(self.outbox_table.query, **query_kwargs)
+        return response.get("Items", [])
+
+    async def delete_outbox(self, items: List[Dict[str, Any]]):
+        """Remove relayed events"""
+        def delete_all():
+            with self.outbox_table.batch_writer() as batch:
+                for item in items:
+                    batch.delete_item(Key={"shard": item["shard"], "event_id": item["event_id"]})
+
+        await self._run(delete_all)
+
+    async def record_outbox_failure(self, item: Dict[str, Any]) -> int:
+        """Count a failed publish of an outbox event; returns its attempts so far"""
+        response = await self._run(self.outbox_table.update_item,
+            Key={"shard": item["shard"], "event_id": item["event_id"]},
+            UpdateExpression="ADD attempts :one",
+            ExpressionAttributeValues={":one": 1},
+            ReturnValues="UPDATED_NEW"
+        )
+        return int(response["Attributes"]["attempts"])
+
+    async def dead_letter_outbox(self, item: Dict[str, Any], error: str):
+        """Move an event the broker keeps rejecting out of its shard, so the ticket's later events can go"""
+        await self._transact([
+            {"Put": {"TableName": self.outbox_table.name, "Item": {
+                **item,
+                "shard": self._dead_letter_shard(item["shard"]),
+                "last_error": error,
+                "dead_lettered_at": datetime.now(timezone.utc).isoformat()
+            }}},
+            {"Delete": {"TableName": self.outbox_table.name, "Key": {"shard": item["shard"], "event_id": item["event_id"]}}}
+        ])
+
+    async def read_outbox_dead_letters(self, limit: int) -> List[Dict[str, Any]]:
+        items: List[Dict[str, Any]] = []
+        for shard in self.outbox_shards():
+            if len(items) >= limit:
+                break
+            response = await self._run(self.outbox_table.query,
+                KeyConditionExpression=Key("shard").eq(self._dead_letter_shard(shard)),
+                Limit=limit - len(items)
+            )
+            items.extend(response.get("Items", []))
+        return items
+
+    async def replay_outbox_dead_letter(self, item: Dict[str, Any]):
+        """Put a dead-lettered event back in its shard with a fresh attempt count"""
+        shard = item["shard"].split("#", 1)[1]
+        replayed = {k: v for k, v in item.items() if k not in ("attempts", "last_error", "dead_lettered_at")}
+        await self._transact([
+            {"Put": {"TableName": self.outbox_table.name, "Item": {**replayed, "shard": shard}}},
+            {"Delete": {"TableName": self.outbox_table.name, "Key": {"shard": item["shard"], "event_id": item["event_id"]}}}
+        ])
+
+    async def _count_outbox(self, shard: str, cap: int) -> int:
+        response = await self._run(self.outbox_table.query,
+            KeyConditionExpression=Key("shard").eq(shard),
+            Select="COUNT",
+            Limit=cap
+        )
+        return response["Count"]
+
+    async def outbox_backlog(self, shard: str, cap: int) -> Tuple[int, int, Optional[str]]:
+        """
+        Pending events in a shard and its dead letters, each counted up to cap, and the
+        created_at of the event at the head of the shard (the next the relay publishes).
+        Events are keyed by ticket, not time, so the head is not necessarily the oldest;
+        a head that keeps getting older means the relay is stuck or behind.
+        """
+        response = await self._run(self.outbox_table.query,
+            KeyConditionExpression=Key("shard").eq(shard),
+            ProjectionExpression="created_at",
+            Limit=1
+        )
+        head = response.get("Items", [])
+        pending = await self._count_outbox(shard, cap) if head else 0
+        dead_letters = await self._count_outbox(self._dead_letter_shard(shard), cap)
+        return pending, dead_letters, head[0]["created_at"] if head else None
+
+    # Inbox Read Model Operations
+    async def get_inbox_items(self, keys: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+        """Inbox rows by (inbox_id, ticket_id), keyed by ticket_id (BatchGetItem, 100 keys per call)"""
+        items: Dict[str, Dict[str, Any]] = {}
+        table_name = self.inbox_table.name
+
+        for start in range(0, len(keys), 100):
+            request = {table_name: {
+                "Keys": [{"inbox_id": inbox_id, "ticket_id": ticket_id} for inbox_id, ticket_id in keys[start:start + 100]],
+                "ConsistentRead": True
+            }}
+            while request:
+                response = await self._run(self.dynamodb.batch_get_item, RequestItems=request)
+                for item in response["Responses"].get(table_name, []):
+                    items[item["ticket_id"]] = item
+                request = response.get("UnprocessedKeys")
+
+        return items
+
+    async def write_inbox(self, puts: List[Dict[str, Any]], deletes: List[Tuple[str, str]]):
+        """Apply a batch of read model changes; deletes are (inbox_id, ticket_id)"""
+        def write_all():
+            with self.inbox_table.batch_writer(overwrite_by_pkeys=["inbox_id", "ticket_id"]) as batch:
+                for inbox_id, ticket_id in deletes:
+                    batch.delete_item(Key={"inbox_id": inbox_id, "ticket_id": ticket_id})
+                for item in puts:
+                    batch.put_item(Item=item)
+
+        await self._run(write_all)
+
+    async def list_inbox(
+        self,
+        inbox_id: str,
+        limit: int = 50,
+        last_evaluated_key: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """One page of an inbox, most recently updated first"""
+        query_kwargs = {
+            "IndexName": self.INBOX_UPDATED_INDEX,
+            "KeyConditionExpression": Key("inbox_id").eq(inbox_id),
+            "ScanIndexForward": False,
+            "Limit": limit
+        }
+        if last_evaluated_key:
+            query_kwargs["ExclusiveStartKey"] = last_evaluated_key
+
+        response = await self._run(self.inbox_table.query, **query_kwargs)
+        return {
+            "entries": response.get("Items", []),
+            "last_evaluated_key": response.get("LastEvaluatedKey")
         }
 
+    # Delivery Queue Operations
+    @staticmethod
+    def _delivery_shard(channel: str, ticket_id: str) -> str:
+        """Queues are per channel, so a throttled channel never holds up the others"""
+        return f"{channel}#{zlib.crc32(ticket_id.encode('utf-8')) % settings.DELIVERY_QUEUE_SHARDS}"
+
+    def delivery_shards(self, channel: str) -> List[str]:
+        return [f"{channel}#{n}" for n in range(settings.DELIVERY_QUEUE_SHARDS)]
+
+    async def put_delivery(self, delivery: Dict[str, Any]) -> bool:
+        """Queue a new delivery; False if the message already has one"""
+        item = {**delivery, "queue_shard": self._delivery_shard(delivery["channel"], delivery["ticket_id"])}
+        try:
+            await self._run(self.deliveries_table.put_item,
+                Item=item,
+                ConditionExpression="attribute_not_exists(message_id)"
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    async def read_due_deliveries(self, shard: str, now: str, limit: int) -> List[Dict[str, Any]]:
+        """Queued deliveries in a shard that are due by now, oldest first"""
+        response = await self._run(self.deliveries_table.query,
+            IndexName=self.DELIVERY_DUE_INDEX,
+            KeyConditionExpression=Key("queue_shard").eq(shard) & Key("due_at").lte(now),
+            Limit=limit
+        )
+        return response.get("Items", [])
+
+    async def update_delivery(
+        self,
+        ticket_id: str,
+        message_id: str,
+        expected_due_at: str,
+        fields: Dict[str, Any],
+        dequeue: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Update a queued delivery, but only if its due_at is still expected_due_at, i.e. no
+        other worker has claimed or finished it since it was read. dequeue drops it from
+        DueIndex once it is delivered or has failed for good.
+        Returns the updated item, or None if the delivery moved on.
+        """
+        values = {":expected_due_at": expected_due_at}
+        names = {}
+        set_parts = []
+        for field, value in fields.items():
+            names[f"#{field}"] = field
+            values[f":{field}"] = value
+            set_parts.append(f"#{field} = :{field}")
+
+        update_expression = "SET " + ", ".join(set_parts)
+        if dequeue:
+            update_expression += " REMOVE queue_shard"
+
+        try:
+            response = await self._run(self.deliveries_table.update_item,
+                Key={"ticket_id": ticket_id, "message_id": message_id},
+                UpdateExpression=update_expression,
+                ConditionExpression="attribute_exists(queue_shard) AND due_at = :expected_due_at",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+                ReturnValues="ALL_NEW"
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return None
+            raise
+        return response["Attributes"]
+
+    async def list_deliveries(self, ticket_id: str) -> List[Dict[str, Any]]:
+        """Delivery records for a ticket's outbound messages, oldest first"""
+        query_kwargs = {"KeyConditionExpression": Key("ticket_id").eq(ticket_id)}
+        items = []
+        while True:
+            response = await self._run(self.deliveries_table.query, **query_kwargs)
+            items.extend(response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                return items
+            query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    async def count_queued_deliveries(self, shard: str) -> int:
+        query_kwargs = {
+            "IndexName": self.DELIVERY_DUE_INDEX,
+            "KeyConditionExpression": Key("queue_shard").eq(shard),
+            "Select": "COUNT"
+        }
+        total = 0
+        while True:
+            response = await self._run(self.deliveries_table.query, **query_kwargs)
+            total += response.get("Count", 0)
+            if "LastEvaluatedKey" not in response:
+                return total
+            query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    # Webhook Receipt Operations (inbound de-duplication by platform message ID)
+    async def claim_webhook_receipt(self, receipt_key: str, lease_seconds: float, ttl_seconds: int) -> str:
+        """
+        Claim an inbound platform message for processing with a conditional put.
+        Returns "claimed" if the message is new, or an earlier claim's lease ran out before
+        it completed; otherwise the current receipt's status: "processed", or "processing"
+        while another worker holds an unexpired lease.
+        """
+        now = int(time.time())
+        try:
+            await self._run(self.webhook_receipts_table.put_item,
+                Item={
+                    "receipt_key": receipt_key,
+                    "status": "processing",
+                    "lease_until": now + int(lease_seconds),
+                    "expires_at": now + ttl_seconds  # DynamoDB TTL attribute
+                },
+                ConditionExpression="attribute_not_exists(receipt_key) OR (#status = :processing AND lease_until < :now)",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={":processing": "processing", ":now": now}
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            response = await self._run(self.webhook_receipts_table.get_item,
+                Key={"receipt_key": receipt_key},
+                ConsistentRead=True
+            )
+            # Released in between: report it as held, the retry will claim it
+            return response.get("Item", {}).get("status", "processing")
+        return "claimed"
+
+    async def complete_webhook_receipt(self, receipt_key: str, ticket_id: str):
+        await self._run(self.webhook_receipts_table.update_item,
+            Key={"receipt_key": receipt_key},
+            UpdateExpression="SET #status = :processed, ticket_id = :ticket_id, processed_at = :processed_at REMOVE lease_until",
+            ExpressionAttributeNames={"#status": "status"},
+            ExpressionAttributeValues={
+                ":processed": "processed",
+                ":ticket_id": ticket_id,
+                ":processed_at": datetime.utcnow().isoformat()
+            }
+        )
+
+    async def release_webhook_receipt(self, receipt_key: str):
+        """Drop an unfinished claim so a redelivery can process the message straight away"""
+        try:
+            await self._run(self.webhook_receipts_table.delete_item,
+                Key={"receipt_key": receipt_key},
+                ConditionExpression="#status = :processing",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={":processing": "processing"}
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+    # Email Thread Operations (email Message-ID -> ticket, for threading replies)
+    async def find_email_thread(self, message_ids: List[str], customer_id: str) -> Optional[str]:
+        """
+        Ticket of the first of these Message-IDs that is known (pass the most specific
+        first: In-Reply-To, then References newest to oldest), via one BatchGetItem.
+        None if that ticket is no longer active, so a reply to a resolved or closed
+        ticket opens a new one, as a new message on any other channel does. None too if
+        the ticket belongs to another customer: Message-IDs travel in every copy of an
+        email, so knowing one doesn't make the sender part of the conversation.
+        """
+        if not message_ids:
+            return None
+        threads = await self._batch_get(self.email_threads_table, "message_id", message_ids)
+        ticket_id = next((threads[m]["ticket_id"] for m in message_ids if m in threads), None)
+        if ticket_id is None:
+            return None
+
+        # Not the cached status: agents close tickets through the API, in another process
+        response = await self._run(self.tickets_table.get_item,
+            Key={"ticket_id": ticket_id},
+            ProjectionExpression="#status, customer_id",
+            ExpressionAttributeNames={"#status": "status"},
+            ConsistentRead=True
+        )
+        item = response.get("Item", {})
+        if item.get("status") not in self.ACTIVE_STATUSES or item.get("customer_id") != customer_id:
+            return None
+        return ticket_id
+
+    async def put_email_thread(self, message_id: str, ticket_id: str):
+        await self._run(self.email_threads_table.put_item, Item={
+            "message_id": message_id,
+            "ticket_id": ticket_id,
+            "created_at": datetime.utcnow().isoformat()
+        })
+
     # Customer Operations
+    @staticmethod
+    def _customer_id_for(channel_identity: str) -> str:
+        """Deterministic customer ID, so concurrent creates for one sender collide on the key"""
+        return f"cust_{hashlib.sha256(channel_identity.encode('utf-8')).hexdigest()[:16]}"
+
     async def get_or_create_customer(
         self,
         channel_identity: str,
@@ -155,18 +1386,34 @@ class DynamoDBService:
         name: Optional[str] = None,
         primary_email: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Get existing customer or create new one"""
-        # Try to find existing customer by channel_identity
-        response = self.customers_table.query(
+        """
+        Get existing customer or create new one.
+        Idempotent under concurrent webhook bursts: creation is a conditional put on
+        a key derived from channel_identity, and the loser reads the winner's item.
+        """
+        cached = self.customer_cache.get(channel_identity)
+        if cached is not None:
+            return cached
+
+        customer_id = self._customer_id_for(channel_identity)
+        response = await self._run(self.customers_table.get_item,
+            Key={"internal_id": customer_id},
+            ConsistentRead=True
+        )
+        if "Item" in response:
+            self.customer_cache.set(channel_identity, response["Item"])
+            return response["Item"]
+
+        # Customers created before deterministic IDs are only reachable through the GSI
+        response = await self._run(self.customers_table.query,
             IndexName="ChannelIdentityIndex",
             KeyConditionExpression=Key("channel_identity").eq(channel_identity)
         )
-
         if response["Items"]:
+            self.customer_cache.set(channel_identity, response["Items"][0])
             return response["Items"][0]
 
         # Create new customer
-        customer_id = f"cust_{uuid.uuid4().hex[:8]}"
         customer = {
             "internal_id": customer_id,
             "channel_identity": channel_identity,
@@ -176,13 +1423,28 @@ class DynamoDBService:
             "created_at": datetime.utcnow().isoformat()
         }
 
-        self.customers_table.put_item(Item=customer)
+        try:
+            await self._run(self.customers_table.put_item,
+                Item=customer,
+                ConditionExpression="attribute_not_exists(internal_id)"
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            # A concurrent request created this customer first
+            response = await self._run(self.customers_table.get_item,
+                Key={"internal_id": customer_id},
+                ConsistentRead=True
+            )
+            customer = response["Item"]
+
+        self.customer_cache.set(channel_identity, customer)
         return customer
 
     async def get_customer_tickets(self, customer_id: str, limit: int = 20) -> List[Ticket]:
         """Get all tickets for a specific customer"""
-        response = self.tickets_table.query(
-            IndexName="CustomerIndex",
+        response = await self._run(self.tickets_table.query,
+            IndexName=self.CUSTOMER_INDEX,
             KeyConditionExpression=Key("customer_id").eq(customer_id),
             Limit=limit,
             ScanIndexForward=False  # Most recent first
@@ -0,0 +1,160 @@
+"""
+Event wire encodings
+JSON (default) or a compact, schema-versioned binary form selected by
+KAFKA_EVENT_ENCODING. decode() accepts either, so consumers keep working while
+producers switch over.
+
+Binary layout: MAGIC, schema version byte, then one tagged value (the event map).
+Map keys found in that version's field table are written as a small integer
+instead of the name; anything else falls back to an inline string.
+"""
+
+import json
+import struct
+from typing import Any, Dict, Tuple
+
+from app.config import settings
+from app.services.events import SCHEMA_VERSION
+
+MAGIC = 0xE7
+
+# Field tables per schema version. Only ever append to a table; a removed or
+# reordered field needs a new version so old payloads still decode.
+FIELDS = {
+    2: (
+        "event_type", "ticket_id", "timestamp", "sequence", "schema_version",
+        "customer_id", "status", "priority", "source",
+        "message_id", "sender_type",
+        "changes", "old", "new", "assigned_agent_id", "tags", "updated_at",
+        "subject", "message_count",
+    ),
+}
+_FIELD_IDS = {version: {name: i for i, name in enumerate(names)} for version, names in FIELDS.items()}
+
+_NONE, _TRUE, _FALSE, _INT, _FLOAT, _STR, _LIST, _MAP = range(8)
+
+
+def _write_varint(out: bytearray, n: int):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _write_str(out: bytearray, value: str):
+    raw = value.encode("utf-8")
+    _write_varint(out, len(raw))
+    out += raw
+
+
+def _write_value(out: bytearray, value: Any, field_ids: Dict[str, int]):
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, int):
+        out.append(_INT)
+        _write_varint(out, (value << 1) ^ (value >> 63))  # zigzag
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += struct.pack(">d", value)
+    elif isinstance(value, str):
+        out.append(_STR)
+        _write_str(out, value)
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST)
+        _write_varint(out, len(value))
+        for item in value:
+            _write_value(out, item, field_ids)
+    elif isinstance(value, dict):
+        out.append(_MAP)
+        _write_varint(out, len(value))
+        for key, item in value.items():
+            field_id = field_ids.get(key)
+            if field_id is None:
+                # Low bit set: inline key name
+                raw = key.encode("utf-8")
+                _write_varint(out, (len(raw) << 1) | 1)
+                out += raw
+            else:
+                _write_varint(out, field_id << 1)
+            _write_value(out, item, field_ids)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} in an event")
+
+
+def _read_value(data: bytes, pos: int, fields: Tuple[str, ...]) -> Tuple[Any, int]:
+    tag = data[pos]
+    pos += 1
+    if tag == _NONE:
+        return None, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _FALSE:
+        return False, pos
+    if tag == _INT:
+        n, pos = _read_varint(data, pos)
+        return (n >> 1) ^ -(n & 1), pos
+    if tag == _FLOAT:
+        return struct.unpack_from(">d", data, pos)[0], pos + 8
+    if tag == _STR:
+        length, pos = _read_varint(data, pos)
+        return data[pos:pos + length].decode("utf-8"), pos + length
+    if tag == _LIST:
+        count, pos = _read_varint(data, pos)
+        items = []
+        for _ in range(count):
+            item, pos = _read_value(data, pos, fields)
+            items.append(item)
+        return items, pos
+    if tag == _MAP:
+        count, pos = _read_varint(data, pos)
+        result = {}
+        for _ in range(count):
+            key_ref, pos = _read_varint(data, pos)
+            if key_ref & 1:
+                length = key_ref >> 1
+                key = data[pos:pos + length].decode("utf-8")
+                pos += length
+            else:
+                key = fields[key_ref >> 1]
+            result[key], pos = _read_value(data, pos, fields)
+        return result, pos
+    raise ValueError(f"Unknown value tag {tag} in binary event")
+
+
+def encode_binary(event: Dict[str, Any], version: int = SCHEMA_VERSION) -> bytes:
+    out = bytearray((MAGIC, version))
+    _write_value(out, event, _FIELD_IDS[version])
+    return bytes(out)
+
+
+def encode(event: Dict[str, Any]) -> bytes:
+    """Serialize an event in the configured encoding (Kafka value_serializer)"""
+    if settings.KAFKA_EVENT_ENCODING == "binary":
+        return encode_binary(event)
+    return json.dumps(event, separators=(",", ":")).encode("utf-8")
+
+
+def decode(data: bytes) -> Dict[str, Any]:
+    """Deserialize an event in either encoding"""
+    if data and data[0] == MAGIC:
+        version = data[1]
+        if version not in FIELDS:
+            raise ValueError(f"Unsupported binary event schema version {version}")
+        event, _ = _read_value(data, 2, FIELDS[version])
+        return event
+    return json.loads(data)
@@ -0,0 +1,611 @@
+"""
+Event transports under the ticket event producer and the consumers
+Kafka in production; an in-process broker or an append-only segmented file log
+(with consumer offsets) for running and load-testing the event pipeline on one box.
+Selected by EVENT_TRANSPORT.
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from app.config import settings
+from app.services import event_codec
+
+logger = logging.getLogger(__name__)
+
+# Import aiokafka only if available, for development without Kafka
+try:
+    from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, ConsumerRebalanceListener
+    KAFKA_AVAILABLE = True
+except ImportError:
+    KAFKA_AVAILABLE = False
+    logger.warning("aiokafka not available, Kafka events will be mocked")
+
+
+class EventRecord(NamedTuple):
+    topic: str
+    partition: int
+    offset: int
+    key: str
+    value: Dict[str, Any]
+
+
+class EventConsumer:
+    """
+    Interface every transport's consumer implements.
+    poll() returns records after the current position; commit() stores that position
+    for the group; rewind() goes back to the last commit (to retry a failed batch).
+    """
+
+    async def start(self):
+        raise NotImplementedError
+
+    async def poll(self, max_records: int, timeout_ms: int) -> List[EventRecord]:
+        raise NotImplementedError
+
+    async def commit(self):
+        raise NotImplementedError
+
+    async def rewind(self):
+        raise NotImplementedError
+
+    async def stop(self):
+        raise NotImplementedError
+
+
+class EventTransport:
+    """Interface every event transport implements"""
+
+    name = ""
+
+    async def start(self) -> bool:
+        """Connect; False if the transport is unavailable (events are then dropped)"""
+        raise NotImplementedError
+
+    async def send_batch(self, batch: List[Tuple[str, Dict[str, Any]]]) -> List[bool]:
+        """Append (topic, event) pairs keyed by ticket_id; returns per-event success in input order"""
+        raise NotImplementedError
+
+    async def stop(self):
+        raise NotImplementedError
+
+    def consumer(self, group_id: str, topics: List[str], from_offset: Optional[int] = None) -> EventConsumer:
+        raise NotImplementedError
+
+
+def _partition_for(key: str, partitions: int) -> int:
+    return zlib.crc32(key.encode("utf-8")) % partitions
+
+
+# Kafka
+class KafkaTransport(EventTransport):
+    name = "kafka"
+
+    def __init__(self, linger_ms: int):
+        self.linger_ms = linger_ms
+        self.producer: Optional[Any] = None
+
+    async def start(self) -> bool:
+        if not KAFKA_AVAILABLE:
+            logger.warning("Kafka not available, skipping initialization")
+            return False
+
+        if not settings.KAFKA_BOOTSTRAP_SERVERS:
+            logger.warning("Kafka bootstrap servers not configured")
+            return False
+
+        self.producer = AIOKafkaProducer(
+            bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS.split(","),
+            key_serializer=lambda k: k.encode('utf-8'),
+            value_serializer=event_codec.encode,
+            security_protocol="SSL",  # AWS MSK requires SSL
+            # No duplicates or reordering within a partition on broker retries
+            enable_idempotence=True,
+            acks="all",
+            compression_type=settings.KAFKA_COMPRESSION_TYPE or None,
+            linger_ms=self.linger_ms,
+        )
+        try:
+            await self.producer.start()
+        except Exception:
+            self.producer = None
+            raise
+        return True
+
+    async def send_batch(self, batch: List[Tuple[str, Dict[str, Any]]]) -> List[bool]:
+        # Queue every send first so aiokafka can pack them into shared record batches
+        deliveries = []
+        for topic, event in batch:
+            try:
+                # Keyed by ticket so all of a ticket's events share a partition (and its ordering)
+                deliveries.append(await self.producer.send(topic, key=event["ticket_id"], value=event))
+            except Exception as e:
+                logger.error(f"Failed to queue {event['event_type']} event for {event['ticket_id']}: {e}")
+                deliveries.append(None)
+
+        pending = [delivery for delivery in deliveries if delivery is not None]
+        acks = iter(await asyncio.gather(*pending, return_exceptions=True))
+        return [
+            delivery is not None and not isinstance(next(acks), Exception)
+            for delivery in deliveries
+        ]
+
+    async def stop(self):
+        if self.producer:
+            await self.producer.stop()
+            self.producer = None
+
+    def consumer(self, group_id: str, topics: List[str], from_offset: Optional[int] = None) -> EventConsumer:
+        return KafkaEventConsumer(group_id, topics, from_offset)
+
+
+if KAFKA_AVAILABLE:
+    class _SeekOnAssign(ConsumerRebalanceListener):
+        """Rewinds each partition to a fixed offset the first time it is assigned (replay)"""
+
+        def __init__(self, consumer: "AIOKafkaConsumer", offset: int):
+            self.consumer = consumer
+            self.offset = offset
+            self.replayed = set()
+
+        async def on_partitions_revoked(self, revoked):
+            pass
+
+        async def on_partitions_assigned(self, assigned):
+            # Later rebalances resume from the committed offsets
+            for partition in set(assigned) - self.replayed:
+                self.consumer.seek(partition, self.offset)
+                self.replayed.add(partition)
+
+
+class KafkaEventConsumer(EventConsumer):
+    def __init__(self, group_id: str, topics: List[str], from_offset: Optional[int]):
+        if not KAFKA_AVAILABLE or not settings.KAFKA_BOOTSTRAP_SERVERS:
+            raise RuntimeError("Kafka is not available or not configured")
+
+        self.consumer = AIOKafkaConsumer(
+            bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS.split(","),
+            group_id=group_id,
+            key_deserializer=lambda k: k.decode("utf-8") if k else None,
+            value_deserializer=event_codec.decode,
+            security_protocol="SSL",
+            enable_auto_commit=False,
+            auto_offset_reset="earliest",
+        )
+        if from_offset is None:
+            self.consumer.subscribe(topics)
+        else:
+            self.consumer.subscribe(topics, listener=_SeekOnAssign(self.consumer, from_offset))
+        # First offset of each partition in the last poll, for rewind()
+        self._batch_start: Dict[Any, int] = {}
+
+    async def start(self):
+        await self.consumer.start()
+
+    async def poll(self, max_records: int, timeout_ms: int) -> List[EventRecord]:
+        batches = await self.consumer.getmany(timeout_ms=timeout_ms, max_records=max_records)
+        self._batch_start = {tp: records[0].offset for tp, records in batches.items() if records}
+        return [
+            EventRecord(r.topic, r.partition, r.offset, r.key, r.value)
+            for records in batches.values() for r in records
+        ]
+
+    async def commit(self):
+        await self.consumer.commit()
+
+    async def rewind(self):
+        for tp, offset in self._batch_start.items():
+            self.consumer.seek(tp, offset)
+
+    async def stop(self):
+        await self.consumer.stop()
+
+
+# Offset-tracking consumer shared by the local transports
+class _LocalConsumer(EventConsumer):
+    """
+    Single member of a consumer group that owns every partition of its topics.
+    Reads from the owning transport at its own position and commits through it.
+    """
+
+    def __init__(self, transport: "_LocalTransport", group_id: str, topics: List[str], from_offset: Optional[int]):
+        self.transport = transport
+        self.group_id = group_id
+        self.partitions = [(topic, p) for topic in topics for p in range(transport.partitions)]
+        self.from_offset = from_offset
+        self.positions: Dict[Tuple[str, int], int] = {}
+        self._wakeup = asyncio.Event()
+
+    async def start(self):
+        committed = await self.transport.committed_offsets(self.group_id)
+        for partition in self.partitions:
+            if self.from_offset is not None:
+                self.positions[partition] = self.from_offset
+            else:
+                self.positions[partition] = committed.get(partition, 0)
+        self.transport.waiters.add(self._wakeup)
+
+    async def poll(self, max_records: int, timeout_ms: int) -> List[EventRecord]:
+        self._wakeup.clear()
+        records = await self._read(max_records)
+        if not records:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout_ms / 1000)
+            except asyncio.TimeoutError:
+                return []
+            records = await self._read(max_records)
+        return records
+
+    async def _read(self, max_records: int) -> List[EventRecord]:
+        records: List[EventRecord] = []
+        for topic, partition in self.partitions:
+            if len(records) >= max_records:
+                break
+            position = self.positions[(topic, partition)]
+            batch = await self.transport.read(topic, partition, position, max_records - len(records), self.group_id)
+            for offset, key, raw in batch:
+                records.append(EventRecord(topic, partition, offset, key, event_codec.decode(raw)))
+                self.positions[(topic, partition)] = offset + 1
+        return records
+
+    async def commit(self):
+        await self.transport.commit_offsets(self.group_id, dict(self.positions))
+
+    async def rewind(self):
+        committed = await self.transport.committed_offsets(self.group_id)
+        for partition in self.partitions:
+            self.positions[partition] = committed.get(partition, self.from_offset or 0)
+
+    async def stop(self):
+        self.transport.waiters.discard(self._wakeup)
+
+
+class _LocalTransport(EventTransport):
+    """Partitioning, wakeups and the consumer factory shared by the memory and file transports"""
+
+    def __init__(self, partitions: int):
+        self.partitions = partitions
+        self.waiters = set()
+
+    async def start(self) -> bool:
+        return True
+
+    async def send_batch(self, batch: List[Tuple[str, Dict[str, Any]]]) -> List[bool]:
+        grouped: Dict[Tuple[str, int], List[Tuple[str, bytes]]] = defaultdict(list)
+        for topic, event in batch:
+            key = event["ticket_id"]
+            grouped[(topic, _partition_for(key, self.partitions))].append((key, event_codec.encode(event)))
+
+        await self.append(grouped)
+        for waiter in self.waiters:
+            waiter.set()
+        return [True] * len(batch)
+
+    async def stop(self):
+        pass
+
+    def consumer(self, group_id: str, topics: List[str], from_offset: Optional[int] = None) -> EventConsumer:
+        return _LocalConsumer(self, group_id, topics, from_offset)
+
+    async def append(self, grouped: Dict[Tuple[str, int], List[Tuple[str, bytes]]]):
+        raise NotImplementedError
+
+    async def read(
+        self,
+        topic: str,
+        partition: int,
+        offset: int,
+        max_records: int,
+        reader_id: str
+    ) -> List[Tuple[int, str, bytes]]:
+        raise NotImplementedError
+
+    async def committed_offsets(self, group_id: str) -> Dict[Tuple[str, int], int]:
+        raise NotImplementedError
+
+    async def commit_offsets(self, group_id: str, offsets: Dict[Tuple[str, int], int]):
+        raise NotImplementedError
+
+
+# In-memory broker
+class MemoryTransport(_LocalTransport):
+    """In-process partitioned log; producer and consumers must share the process"""
+
+    name = "memory"
+
+    def __init__(self, partitions: int):
+        super().__init__(partitions)
+        self.logs: Dict[Tuple[str, int], List[Tuple[str, bytes]]] = defaultdict(list)
+        self.offsets: Dict[str, Dict[Tuple[str, int], int]] = defaultdict(dict)
+
+    async def append(self, grouped: Dict[Tuple[str, int], List[Tuple[str, bytes]]]):
+        for partition, records in grouped.items():
+            self.logs[partition].extend(records)
+
+    async def read(
+        self,
+        topic: str,
+        partition: int,
+        offset: int,
+        max_records: int,
+        reader_id: str
+    ) -> List[Tuple[int, str, bytes]]:
+        log = self.logs.get((topic, partition), [])
+        return [
+            (offset + i, key, raw)
+            for i, (key, raw) in enumerate(log[offset:offset + max_records])
+        ]
+
+    async def committed_offsets(self, group_id: str) -> Dict[Tuple[str, int], int]:
+        return dict(self.offsets[group_id])
+
+    async def commit_offsets(self, group_id: str, offsets: Dict[Tuple[str, int], int]):
+        self.offsets[group_id].update(offsets)
+
+
+# Segmented file log
+_FRAME = struct.Struct(">IH")  # value length, key length
+
+
+class _LogReader:
+    """Sequential reader over one partition's segments that remembers where it stopped"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+        self.base = -1
+        self.next_offset = -1
+
+    def close(self):
+        if self.file:
+            self.file.close()
+        self.file = None
+
+    def _open(self, base: int):
+        self.close()
+        self.file = open(os.path.join(self.path, SegmentedLog.segment_name(base)), "rb")
+        self.base = base
+        self.next_offset = base
+
+    def _next_frame(self) -> Optional[Tuple[str, bytes]]:
+        """Next complete frame, or None at the end of the data written so far"""
+        start = self.file.tell()
+        header = self.file.read(_FRAME.size)
+        if len(header) == _FRAME.size:
+            value_length, key_length = _FRAME.unpack(header)
+            body = self.file.read(key_length + value_length)
+            if len(body) == key_length + value_length:
+                self.next_offset += 1
+                return body[:key_length].decode("utf-8"), body[key_length:]
+        # Partial frame still being written: come back to it later
+        self.file.seek(start)
+        return None
+
+    def _roll(self) -> bool:
+        """Move on to the next segment if the writer has started it"""
+        if self.next_offset not in SegmentedLog.segment_bases(self.path):
+            return False
+        self._open(self.next_offset)
+        return True
+
+    def _seek(self, offset: int) -> bool:
+        if self.file is not None and offset == self.next_offset:
+            return True
+
+        bases = SegmentedLog.segment_bases(self.path)
+        index = bisect.bisect_right(bases, offset) - 1
+        if index < 0:
+            return False
+        if self.file is None or bases[index] != self.base or offset < self.next_offset:
+            self._open(bases[index])
+
+        # Segments have no index, so skip forward frame by frame
+        while self.next_offset < offset:
+            if self._next_frame() is None and not self._roll():
+                return False
+        return True
+
+    def read(self, offset: int, max_records: int) -> List[Tuple[int, str, bytes]]:
+        if not self._seek(offset):
+            return []
+
+        records = []
+        while len(records) < max_records:
+            frame = self._next_frame()
+            if frame is None:
+                if self._roll():
+                    continue
+                break
+            records.append((self.next_offset - 1, *frame))
+        return records
+
+
+class SegmentedLog:
+    """
+    Append-only log for one topic partition, split into segment files named by their
+    first offset. One writer process; any number of readers, including other processes.
+    Appends come from worker threads (asyncio.to_thread), so they hold the log's lock
+    while writing a batch and rolling segments, keeping offsets and frames in step.
+    """
+
+    def __init__(self, path: str, segment_bytes: int, fsync: bool):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.writer = None
+        self.next_offset = 0
+        self.readers: Dict[str, _LogReader] = {}
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def segment_name(base: int) -> str:
+        return f"{base:020d}.log"
+
+    @staticmethod
+    def segment_bases(path: str) -> List[int]:
+        try:
+            return sorted(int(name[:-4]) for name in os.listdir(path) if name.endswith(".log"))
+        except FileNotFoundError:
+            return []
+
+    def _open_writer(self):
+        """Resume after the last complete record, dropping a torn tail from a crash"""
+        bases = self.segment_bases(self.path)
+        base = bases[-1] if bases else 0
+        self.next_offset = base
+        end = 0
+
+        if bases:
+            reader = _LogReader(self.path)
+            reader._open(base)
+            while reader._next_frame() is not None:
+                pass
+            end = reader.file.tell()
+            self.next_offset = reader.next_offset
+            reader.close()
+
+        self.writer = open(os.path.join(self.path, self.segment_name(base)), "ab")
+        self.writer.truncate(end)
+        self.writer.seek(0, os.SEEK_END)
+
+    def append(self, records: List[Tuple[str, bytes]]):
+        with self.lock:
+            if self.writer is None:
+                self._open_writer()
+
+            for key, value in records:
+                if self.writer.tell() >= self.segment_bytes:
+                    self.writer.close()
+                    self.writer = open(os.path.join(self.path, self.segment_name(self.next_offset)), "ab")
+                raw_key = key.encode("utf-8")
+                self.writer.write(_FRAME.pack(len(value), len(raw_key)) + raw_key + value)
+                self.next_offset += 1
+
+            self.writer.flush()
+            if self.fsync:
+                os.fsync(self.writer.fileno())
+
+    def read(self, reader_id: str, offset: int, max_records: int) -> List[Tuple[int, str, bytes]]:
+        # Readers only see complete frames, so reading doesn't wait for the writer
+        with self.lock:
+            reader = self.readers.get(reader_id)
+            if reader is None:
+                reader = self.readers[reader_id] = _LogReader(self.path)
+        return reader.read(offset, max_records)
+
+    def close(self):
+        with self.lock:
+            if self.writer:
+                self.writer.close()
+                self.writer = None
+            for reader in self.readers.values():
+                reader.close()
+
+
+class FileLogTransport(_LocalTransport):
+    """
+    Segmented logs under EVENT_LOG_DIR (<topic>-<partition>/<first offset>.log) with
+    consumer offsets in __offsets/<group>.json. The API process appends; a worker
+    process on the same box consumes.
+    """
+
+    name = "file"
+
+    def __init__(self, directory: str, partitions: int, segment_bytes: int, fsync: bool):
+        super().__init__(partitions)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.logs: Dict[Tuple[str, int], SegmentedLog] = {}
+        # Logs are created from worker threads; two writers on one partition would interleave
+        self._logs_lock = threading.Lock()
+
+    def _log(self, topic: str, partition: int) -> SegmentedLog:
+        with self._logs_lock:
+            log = self.logs.get((topic, partition))
+            if log is None:
+                log = self.logs[(topic, partition)] = SegmentedLog(
+                    os.path.join(self.directory, f"{topic}-{partition}"), self.segment_bytes, self.fsync
+                )
+        return log
+
+    async def append(self, grouped: Dict[Tuple[str, int], List[Tuple[str, bytes]]]):
+        def append_all():
+            for (topic, partition), records in grouped.items():
+                self._log(topic, partition).append(records)
+
+        await asyncio.to_thread(append_all)
+
+    async def read(
+        self,
+        topic: str,
+        partition: int,
+        offset: int,
+        max_records: int,
+        reader_id: str
+    ) -> List[Tuple[int, str, bytes]]:
+        return await asyncio.to_thread(self._log(topic, partition).read, reader_id, offset, max_records)
+
+    def _offsets_path(self, group_id: str) -> str:
+        return os.path.join(self.directory, "__offsets", f"{group_id}.json")
+
+    async def committed_offsets(self, group_id: str) -> Dict[Tuple[str, int], int]:
+        try:
+            with open(self._offsets_path(group_id)) as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return {}
+        return {
+            (name.rsplit("/", 1)[0], int(name.rsplit("/", 1)[1])): offset
+            for name, offset in stored.items()
+        }
+
+    async def commit_offsets(self, group_id: str, offsets: Dict[Tuple[str, int], int]):
+        def write():
+            path = self._offsets_path(group_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write-then-rename so a crash never leaves a half-written offsets file
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({f"{topic}/{partition}": offset for (topic, partition), offset in offsets.items()}, f)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp, path)
+
+        await asyncio.to_thread(write)
+
+    async def stop(self):
+        for log in self.logs.values():
+            log.close()
+        self.logs.clear()
+
+
+def build_transport(name: str) -> EventTransport:
+    """Create an event transport by name (see EVENT_TRANSPORT)"""
+    if name == "kafka":
+        buffered = settings.KAFKA_PUBLISH_MODE == "buffered"
+        return KafkaTransport(linger_ms=settings.KAFKA_LINGER_MS if buffered else 0)
+    if name == "memory":
+        return MemoryTransport(partitions=settings.EVENT_TRANSPORT_PARTITIONS)
+    if name == "file":
+        return FileLogTransport(
+            directory=settings.EVENT_LOG_DIR,
+            partitions=settings.EVENT_TRANSPORT_PARTITIONS,
+            segment_bytes=settings.EVENT_LOG_SEGMENT_BYTES,
+            fsync=settings.EVENT_LOG_FSYNC
+        )
+    raise ValueError(f"Unsupported event transport: {name}")
+
+
+# Singleton instance, shared by the producer and in-process consumers
+event_transport = build_transport(settings.EVENT_TRANSPORT)
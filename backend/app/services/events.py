@@ -0,0 +1,102 @@
+"""
+Ticket event builders
+Shared by the Kafka producer (direct publishing) and the DynamoDB outbox,
+so both paths emit exactly the same payloads
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from app.config import settings
+
+# Bumped whenever an event's fields change; also selects the binary field table in event_codec
+SCHEMA_VERSION = 2
+
+
+def _plain(value: Any) -> Any:
+    """Make a value JSON- and DynamoDB-safe (enums -> value, datetimes -> ISO string)"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    return getattr(value, "value", value)
+
+
+def ticket_created(ticket_data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """(topic, event) for a newly created ticket"""
+    return settings.KAFKA_TOPIC_TICKETS, _plain({
+        "event_type": "ticket.created",
+        "ticket_id": ticket_data["ticket_id"],
+        "customer_id": ticket_data["customer"]["internal_id"],
+        "status": ticket_data["status"],
+        "priority": ticket_data["priority"],
+        "source": ticket_data["source"]["channel"],
+        "subject": ticket_data["subject"],
+        "assigned_agent_id": ticket_data.get("assigned_agent_id"),
+        "message_count": ticket_data.get("message_count", 0),
+        "timestamp": ticket_data["created_at"]
+    })
+
+
+def message_added(ticket_id: str, message_data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """(topic, event) for a message appended to a ticket"""
+    return settings.KAFKA_TOPIC_MESSAGES, _plain({
+        "event_type": "message.added",
+        "ticket_id": ticket_id,
+        "message_id": message_data["message_id"],
+        "sender_type": message_data["sender_type"],
+        "timestamp": message_data["timestamp"]
+    })
+
+
+def messages_added(ticket_id: str, message_items: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+    """(topic, event) for several messages appended to a ticket in one write, oldest first"""
+    return settings.KAFKA_TOPIC_MESSAGES, _plain({
+        "event_type": "message.batch_added",
+        "ticket_id": ticket_id,
+        "messages": [
+            {"message_id": item["message_id"], "sender_type": item["sender_type"], "timestamp": item["timestamp"]}
+            for item in message_items
+        ],
+        "timestamp": message_items[-1]["timestamp"]
+    })
+
+
+def ticket_updated(
+    ticket_id: str,
+    before: Dict[str, Any],
+    updates: Dict[str, Any],
+    timestamp: str
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    (topic, event) for a ticket metadata change.
+    Carries only the fields that actually changed, as {"old": ..., "new": ...},
+    so the event stays the same size however long the conversation gets.
+    """
+    changes = {}
+    for field, new in _plain(updates).items():
+        old = _plain(before.get(field))
+        if old != new:
+            changes[field] = {"old": old, "new": new}
+
+    return settings.KAFKA_TOPIC_TICKETS, {
+        "event_type": "ticket.updated",
+        "ticket_id": ticket_id,
+        "changes": changes,
+        "timestamp": timestamp
+    }
+
+
+def sequenced(topic_events: List[Tuple[str, Dict[str, Any]]], last_sequence: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Stamp events with the schema version and consecutive per-ticket sequence numbers
+    ending at last_sequence (the ticket's version after the change).
+    Consumers keep the highest sequence seen per ticket and drop anything at or below it.
+    """
+    first = last_sequence - len(topic_events) + 1
+    return [
+        (topic, {**event, "schema_version": SCHEMA_VERSION, "sequence": first + offset})
+        for offset, (topic, event) in enumerate(topic_events)
+    ]
@@ -0,0 +1,99 @@
+"""
+Inbound message de-duplication
+Platforms redeliver webhooks when they don't get a timely 200, so the same message can
+arrive several times. Each message is claimed on (channel, platform message ID) with a
+conditional write in the webhook receipts table before any ticket work; redeliveries of
+processed messages are dropped, and one still being processed elsewhere is retried.
+Message IDs this process has finished are remembered in an LRU, so most redeliveries are
+rejected without a DynamoDB call.
+"""
+
+import logging
+from typing import Any, Dict
+
+from app.config import settings
+from app.models import Channel
+from app.services.cache import build_cache
+from app.services.dynamodb import db_service
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of WebhookReceipts.claim
+CLAIMED = "claimed"
+DUPLICATE = "duplicate"
+IN_PROGRESS = "in_progress"
+
+
+class MessageInProgress(Exception):
+    """Another worker holds the claim on a message; the payload is retried later"""
+
+
+class WebhookReceipts:
+    def __init__(self):
+        # Only processed messages go in here; an in-progress claim can still be released
+        self.processed = build_cache(
+            settings.TICKET_CACHE_BACKEND,
+            max_size=settings.WEBHOOK_DEDUPE_CACHE_SIZE,
+            ttl_seconds=settings.WEBHOOK_DEDUPE_CACHE_TTL_SECONDS
+        )
+        self.claimed_total = 0
+        self.duplicates_total = 0
+        self.in_progress_total = 0
+
+    @staticmethod
+    def _key(channel: Channel, platform_message_id: str) -> str:
+        return f"{channel.value}#{platform_message_id}"
+
+    async def claim(self, channel: Channel, platform_message_id: str) -> str:
+        """
+        CLAIMED if this worker should process the message, DUPLICATE if it was already
+        processed, IN_PROGRESS if another worker is processing it (retry later; it may fail)
+        """
+        key = self._key(channel, platform_message_id)
+        if self.processed.get(key):
+            self.duplicates_total += 1
+            return DUPLICATE
+
+        status = await db_service.claim_webhook_receipt(key, self._lease_seconds(), settings.WEBHOOK_DEDUPE_TTL_SECONDS)
+        if status == "claimed":
+            self.claimed_total += 1
+            return CLAIMED
+        if status == "processed":
+            self.duplicates_total += 1
+            return DUPLICATE
+        self.in_progress_total += 1
+        return IN_PROGRESS
+
+    @staticmethod
+    def _lease_seconds() -> float:
+        # Shorter than the visibility timeout, so the redelivery of a payload whose worker
+        # died finds the lease expired instead of waiting for another receive
+        return min(settings.WEBHOOK_DEDUPE_LEASE_SECONDS, settings.INGEST_VISIBILITY_TIMEOUT_SECONDS / 2)
+
+    async def complete(self, channel: Channel, platform_message_id: str, ticket_id: str):
+        key = self._key(channel, platform_message_id)
+        self.processed.set(key, True)
+        try:
+            await db_service.complete_webhook_receipt(key, ticket_id)
+        except Exception as e:
+            # The message is on the ticket; the claim's lease runs out instead
+            logger.warning(f"Could not mark {key} processed: {e}")
+
+    async def release(self, channel: Channel, platform_message_id: str):
+        key = self._key(channel, platform_message_id)
+        try:
+            await db_service.release_webhook_receipt(key)
+        except Exception as e:
+            logger.warning(f"Could not release the claim on {key}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "claimed_total": self.claimed_total,
+            "duplicates_total": self.duplicates_total,
+            "in_progress_total": self.in_progress_total,
+            "cache": self.processed.stats()
+        }
+
+
+# Singleton instance
+webhook_receipts = WebhookReceipts()
@@ -0,0 +1,331 @@
+"""
+Inbound email (SendGrid Inbound Parse)
+SendGrid posts each email it receives as multipart/form-data: headers, addresses and
+subject as small fields, the text and HTML bodies, and one file part per attachment.
+The request body is parsed as it arrives and bodies and attachments are streamed straight
+to object storage, so memory use is bounded by the upload part size, not the size of the
+email. What's left (threading headers, addresses, the start of the text body and
+attachment metadata) is the webhook payload the ingest worker turns into a ticket message.
+"""
+
+import json
+import logging
+import re
+import uuid
+from datetime import datetime, timezone
+from email.parser import HeaderParser
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from multipart.exceptions import FormParserError
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app.config import settings
+from app.services.object_store import ObjectUpload, object_store
+
+logger = logging.getLogger(__name__)
+
+# Small fields kept in memory; anything else SendGrid sends (dkim, SPF, spam_report...) is skipped
+FIELDS = {"headers", "from", "to", "cc", "subject", "charsets", "attachment-info", "spam_score"}
+# Streamed to object storage like attachments
+BODIES = {"text": "text/plain", "html": "text/html"}
+
+# Per multipart part header (Content-Disposition, Content-Type)
+MAX_PART_HEADER_BYTES = 8 * 1024
+
+MESSAGE_ID = re.compile(r"<[^<>\s]+>")
+
+
+class InvalidEmail(ValueError):
+    """Not a usable Inbound Parse post"""
+
+
+class EmailTooLarge(InvalidEmail):
+    pass
+
+
+def _message_ids(value: Any) -> List[str]:
+    return MESSAGE_ID.findall(str(value or ""))
+
+
+def thread_headers(raw_headers: str) -> Dict[str, Any]:
+    """Message-ID, In-Reply-To, References (most recent EMAIL_MAX_REFERENCES) and Date (UTC ISO) of an email"""
+    headers = HeaderParser().parsestr(raw_headers)
+    message_ids = _message_ids(headers.get("Message-ID"))
+
+    sent_at = None
+    try:
+        date = parsedate_to_datetime(str(headers.get("Date")))
+        if date.tzinfo is not None:
+            date = date.astimezone(timezone.utc).replace(tzinfo=None)
+        sent_at = date.isoformat()
+    except (TypeError, ValueError):
+        pass
+
+    return {
+        "message_id": message_ids[0] if message_ids else None,
+        "in_reply_to": _message_ids(headers.get("In-Reply-To")),
+        "references": _message_ids(headers.get("References"))[-settings.EMAIL_MAX_REFERENCES:],
+        "sent_at": sent_at
+    }
+
+
+async def _delete_objects(keys: List[str]):
+    for key in keys:
+        try:
+            await object_store.delete(key)
+        except Exception as e:
+            logger.warning(f"Could not remove {key}: {e}")
+
+
+class _Callbacks:
+    """
+    Callbacks for the streaming multipart parser. They run synchronously inside
+    parser.write(), so they only record what was parsed; _EmailIntake applies it.
+    """
+
+    def __init__(self):
+        self.events: List[Tuple[str, Any]] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+        if len(self._header_name) > MAX_PART_HEADER_BYTES:
+            raise InvalidEmail("Part header too large")
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+        if len(self._header_value) > MAX_PART_HEADER_BYTES:
+            raise InvalidEmail("Part header too large")
+
+    def on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        self.events.append(("part", self._headers))
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        self.events.append(("data", data[start:end]))
+
+    def on_part_end(self):
+        self.events.append(("end", None))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end
+        }
+
+
+class _Part:
+    def __init__(self, name: str, file_name: Optional[str], content_type: str, upload: Optional[ObjectUpload]):
+        self.name = name
+        self.file_name = file_name
+        self.content_type = content_type
+        self.upload = upload
+        # A small field's value, or the start of the text body
+        self.data = bytearray()
+        self.truncated = False
+
+
+class _EmailIntake:
+    """One Inbound Parse post, parsed and stored as it streams in"""
+
+    def __init__(self):
+        self.intake_id = uuid.uuid4().hex
+        self.prefix = f"{settings.EMAIL_STORAGE_PREFIX}/{datetime.utcnow():%Y/%m/%d}/{self.intake_id}"
+        self.fields: Dict[str, bytes] = {}
+        self.stored: Dict[str, Dict[str, Any]] = {}  # Part name -> object metadata, in post order
+        self.text: Optional[_Part] = None
+        self.received = 0
+        self._part: Optional[_Part] = None
+        self._attachments = 0
+
+    async def run(self, boundary: bytes, body: AsyncIterator[bytes]) -> Dict[str, Any]:
+        callbacks = _Callbacks()
+        parser = MultipartParser(boundary, callbacks.as_dict())
+
+        async for chunk in body:
+            self.received += len(chunk)
+            if self.received > settings.EMAIL_MAX_BYTES:
+                raise EmailTooLarge(f"Email larger than {settings.EMAIL_MAX_BYTES} bytes")
+            try:
+                parser.write(chunk)
+            except FormParserError as e:
+                raise InvalidEmail(f"Malformed multipart body: {e}")
+            events, callbacks.events = callbacks.events, []
+            for kind, value in events:
+                await self._apply(kind, value)
+
+        if self._part is not None:
+            raise InvalidEmail("Multipart body ended mid-part")
+        return self._payload()
+
+    async def _apply(self, kind: str, value: Any):
+        if kind == "part":
+            await self._begin(value)
+            return
+
+        part = self._part
+        if kind == "data":
+            if part.upload is not None:
+                await part.upload.write(value)
+                if part is self.text:
+                    self._keep(part, value, settings.EMAIL_TEXT_MAX_BYTES)
+            elif part.name in FIELDS:
+                if len(part.data) + len(value) > settings.EMAIL_MAX_FIELD_BYTES:
+                    raise InvalidEmail(f"The {part.name} field is too large")
+                part.data.extend(value)
+            return
+
+        # End of part
+        if part.upload is not None:
+            await part.upload.complete()
+            self.stored[part.name] = {
+                "file_name": part.file_name,
+                "file_type": part.content_type,
+                "size_bytes": part.upload.size,
+                "storage_key": part.upload.key,
+                "sha256": part.upload.sha256
+            }
+        elif part.name in FIELDS:
+            self.fields[part.name] = bytes(part.data)
+        self._part = None
+
+    async def _begin(self, headers: Dict[bytes, bytes]):
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        file_name = options[b"filename"].decode("utf-8", "replace") if b"filename" in options else None
+        content_type = headers.get(b"content-type", b"").decode("latin-1") or None
+
+        if name == "email":
+            raise InvalidEmail('Raw MIME posts are not supported; turn off "POST the raw, full MIME message"')
+
+        upload = None
+        if name in BODIES and file_name is None:
+            content_type = content_type or BODIES[name]
+            upload = await object_store.open_upload(f"{self.prefix}/{name}", content_type)
+        elif file_name is not None:
+            # SendGrid names file parts attachment1..N, matching the keys of attachment-info
+            self._attachments += 1
+            if not name or name in self.stored or name in BODIES:
+                name = f"attachment{self._attachments}"
+            content_type = content_type or "application/octet-stream"
+            upload = await object_store.open_upload(f"{self.prefix}/attachment{self._attachments}", content_type)
+
+        self._part = _Part(name, file_name, content_type, upload)
+        if name == "text" and upload is not None:
+            self.text = self._part
+
+    @staticmethod
+    def _keep(part: _Part, data: bytes, limit: int):
+        room = limit - len(part.data)
+        if room < len(data):
+            part.truncated = True
+        if room > 0:
+            part.data.extend(data[:room])
+
+    async def discard(self):
+        """Remove everything stored for a post that failed part way"""
+        if self._part is not None and self._part.upload is not None:
+            await self._part.upload.abort()
+        await _delete_objects([stored["storage_key"] for stored in self.stored.values()])
+
+    def _payload(self) -> Dict[str, Any]:
+        charsets = self._json("charsets")
+
+        def decode(data: bytes, field: str) -> str:
+            try:
+                return data.decode(charsets.get(field) or "utf-8", "replace")
+            except LookupError:
+                return data.decode("utf-8", "replace")
+
+        fields = {name: decode(value, name) for name, value in self.fields.items()}
+        if not fields.get("from"):
+            raise InvalidEmail("Missing from field")
+
+        headers = thread_headers(fields.get("headers", ""))
+        attachment_info = self._json("attachment-info")
+        attachments = []
+        for name, stored in self.stored.items():
+            if name in BODIES:
+                continue
+            info = attachment_info.get(name, {})
+            attachments.append({
+                "attachment_id": name,
+                **stored,
+                "file_name": stored["file_name"] or info.get("filename"),
+                "file_type": info.get("type") or stored["file_type"],
+                "content_id": info.get("content-id")
+            })
+
+        return {
+            # Without a Message-ID header the email can't be de-duplicated or replied to by reference
+            "message_id": headers["message_id"] or f"<{self.intake_id}@{settings.EMAIL_STORAGE_PREFIX}>",
+            "in_reply_to": headers["in_reply_to"],
+            "references": headers["references"],
+            "sent_at": headers["sent_at"],
+            "from": fields["from"],
+            "to": fields.get("to"),
+            "cc": fields.get("cc"),
+            "subject": fields.get("subject", ""),
+            "text": decode(bytes(self.text.data), "text") if self.text else "",
+            "text_truncated": self.text.truncated if self.text else False,
+            "bodies": {
+                name: {"storage_key": stored["storage_key"], "size_bytes": stored["size_bytes"]}
+                for name, stored in self.stored.items() if name in BODIES
+            },
+            "attachments": attachments,
+            "spam_score": fields.get("spam_score")
+        }
+
+    def _json(self, field: str) -> Dict[str, Any]:
+        try:
+            value = json.loads(self.fields.get(field) or b"{}")
+        except ValueError:
+            return {}
+        return value if isinstance(value, dict) else {}
+
+
+async def receive_email(content_type: str, body: AsyncIterator[bytes]) -> Dict[str, Any]:
+    """
+    Parse an Inbound Parse post as it streams in, storing its bodies and attachments.
+    Returns the webhook payload. Raises InvalidEmail (EmailTooLarge over EMAIL_MAX_BYTES);
+    nothing is left in object storage when it fails.
+    """
+    mime_type, options = parse_options_header(content_type or "")
+    if mime_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise InvalidEmail("Expected a multipart/form-data body")
+
+    intake = _EmailIntake()
+    try:
+        payload = await intake.run(options[b"boundary"], body)
+    except Exception:
+        await intake.discard()
+        raise
+
+    logger.info(
+        f"Received email {payload['message_id']} ({intake.received} bytes, "
+        f"{len(payload['attachments'])} attachments) into {intake.prefix}"
+    )
+    return payload
+
+
+async def discard_email(payload: Dict[str, Any]):
+    """Remove the stored bodies and attachments of an email that won't be processed"""
+    await _delete_objects(
+        [body["storage_key"] for body in payload["bodies"].values()]
+        + [attachment["storage_key"] for attachment in payload["attachments"]]
+    )
@@ -0,0 +1,187 @@
+"""
+Agent inbox read models
+Materializes per-status and per-agent ticket lists from the event stream, so
+dashboards read one small inbox partition instead of querying the tickets table.
+
+Each ticket has a state row (inbox "ticket#<id>") holding its current view and the
+event sequences applied to it, plus one entry row in every inbox it belongs to
+("status#<status>", "agent#<agent_id>"). Sequences are consecutive per ticket across
+both topics, so the state keeps the sequence everything up to has been applied and the
+applied ones above it; an event already applied is skipped, so redelivery and replay
+are harmless, while one arriving late (after a later event) is still counted. Each field
+also records the sequence that last set it, so a late change never overwrites a newer one.
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.services.dynamodb import db_service
+
+STATE_PREFIX = "ticket#"
+
+# Applied sequences kept above the contiguous run; past this the oldest gap is given up on
+# (an event that was never published would otherwise keep the list growing)
+MAX_PENDING_SEQUENCES = 100
+
+# Ticket fields copied into inbox entries
+VIEW_FIELDS = (
+    "ticket_id", "subject", "status", "priority", "channel", "customer_id",
+    "assigned_agent_id", "message_count", "last_sender_type", "created_at", "updated_at"
+)
+
+
+def status_inbox(status: str) -> str:
+    return f"status#{status}"
+
+
+def agent_inbox(agent_id: str) -> str:
+    return f"agent#{agent_id}"
+
+
+def _stream(event: Dict[str, Any]) -> str:
+    """Topic family an event came from; each is ordered per ticket on its own"""
+    return event["event_type"].split(".", 1)[0]
+
+
+class InboxProjector:
+    def __init__(self):
+        self.applied_total = 0
+        self.skipped_total = 0
+
+    @staticmethod
+    def _inboxes(state: Optional[Dict[str, Any]]) -> Set[str]:
+        if not state:
+            return set()
+        inboxes = set()
+        if state.get("status"):
+            inboxes.add(status_inbox(state["status"]))
+        if state.get("assigned_agent_id"):
+            inboxes.add(agent_inbox(state["assigned_agent_id"]))
+        return inboxes
+
+    @staticmethod
+    def _first_delivery(state: Dict[str, Any], event: Dict[str, Any]) -> bool:
+        """Record an event's sequence as applied; False if it already was"""
+        sequence = event.get("sequence")
+        if sequence is None:
+            return True
+        # State rows written before per-event tracking kept one high-water mark per topic
+        if sequence <= state.get(f"{_stream(event)}_sequence", 0):
+            return False
+
+        through = int(state.get("applied_through", 0))
+        applied = {int(applied) for applied in state.get("applied_sequences", [])}
+        if sequence <= through or sequence in applied:
+            return False
+
+        applied.add(sequence)
+        if len(applied) > MAX_PENDING_SEQUENCES:
+            through = min(applied) - 1
+        while through + 1 in applied:
+            through += 1
+            applied.remove(through)
+        state["applied_through"] = through
+        state["applied_sequences"] = sorted(applied)
+        return True
+
+    @staticmethod
+    def _set(state: Dict[str, Any], field: str, value: Any, sequence: Optional[int]):
+        """Set a field unless a later event has already set it"""
+        if sequence is not None:
+            sequences = state.setdefault("field_sequences", {})
+            if sequence < int(sequences.get(field, 0)):
+                return
+            sequences[field] = sequence
+        state[field] = value
+
+    @classmethod
+    def _apply_event(cls, state: Dict[str, Any], event: Dict[str, Any]):
+        """Fold one event into a ticket's state"""
+        event_type = event["event_type"]
+        timestamp = event.get("timestamp")
+        sequence = event.get("sequence")
+
+        if event_type == "ticket.created":
+            for field, value in (
+                ("subject", event.get("subject")),
+                ("status", event["status"]),
+                ("priority", event["priority"]),
+                ("channel", event["source"]),
+                ("customer_id", event["customer_id"]),
+                ("assigned_agent_id", event.get("assigned_agent_id")),
+                ("created_at", timestamp)
+            ):
+                cls._set(state, field, value, sequence)
+            # message.added events can arrive before this one (different topic)
+            state["message_count"] = state.get("message_count", 0) + event.get("message_count", 0)
+        elif event_type == "ticket.updated":
+            for field, change in event.get("changes", {}).items():
+                if field in VIEW_FIELDS:
+                    cls._set(state, field, change["new"], sequence)
+        elif event_type == "message.added":
+            state["message_count"] = state.get("message_count", 0) + 1
+            cls._set(state, "last_sender_type", event["sender_type"], sequence)
+        elif event_type == "message.batch_added":
+            state["message_count"] = state.get("message_count", 0) + len(event["messages"])
+            cls._set(state, "last_sender_type", event["messages"][-1]["sender_type"], sequence)
+        else:
+            return
+
+        if timestamp and timestamp > state.get("updated_at", ""):
+            state["updated_at"] = timestamp
+
+    async def apply(self, batch: List[Dict[str, Any]]) -> int:
+        """
+        Apply a batch of events (in consumption order) to the read models with one
+        state read and one batched write. Returns the number of events applied.
+        """
+        by_ticket: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for event in batch:
+            by_ticket[event["ticket_id"]].append(event)
+        if not by_ticket:
+            return 0
+
+        states = await db_service.get_inbox_items([
+            (f"{STATE_PREFIX}{ticket_id}", ticket_id) for ticket_id in by_ticket
+        ])
+
+        puts: List[Dict[str, Any]] = []
+        deletes: List[Tuple[str, str]] = []
+        applied = 0
+
+        for ticket_id, ticket_events in by_ticket.items():
+            stored = states.get(ticket_id)
+            state = dict(stored) if stored else {"ticket_id": ticket_id}
+            state["field_sequences"] = dict(state.get("field_sequences", {}))
+            changed = False
+
+            for event in ticket_events:
+                if not self._first_delivery(state, event):
+                    self.skipped_total += 1
+                    continue
+
+                self._apply_event(state, event)
+                changed = True
+                applied += 1
+
+            if not changed:
+                continue
+
+            before = self._inboxes(stored)
+            after = self._inboxes(state)
+            deletes.extend((inbox_id, ticket_id) for inbox_id in before - after)
+
+            puts.append({**state, "inbox_id": f"{STATE_PREFIX}{ticket_id}"})
+            if state.get("updated_at"):
+                entry = {field: state[field] for field in VIEW_FIELDS if field in state}
+                puts.extend({**entry, "inbox_id": inbox_id} for inbox_id in after)
+
+        if puts or deletes:
+            await db_service.write_inbox(puts, deletes)
+
+        self.applied_total += applied
+        return applied
+
+
+# Singleton instance
+inbox_projector = InboxProjector()
@@ -0,0 +1,325 @@
+"""
+Queues under inbound webhook ingestion
+The webhook routes enqueue each raw payload and ack; the ingest worker drains the queue.
+SQS in production (its redrive policy moves poison payloads to a dead-letter queue);
+a local SQLite-backed queue with the same receive/delete/visibility semantics and its own
+dead-letter queue for running on one box. Selected by INGEST_QUEUE_BACKEND.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, NamedTuple
+
+import boto3
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class IngestMessage(NamedTuple):
+    message_id: str
+    receipt: str  # Changes on every receive; deleting with an old receipt is a no-op
+    receive_count: int
+    body: Dict[str, Any]
+
+
+class IngestQueue:
+    """
+    Interface every ingest queue implements (SQS semantics).
+    A received message is hidden for the visibility timeout and comes back unless it is
+    deleted; once it has been received max-receive-count times it moves to the
+    dead-letter queue instead.
+    """
+
+    name = ""
+
+    async def send(self, body: Dict[str, Any]) -> str:
+        """Durably enqueue a payload; returns its message ID"""
+        raise NotImplementedError
+
+    async def receive(self, max_messages: int, wait_seconds: float, visibility_timeout: float) -> List[IngestMessage]:
+        """Up to max_messages visible messages, waiting up to wait_seconds for the first"""
+        raise NotImplementedError
+
+    async def delete(self, receipt: str):
+        raise NotImplementedError
+
+    async def change_visibility(self, receipt: str, seconds: float):
+        raise NotImplementedError
+
+    async def dead_letters(self, max_messages: int) -> List[IngestMessage]:
+        """Look at messages in the dead-letter queue without moving them"""
+        raise NotImplementedError
+
+    async def redrive(self, max_messages: int) -> int:
+        """Move up to max_messages from the dead-letter queue back to the queue; returns the number moved"""
+        raise NotImplementedError
+
+    async def depth(self) -> Dict[str, int]:
+        """Approximate counts: queued (visible), in_flight (received, not deleted) and dead_letters"""
+        raise NotImplementedError
+
+
+# SQS
+class SqsIngestQueue(IngestQueue):
+    name = "sqs"
+
+    # SQS limits
+    MAX_BATCH = 10
+    MAX_WAIT_SECONDS = 20
+
+    def __init__(self, queue_url: str, dead_letter_queue_url: str):
+        self.queue_url = queue_url
+        self.dead_letter_queue_url = dead_letter_queue_url
+        self.client = boto3.client("sqs", region_name=settings.AWS_REGION)
+
+    @staticmethod
+    def _message(message: Dict[str, Any]) -> IngestMessage:
+        return IngestMessage(
+            message_id=message["MessageId"],
+            receipt=message["ReceiptHandle"],
+            receive_count=int(message.get("Attributes", {}).get("ApproximateReceiveCount", 1)),
+            body=json.loads(message["Body"])
+        )
+
+    async def _receive(self, queue_url: str, max_messages: int, wait_seconds: float, visibility_timeout: float) -> List[IngestMessage]:
+        response = await asyncio.to_thread(
+            self.client.receive_message,
+            QueueUrl=queue_url,
+            MaxNumberOfMessages=min(max_messages, self.MAX_BATCH),
+            WaitTimeSeconds=int(min(wait_seconds, self.MAX_WAIT_SECONDS)),
+            VisibilityTimeout=int(visibility_timeout),
+            AttributeNames=["ApproximateReceiveCount"]
+        )
+        return [self._message(message) for message in response.get("Messages", [])]
+
+    async def send(self, body: Dict[str, Any]) -> str:
+        response = await asyncio.to_thread(
+            self.client.send_message, QueueUrl=self.queue_url, MessageBody=json.dumps(body)
+        )
+        return response["MessageId"]
+
+    async def receive(self, max_messages: int, wait_seconds: float, visibility_timeout: float) -> List[IngestMessage]:
+        return await self._receive(self.queue_url, max_messages, wait_seconds, visibility_timeout)
+
+    async def delete(self, receipt: str):
+        await asyncio.to_thread(self.client.delete_message, QueueUrl=self.queue_url, ReceiptHandle=receipt)
+
+    async def change_visibility(self, receipt: str, seconds: float):
+        await asyncio.to_thread(
+            self.client.change_message_visibility,
+            QueueUrl=self.queue_url,
+            ReceiptHandle=receipt,
+            VisibilityTimeout=int(seconds)
+        )
+
+    async def dead_letters(self, max_messages: int) -> List[IngestMessage]:
+        # Visibility 0: the messages stay available in the dead-letter queue
+        return await self._receive(self.dead_letter_queue_url, max_messages, 0, 0)
+
+    async def redrive(self, max_messages: int) -> int:
+        moved = 0
+        while moved < max_messages:
+            batch = await self._receive(
+                self.dead_letter_queue_url, min(max_messages - moved, self.MAX_BATCH), 0, 60
+            )
+            if not batch:
+                break
+            # Send before deleting, so a crash in between duplicates rather than loses a payload
+            await asyncio.to_thread(
+                self.client.send_message_batch,
+                QueueUrl=self.queue_url,
+                Entries=[{"Id": str(i), "MessageBody": json.dumps(m.body)} for i, m in enumerate(batch)]
+            )
+            await asyncio.to_thread(
+                self.client.delete_message_batch,
+                QueueUrl=self.dead_letter_queue_url,
+                Entries=[{"Id": str(i), "ReceiptHandle": m.receipt} for i, m in enumerate(batch)]
+            )
+            moved += len(batch)
+        return moved
+
+    async def depth(self) -> Dict[str, int]:
+        names = ["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"]
+        queue, dead = await asyncio.gather(*(
+            asyncio.to_thread(self.client.get_queue_attributes, QueueUrl=url, AttributeNames=names)
+            for url in (self.queue_url, self.dead_letter_queue_url)
+        ))
+        return {
+            "queued": int(queue["Attributes"]["ApproximateNumberOfMessages"]),
+            "in_flight": int(queue["Attributes"]["ApproximateNumberOfMessagesNotVisible"]),
+            "dead_letters": int(dead["Attributes"]["ApproximateNumberOfMessages"])
+        }
+
+
+# Local
+class LocalIngestQueue(IngestQueue):
+    """
+    Queue and dead-letter queue in one SQLite database (WAL, synchronous commits), so a
+    payload is on disk before the webhook is acked. The API process sends; a worker
+    process on the same box receives.
+    """
+
+    name = "local"
+
+    # How often an empty receive re-checks while waiting
+    POLL_SECONDS = 0.2
+
+    def __init__(self, path: str, max_receive_count: int):
+        self.path = path
+        self.max_receive_count = max_receive_count
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " message_id TEXT PRIMARY KEY,"
+                " queue TEXT NOT NULL,"  # "main" or "dead"
+                " body TEXT NOT NULL,"
+                " sent_at REAL NOT NULL,"
+                " visible_at REAL NOT NULL,"
+                " receive_count INTEGER NOT NULL DEFAULT 0,"
+                " receipt TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS messages_visible ON messages (queue, visible_at)")
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, fn, *args):
+        """Run fn(conn, *args) in one write transaction"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn, *args)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    @staticmethod
+    def _send(conn: sqlite3.Connection, body: Dict[str, Any]) -> str:
+        message_id = str(uuid.uuid4())
+        now = time.time()
+        conn.execute(
+            "INSERT INTO messages (message_id, queue, body, sent_at, visible_at) VALUES (?, 'main', ?, ?, ?)",
+            (message_id, json.dumps(body), now, now)
+        )
+        return message_id
+
+    def _receive(self, conn: sqlite3.Connection, max_messages: int, visibility_timeout: float) -> List[IngestMessage]:
+        now = time.time()
+        received = []
+        while len(received) < max_messages:
+            rows = conn.execute(
+                "SELECT message_id, body, receive_count FROM messages"
+                " WHERE queue = 'main' AND visible_at <= ? ORDER BY visible_at, sent_at LIMIT ?",
+                (now, max_messages - len(received))
+            ).fetchall()
+            if not rows:
+                break
+            for message_id, body, receive_count in rows:
+                if receive_count >= self.max_receive_count:
+                    # Same rule as an SQS redrive policy: moved on the receive after the last allowed one
+                    conn.execute(
+                        "UPDATE messages SET queue = 'dead', receipt = NULL, visible_at = ? WHERE message_id = ?",
+                        (now, message_id)
+                    )
+                    logger.warning(f"Ingest message {message_id} moved to the dead-letter queue after {receive_count} receives")
+                    continue
+                receipt = uuid.uuid4().hex
+                conn.execute(
+                    "UPDATE messages SET receive_count = receive_count + 1, receipt = ?, visible_at = ? WHERE message_id = ?",
+                    (receipt, now + visibility_timeout, message_id)
+                )
+                received.append(IngestMessage(message_id, receipt, receive_count + 1, json.loads(body)))
+        return received
+
+    async def send(self, body: Dict[str, Any]) -> str:
+        return await asyncio.to_thread(self._execute, self._send, body)
+
+    async def receive(self, max_messages: int, wait_seconds: float, visibility_timeout: float) -> List[IngestMessage]:
+        deadline = time.monotonic() + wait_seconds
+        while True:
+            received = await asyncio.to_thread(self._execute, self._receive, max_messages, visibility_timeout)
+            if received or time.monotonic() >= deadline:
+                return received
+            await asyncio.sleep(min(self.POLL_SECONDS, max(deadline - time.monotonic(), 0)))
+
+    async def delete(self, receipt: str):
+        await asyncio.to_thread(
+            self._execute,
+            lambda conn: conn.execute("DELETE FROM messages WHERE queue = 'main' AND receipt = ?", (receipt,))
+        )
+
+    async def change_visibility(self, receipt: str, seconds: float):
+        await asyncio.to_thread(
+            self._execute,
+            lambda conn: conn.execute(
+                "UPDATE messages SET visible_at = ? WHERE queue = 'main' AND receipt = ?", (time.time() + seconds, receipt)
+            )
+        )
+
+    async def dead_letters(self, max_messages: int) -> List[IngestMessage]:
+        rows = await asyncio.to_thread(
+            self._execute,
+            lambda conn: conn.execute(
+                "SELECT message_id, body, receive_count FROM messages WHERE queue = 'dead' ORDER BY visible_at LIMIT ?",
+                (max_messages,)
+            ).fetchall()
+        )
+        return [IngestMessage(message_id, "", receive_count, json.loads(body)) for message_id, body, receive_count in rows]
+
+    async def redrive(self, max_messages: int) -> int:
+        def move(conn: sqlite3.Connection) -> int:
+            return conn.execute(
+                "UPDATE messages SET queue = 'main', receive_count = 0, visible_at = ? WHERE message_id IN"
+                " (SELECT message_id FROM messages WHERE queue = 'dead' ORDER BY visible_at LIMIT ?)",
+                (time.time(), max_messages)
+            ).rowcount
+
+        return await asyncio.to_thread(self._execute, move)
+
+    async def depth(self) -> Dict[str, int]:
+        def count(conn: sqlite3.Connection) -> Dict[str, int]:
+            now = time.time()
+            (queued,), (in_flight,), (dead,) = (
+                conn.execute(query, params).fetchone()
+                for query, params in (
+                    ("SELECT COUNT(*) FROM messages WHERE queue = 'main' AND visible_at <= ?", (now,)),
+                    ("SELECT COUNT(*) FROM messages WHERE queue = 'main' AND visible_at > ?", (now,)),
+                    ("SELECT COUNT(*) FROM messages WHERE queue = 'dead'", ())
+                )
+            )
+            return {"queued": queued, "in_flight": in_flight, "dead_letters": dead}
+
+        return await asyncio.to_thread(self._execute, count)
+
+
+def build_ingest_queue(name: str) -> IngestQueue:
+    """Create an ingest queue by name (see INGEST_QUEUE_BACKEND)"""
+    if name == "sqs":
+        return SqsIngestQueue(settings.INGEST_QUEUE_URL, settings.INGEST_DEAD_LETTER_QUEUE_URL)
+    if name == "local":
+        return LocalIngestQueue(settings.INGEST_LOCAL_QUEUE_PATH, settings.INGEST_MAX_RECEIVE_COUNT)
+    raise ValueError(f"Unsupported ingest queue: {name}")
+
+
+# Singleton instance
+ingest_queue = build_ingest_queue(settings.INGEST_QUEUE_BACKEND)
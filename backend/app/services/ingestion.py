@@ -0,0 +1,589 @@
+"""
+Inbound webhook ingestion
+The webhook routes enqueue each raw payload and ack right away; a pool of ingest workers
+drains the queue, turns payloads into customer messages and appends them to the sender's
+open ticket (or opens one). A payload that keeps failing ends up in the dead-letter queue,
+from where it can be replayed once the cause is fixed.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from email.utils import parseaddr
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, NamedTuple, Optional, Set, Tuple, TypeVar
+
+from app.config import settings
+from app.models import Channel, Customer, Source, TicketCreateRequest, TicketPriority
+from app.services.dynamodb import db_service
+from app.services.inbound_email import discard_email
+from app.services.idempotency import CLAIMED, DUPLICATE, IN_PROGRESS, MessageInProgress, webhook_receipts
+from app.services.ingest_queue import IngestMessage, ingest_queue
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Tries at opening a ticket when concurrent writers keep taking the sender's route
+ROUTE_CLAIM_ATTEMPTS = 3
+
+
+class InboundMessage(NamedTuple):
+    """One customer message taken out of a platform payload"""
+    channel: Channel
+    sender_id: str
+    platform_message_id: str
+    text: str
+    subject: str
+    timestamp: str  # When the platform says it was sent (UTC ISO), else when the webhook arrived
+    channel_specific_data: Dict[str, Any]
+    sender_name: Optional[str] = None
+    attachments: Tuple[Dict[str, Any], ...] = ()  # Metadata only; the content is in object storage
+    # Email: Message-IDs this one replies to, most specific first (In-Reply-To, then References newest first)
+    references: Tuple[str, ...] = ()
+
+
+def _sent_at(epoch: Any, per_second: int, received_at: str) -> str:
+    """Platform send time (epoch seconds or milliseconds) as a naive UTC ISO timestamp"""
+    try:
+        return datetime.utcfromtimestamp(int(epoch) / per_second).isoformat()
+    except (TypeError, ValueError):
+        return received_at
+
+
+def _facebook_messages(data: Dict[str, Any], received_at: str) -> List[InboundMessage]:
+    # Facebook sends test events during setup
+    if data.get("object") != "page":
+        return []
+    return [
+        InboundMessage(
+            channel=Channel.FACEBOOK,
+            sender_id=event["sender"]["id"],
+            platform_message_id=event["message"]["mid"],
+            text=event["message"].get("text", ""),
+            subject=f"Facebook message from {event['sender']['id']}",
+            timestamp=_sent_at(event.get("timestamp"), 1000, received_at),
+            channel_specific_data={"facebook_message_id": event["message"]["mid"]}
+        )
+        for entry in data.get("entry", [])
+        for event in entry.get("messaging", [])
+        if "message" in event
+    ]
+
+
+def _whatsapp_messages(data: Dict[str, Any], received_at: str) -> List[InboundMessage]:
+    return [
+        InboundMessage(
+            channel=Channel.WHATSAPP,
+            sender_id=message["from"],
+            platform_message_id=message["id"],
+            text=message.get("text", {}).get("body", ""),
+            subject=f"WhatsApp message from {message['from']}",
+            timestamp=_sent_at(message.get("timestamp"), 1, received_at),
+            channel_specific_data={"whatsapp_message_id": message["id"]}
+        )
+        for entry in data.get("entry", [])
+        for change in entry.get("changes", [])
+        for message in change.get("value", {}).get("messages", [])
+    ]
+
+
+def _twitter_messages(data: Dict[str, Any], received_at: str) -> List[InboundMessage]:
+    return [
+        InboundMessage(
+            channel=Channel.TWITTER,
+            sender_id=event["message_create"]["sender_id"],
+            platform_message_id=event["id"],
+            text=event["message_create"]["message_data"]["text"],
+            subject=f"Twitter DM from {event['message_create']['sender_id']}",
+            timestamp=_sent_at(event.get("created_timestamp"), 1000, received_at),
+            channel_specific_data={"twitter_dm_id": event["id"]}
+        )
+        for event in data.get("direct_message_events", [])
+    ]
+
+
+def _email_messages(data: Dict[str, Any], received_at: str) -> List[InboundMessage]:
+    # Payload built by app.services.inbound_email from the Inbound Parse post
+    name, address = parseaddr(data["from"])
+    if not address:
+        raise ValueError(f"No sender address in {data['from']!r}")
+    address = address.lower()
+    return [InboundMessage(
+        channel=Channel.EMAIL,
+        sender_id=address,
+        platform_message_id=data["message_id"],
+        text=data["text"],
+        subject=data.get("subject") or f"Email from {address}",
+        timestamp=data.get("sent_at") or received_at,
+        channel_specific_data={
+            "email_message_id": data["message_id"],
+            "to": data.get("to"),
+            "cc": data.get("cc"),
+            "bodies": data.get("bodies", {}),
+            "text_truncated": data.get("text_truncated", False)
+        },
+        sender_name=name or None,
+        attachments=tuple(data.get("attachments", [])),
+        references=tuple(dict.fromkeys(data.get("in_reply_to", []) + data.get("references", [])[::-1]))
+    )]
+
+
+# Payload parsers per webhook platform
+PARSERS: Dict[str, Callable[[Dict[str, Any], str], List[InboundMessage]]] = {
+    "facebook": _facebook_messages,
+    "whatsapp": _whatsapp_messages,
+    "twitter": _twitter_messages,
+    "email": _email_messages
+}
+
+
+def parse(envelope: Dict[str, Any]) -> List[InboundMessage]:
+    """Customer messages in an enqueued payload, in payload order"""
+    return PARSERS[envelope["platform"]](envelope["payload"], envelope["received_at"])
+
+
+async def dispatch_ordered(
+    items: List[T],
+    key: Callable[[T], Hashable],
+    handle: Callable[[List[T]], Awaitable[Any]],
+    concurrency: int,
+    batch_size: int = 1
+) -> List[Optional[Exception]]:
+    """
+    Run handle() over items with up to `concurrency` keys in flight at once, strictly in
+    order within a key; each call gets up to batch_size consecutive items of one key.
+    After a failure the rest of that key's items are not attempted (so a retry can't
+    land them ahead of the failed ones) and report the same error.
+    Returns the error for each item in input order, None where it succeeded.
+    """
+    lanes: Dict[Hashable, List[int]] = {}
+    for index, item in enumerate(items):
+        lanes.setdefault(key(item), []).append(index)
+    pending: Deque[List[int]] = deque(lanes.values())
+    errors: List[Optional[Exception]] = [None] * len(items)
+
+    async def worker():
+        while pending:
+            lane = pending.popleft()
+            for start in range(0, len(lane), batch_size):
+                try:
+                    await handle([items[index] for index in lane[start:start + batch_size]])
+                except Exception as e:
+                    for skipped in lane[start:]:
+                        errors[skipped] = e
+                    break
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(lanes)))))
+    return errors
+
+
+class _Burst:
+    def __init__(self, previous: Optional[asyncio.Future]):
+        self.messages: List[InboundMessage] = []
+        # The sender's burst before this one, which has to be written first
+        self.previous = previous
+        self.done = asyncio.get_running_loop().create_future()
+
+
+class BurstCoalescer:
+    """
+    Holds a sender's messages for INGEST_COALESCE_WINDOW_MS after the first one arrives,
+    so a burst of short chat messages becomes one ticket write and one event instead of
+    one each. A burst closes early at INGEST_COALESCE_MAX_MESSAGES. One sender's bursts
+    are written in the order they were opened; if one fails, the bursts queued behind it
+    fail too, so none of them overtakes it when the queue redelivers it.
+    """
+
+    def __init__(self, write: Callable[[List[InboundMessage]], Awaitable[Any]]):
+        self._write = write
+        self._open: Dict[Hashable, _Burst] = {}
+        # Most recent burst per sender, until it is written
+        self._last: Dict[Hashable, asyncio.Future] = {}
+        self._flushes: Set[asyncio.Task] = set()
+        self.bursts_total = 0
+        self.messages_total = 0
+
+    async def add(self, messages: List[InboundMessage]):
+        """Add consecutive messages from one sender; returns (or raises) once they are written"""
+        key = (messages[0].channel, messages[0].sender_id)
+        burst = self._open.get(key)
+        if burst is not None and len(burst.messages) + len(messages) > settings.INGEST_COALESCE_MAX_MESSAGES:
+            self._close(key, burst)
+            burst = None
+        if burst is None:
+            burst = _Burst(self._last.get(key))
+            self._open[key] = burst
+            self._last[key] = burst.done
+            asyncio.get_running_loop().call_later(
+                settings.INGEST_COALESCE_WINDOW_MS / 1000, self._close, key, burst
+            )
+
+        burst.messages.extend(messages)
+        if len(burst.messages) >= settings.INGEST_COALESCE_MAX_MESSAGES:
+            self._close(key, burst)
+        await asyncio.shield(burst.done)
+
+    def _close(self, key: Hashable, burst: _Burst):
+        if self._open.get(key) is not burst:
+            # Already closed by size
+            return
+        del self._open[key]
+        task = asyncio.create_task(self._flush(key, burst))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, key: Hashable, burst: _Burst):
+        failed = None
+        if burst.previous is not None:
+            await asyncio.wait([burst.previous])
+            failed = burst.previous.exception() if not burst.previous.cancelled() else None
+        try:
+            if failed is not None:
+                # The failed burst is retried from the queue; writing this one now would put it first
+                raise RuntimeError(f"An earlier burst from this sender failed: {failed!r}") from failed
+            await self._write(burst.messages)
+        except Exception as e:
+            burst.done.set_exception(e)
+        else:
+            burst.done.set_result(None)
+            self.bursts_total += 1
+            self.messages_total += len(burst.messages)
+        finally:
+            if self._last.get(key) is burst.done:
+                del self._last[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": settings.INGEST_COALESCE_WINDOW_MS,
+            "open_bursts": len(self._open),
+            "bursts_total": self.bursts_total,
+            "messages_total": self.messages_total,
+            "messages_per_write": round(self.messages_total / self.bursts_total, 2) if self.bursts_total else 0.0
+        }
+
+
+class WebhookIngestion:
+    def __init__(self):
+        self.accepted_total = 0
+        self.processed_total = 0
+        self.failed_total = 0
+        self.last_processed_at: str = None
+        self.coalescer = BurstCoalescer(self.write_burst)
+
+    async def accept(self, platform: str, payload: Dict[str, Any]) -> Optional[str]:
+        """
+        Take a webhook payload. In "queue" mode it is enqueued as received and the
+        queue message ID returned; in "inline" mode it is processed before returning.
+        """
+        if platform not in PARSERS:
+            raise ValueError(f"Unsupported webhook platform: {platform}")
+
+        envelope = {"platform": platform, "received_at": datetime.utcnow().isoformat(), "payload": payload}
+        if settings.WEBHOOK_INGEST_MODE == "inline":
+            await self.process(envelope)
+            return None
+
+        message_id = await ingest_queue.send(envelope)
+        self.accepted_total += 1
+        return message_id
+
+    async def create_ticket(
+        self,
+        ticket_request: TicketCreateRequest,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        claim_route: bool = False,
+        stale_route_ticket_id: Optional[str] = None
+    ):
+        """
+        Open a ticket for a webhook sender, creating the customer record if needed.
+        The timeline starts with `messages` (customer messages, oldest first) if given,
+        otherwise with the request's initial_message. With claim_route, returns None if
+        another ticket took the sender's route first (see db_service.create_ticket).
+        """
+        customer_data = await db_service.get_or_create_customer(
+            channel_identity=ticket_request.customer.channel_identity,
+            channel=ticket_request.source.channel,
+            name=ticket_request.customer.name,
+            primary_email=ticket_request.customer.primary_email
+        )
+
+        ticket_data = {
+            "status": "new",
+            "priority": ticket_request.priority,
+            "tags": ticket_request.tags,
+            "source": ticket_request.source.dict(),
+            "customer": {
+                "internal_id": customer_data["internal_id"],
+                "name": customer_data.get("name"),
+                "primary_email": customer_data.get("primary_email"),
+                "channel_identity": customer_data["channel_identity"]
+            },
+            "subject": ticket_request.subject,
+            "timeline": messages or [{
+                "sender_type": "customer",
+                "content": ticket_request.initial_message,
+                "content_type": "text",
+                "visibility": "public"
+            }]
+        }
+
+        return await db_service.create_ticket(ticket_data, claim_route, stale_route_ticket_id)
+
+    @staticmethod
+    def _message(inbound: InboundMessage) -> Dict[str, Any]:
+        message = {
+            "sender_type": "customer",
+            "content": inbound.text,
+            "content_type": "text",
+            "visibility": "public",
+            "timestamp": inbound.timestamp,
+            "channel_specific_data": inbound.channel_specific_data
+        }
+        if inbound.attachments:
+            message["attachments"] = list(inbound.attachments)
+        return message
+
+    async def _append_or_open(self, burst: List[InboundMessage]) -> str:
+        """
+        Append to the sender's active ticket in one write, or open a new one; returns the ticket ID.
+        An email goes to the ticket of the thread it replies to, found by its headers, if
+        that ticket is the sender's.
+        Two workers opening a ticket for one sender at once race on the sender's route:
+        the loser re-reads it and appends to the winner's ticket.
+        """
+        first = burst[0]
+        messages = [self._message(inbound) for inbound in burst]
+        is_email = first.channel == Channel.EMAIL
+
+        customer_id = None
+        if is_email and first.references:
+            customer = await db_service.get_or_create_customer(
+                channel_identity=first.sender_id,
+                channel=first.channel,
+                name=first.sender_name,
+                primary_email=first.sender_id
+            )
+            customer_id = customer["internal_id"]
+
+        for _ in range(ROUTE_CLAIM_ATTEMPTS):
+            if is_email:
+                ticket_id = await db_service.find_email_thread(list(first.references), customer_id)
+            else:
+                ticket_id = await db_service.find_active_ticket_id(first.channel, first.sender_id)
+            if ticket_id:
+                added = await db_service.add_messages_to_ticket(ticket_id, messages)
+                if added is not None:
+                    return ticket_id
+
+            ticket = await self.create_ticket(
+                TicketCreateRequest(
+                    source=Source(
+                        channel=first.channel,
+                        # Replies to an email ticket reference its first email, so the customer's answers thread back
+                        origin_platform_id=first.platform_message_id if is_email else first.sender_id,
+                        is_bot_handoff=False
+                    ),
+                    customer=Customer(
+                        internal_id="",
+                        name=first.sender_name,
+                        primary_email=first.sender_id if is_email else None,
+                        channel_identity=first.sender_id
+                    ),
+                    subject=first.subject,
+                    initial_message=first.text,
+                    priority=TicketPriority.MEDIUM
+                ),
+                messages,
+                # Email threads by headers, not by the sender's route
+                claim_route=not is_email,
+                stale_route_ticket_id=None if is_email else ticket_id
+            )
+            if ticket is not None:
+                return ticket.ticket_id
+
+        raise RuntimeError(
+            f"Route for {first.channel.value} sender {first.sender_id} changed concurrently {ROUTE_CLAIM_ATTEMPTS} times"
+        )
+
+    async def _index_email_threads(self, burst: List[InboundMessage], ticket_id: str):
+        """Record each email's Message-ID, so replies to it find the ticket"""
+        for inbound in burst:
+            try:
+                await db_service.put_email_thread(inbound.platform_message_id, ticket_id)
+            except Exception as e:
+                # Replies usually also reference earlier emails in the thread (References header)
+                logger.warning(f"Could not index email {inbound.platform_message_id} on {ticket_id}: {e}")
+
+    @staticmethod
+    async def _discard_stored(dropped: List[InboundMessage]):
+        """
+        Remove what a dropped redelivery stored. Every email post is stored under its own
+        prefix, so this never touches the objects of the copy that was processed.
+        """
+        for inbound in dropped:
+            if inbound.channel == Channel.EMAIL:
+                await discard_email({
+                    "bodies": inbound.channel_specific_data.get("bodies", {}),
+                    "attachments": list(inbound.attachments)
+                })
+
+    async def write_burst(self, burst: List[InboundMessage]):
+        """
+        Record consecutive messages from one sender, skipping redeliveries of ones already
+        handled. Raises MessageInProgress if another worker holds one of them, so the
+        payload is retried.
+        """
+        # A message redelivered within the burst would find its own claim in progress
+        unique = {}
+        for inbound in burst:
+            unique.setdefault(inbound.platform_message_id, inbound)
+        if len(unique) < len(burst):
+            logger.info(f"Dropped {len(burst) - len(unique)} duplicate {burst[0].channel.value} messages in a burst")
+            kept = {id(inbound) for inbound in unique.values()}
+            await self._discard_stored([inbound for inbound in burst if id(inbound) not in kept])
+            burst = list(unique.values())
+
+        claims = await asyncio.gather(*(
+            webhook_receipts.claim(inbound.channel, inbound.platform_message_id) for inbound in burst
+        ))
+        fresh = [inbound for inbound, claim in zip(burst, claims) if claim == CLAIMED]
+        held = [inbound for inbound, claim in zip(burst, claims) if claim == IN_PROGRESS]
+        if held:
+            # Writing the rest now could put them ahead of the held message; retry the lot instead
+            await asyncio.gather(*(
+                webhook_receipts.release(inbound.channel, inbound.platform_message_id) for inbound in fresh
+            ))
+            raise MessageInProgress(
+                f"{held[0].channel.value} message {held[0].platform_message_id} is being processed by another worker"
+            )
+        duplicates = [inbound for inbound, claim in zip(burst, claims) if claim == DUPLICATE]
+        for inbound in duplicates:
+            logger.info(f"Dropped duplicate {inbound.channel.value} message {inbound.platform_message_id}")
+        await self._discard_stored(duplicates)
+        if not fresh:
+            return
+
+        # Each email threads by its own headers, so one sender's emails can go to different tickets
+        groups = [[inbound] for inbound in fresh] if fresh[0].channel == Channel.EMAIL else [fresh]
+        for position, group in enumerate(groups):
+            try:
+                ticket_id = await self._append_or_open(group)
+            except Exception:
+                await asyncio.gather(*(
+                    webhook_receipts.release(inbound.channel, inbound.platform_message_id)
+                    for unwritten in groups[position:] for inbound in unwritten
+                ))
+                raise
+            if group[0].channel == Channel.EMAIL:
+                await self._index_email_threads(group, ticket_id)
+            await asyncio.gather(*(
+                webhook_receipts.complete(inbound.channel, inbound.platform_message_id, ticket_id) for inbound in group
+            ))
+
+    async def process(self, envelope: Dict[str, Any]) -> int:
+        """Handle every message in one payload right away; returns how many there were"""
+        inbound = parse(envelope)
+        errors = await dispatch_ordered(
+            inbound,
+            lambda message: (message.channel, message.sender_id),
+            self.write_burst,
+            settings.INGEST_DISPATCH_CONCURRENCY,
+            settings.INGEST_COALESCE_MAX_MESSAGES
+        )
+        failed = next((error for error in errors if error is not None), None)
+        if failed is not None:
+            raise failed
+        return len(inbound)
+
+    async def process_messages(self, messages: List[IngestMessage]) -> List[bool]:
+        """
+        Process a batch of queue messages together: different senders run concurrently,
+        each sender's messages in queue order, coalesced into bursts. Returns per-message
+        success; a failed message is left to be redelivered (and eventually dead-lettered).
+        """
+        items: List[Tuple[int, InboundMessage]] = []
+        ok = [True] * len(messages)
+        for position, message in enumerate(messages):
+            try:
+                inbound = parse(message.body)
+            except Exception as e:
+                ok[position] = False
+                logger.error(f"Ingest payload {message.message_id} could not be parsed: {e!r}")
+                continue
+            items.extend((position, item) for item in inbound)
+
+        errors = await dispatch_ordered(
+            items,
+            lambda item: (item[1].channel, item[1].sender_id),
+            self._write_batch,
+            settings.INGEST_DISPATCH_CONCURRENCY,
+            settings.INGEST_COALESCE_MAX_MESSAGES
+        )
+        for (position, _), error in zip(items, errors):
+            if error is not None and ok[position]:
+                ok[position] = False
+                message = messages[position]
+                logger.error(
+                    f"Ingest of {message.body.get('platform')} payload {message.message_id} failed "
+                    f"(receive {message.receive_count}): {error!r}"
+                )
+
+        succeeded = sum(ok)
+        self.processed_total += succeeded
+        self.failed_total += len(messages) - succeeded
+        if succeeded:
+            self.last_processed_at = datetime.utcnow().isoformat()
+        return ok
+
+    async def _write_batch(self, batch: List[Tuple[int, InboundMessage]]):
+        burst = [inbound for _, inbound in batch]
+        if burst[0].channel == Channel.EMAIL:
+            # Emails don't come in bursts worth holding back for
+            await self.write_burst(burst)
+        else:
+            await self.coalescer.add(burst)
+
+    async def _worker(self):
+        while True:
+            try:
+                messages = await ingest_queue.receive(
+                    settings.INGEST_RECEIVE_BATCH_SIZE,
+                    settings.INGEST_RECEIVE_WAIT_SECONDS,
+                    settings.INGEST_VISIBILITY_TIMEOUT_SECONDS
+                )
+            except Exception as e:
+                logger.error(f"Ingest queue receive failed: {e}")
+                await asyncio.sleep(settings.INGEST_RECEIVE_WAIT_SECONDS)
+                continue
+
+            if not messages:
+                continue
+            results = await self.process_messages(messages)
+            await asyncio.gather(*(
+                ingest_queue.delete(message.receipt) for message, ok in zip(messages, results) if ok
+            ))
+
+    async def run_forever(self):
+        """INGEST_WORKERS receive loops sharing the queue"""
+        logger.info(f"Ingest worker started ({settings.INGEST_WORKERS} workers, {ingest_queue.name} queue)")
+        await asyncio.gather(*(self._worker() for _ in range(settings.INGEST_WORKERS)))
+
+    async def stats(self) -> Dict[str, Any]:
+        queue = {}
+        if settings.WEBHOOK_INGEST_MODE == "queue":
+            queue = {"queue": ingest_queue.name, **await ingest_queue.depth()}
+        return {
+            "mode": settings.WEBHOOK_INGEST_MODE,
+            **queue,
+            "accepted_total": self.accepted_total,
+            "processed_total": self.processed_total,
+            "failed_total": self.failed_total,
+            "last_processed_at": self.last_processed_at,
+            "deduplication": webhook_receipts.stats(),
+            "coalescing": self.coalescer.stats()
+        }
+
+
+# Singleton instance
+webhook_ingestion = WebhookIngestion()
@@ -1,129 +1,167 @@
 """
-Kafka producer for publishing ticket events
-Using aiokafka for async Python 3.12+ compatibility
+Producer for ticket events
+Publishes through the configured event transport (Kafka via aiokafka, or a local
+in-memory / file log transport for development and load tests)
 """
 
-import json
+import asyncio
 import logging
-from typing import Dict, Any, Optional
+import time
+from typing import Dict, Any, List, Optional, Tuple
 from app.config import settings
+from app.services.event_transport import EventTransport, event_transport
 
 logger = logging.getLogger(__name__)
 
-# Import aiokafka only if available, for development without Kafka
-try:
-    from aiokafka import AIOKafkaProducer
-    KAFKA_AVAILABLE = True
-except ImportError:
-    KAFKA_AVAILABLE = False
-    logger.warning("aiokafka not available, Kafka events will be mocked")
-
 
 class TicketEventProducer:
-    def __init__(self):
-        self.producer: Optional[Any] = None
+    def __init__(self, transport: EventTransport):
+        self.transport = transport
+        # The started transport, or None while it is unavailable
+        self.producer: Optional[EventTransport] = None
         self._started = False
+        self._retry_start_at = 0.0
+        # Concurrent first publishes would otherwise each start the transport (and a flusher)
+        self._start_lock = asyncio.Lock()
+        self.buffered = settings.KAFKA_PUBLISH_MODE == "buffered"
+        # Buffered mode: (topic, event) pairs waiting for the background flusher
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
 
     async def _ensure_started(self):
-        """Lazy initialization of Kafka producer"""
-        if self._started:
-            return
-
-        if not KAFKA_AVAILABLE:
-            logger.warning("Kafka not available, skipping initialization")
-            self._started = True
+        """Lazy initialization of the event transport"""
+        if self._started or time.monotonic() < self._retry_start_at:
             return
 
-        if not settings.KAFKA_BOOTSTRAP_SERVERS:
-            logger.warning("Kafka bootstrap servers not configured")
-            self._started = True
+        async with self._start_lock:
+            # Whoever held the lock may have started it (or failed and set the backoff)
+            if self._started or time.monotonic() < self._retry_start_at:
+                return
+
+            try:
+                if not await self.transport.start():
+                    # Not configured: stay a no-op
+                    self._started = True
+                    return
+                self.producer = self.transport
+                if self.buffered:
+                    self._queue = asyncio.Queue(maxsize=settings.KAFKA_BUFFER_MAX_EVENTS)
+                    self._flusher = asyncio.create_task(self._flush_loop())
+                logger.info(f"Event producer initialized ({self.transport.name} transport)")
+                self._started = True
+            except Exception as e:
+                # Leave _started unset so a later call retries, but not more often than the backoff
+                logger.error(f"Failed to initialize event transport: {e}")
+                self.producer = None
+                self._retry_start_at = time.monotonic() + settings.KAFKA_START_RETRY_SECONDS
+
+    async def publish_events(self, batch: List[Tuple[str, Dict[str, Any]]]):
+        """
+        Publish (topic, event) pairs built by app.services.events.
+        Buffered mode enqueues them for the flusher; sync mode sends them all and
+        awaits the acknowledgements together.
+        """
+        if not batch:
             return
 
-        try:
-            self.producer = AIOKafkaProducer(
-                bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS.split(","),
-                value_serializer=lambda v: json.dumps(v).encode('utf-8'),
-                security_protocol="SSL",  # AWS MSK requires SSL
-            )
-            await self.producer.start()
-            logger.info("Kafka producer initialized successfully")
-            self._started = True
-        except Exception as e:
-            logger.error(f"Failed to initialize Kafka producer: {e}")
-            self.producer = None
-            self._started = True
-
-    async def publish_ticket_created(self, ticket_data: Dict[str, Any]):
-        """Publish ticket creation event"""
         await self._ensure_started()
-
         if not self.producer:
-            logger.debug("Kafka producer not available, skipping event publish")
+            logger.debug("Event transport not available, skipping event publish")
             return
 
-        event = {
-            "event_type": "ticket.created",
-            "ticket_id": ticket_data["ticket_id"],
-            "customer_id": ticket_data["customer"]["internal_id"],
-            "status": ticket_data["status"],
-            "priority": ticket_data["priority"],
-            "source": ticket_data["source"]["channel"],
-            "timestamp": ticket_data["created_at"]
-        }
-
-        try:
-            await self.producer.send_and_wait(settings.KAFKA_TOPIC_TICKETS, value=event)
-            logger.info(f"Published ticket.created event for {ticket_data['ticket_id']}")
-        except Exception as e:
-            logger.error(f"Failed to publish ticket.created event: {e}")
-
-    async def publish_message_added(self, ticket_id: str, message_data: Dict[str, Any]):
-        """Publish new message event"""
-        await self._ensure_started()
-
-        if not self.producer:
-            logger.debug("Kafka producer not available, skipping event publish")
+        if self.buffered:
+            for topic, event in batch:
+                await self._enqueue(topic, event)
             return
 
-        event = {
-            "event_type": "message.added",
-            "ticket_id": ticket_id,
-            "message_id": message_data["message_id"],
-            "sender_type": message_data["sender_type"],
-            "timestamp": message_data["timestamp"]
-        }
-
-        try:
-            await self.producer.send_and_wait(settings.KAFKA_TOPIC_MESSAGES, value=event)
-            logger.info(f"Published message.added event for ticket {ticket_id}")
-        except Exception as e:
-            logger.error(f"Failed to publish message.added event: {e}")
-
-    async def publish_ticket_updated(self, ticket_id: str, updates: Dict[str, Any]):
-        """Publish ticket update event"""
+        await self._send_batch(batch)
+
+    # Delivery
+    async def _send_batch(self, batch: List[Tuple[str, Dict[str, Any]]]) -> List[bool]:
+        """Send events and await all acks together; returns per-event success in input order"""
+        results = await self.producer.send_batch(batch)
+
+        failed = results.count(False)
+        if failed:
+            logger.error(f"Failed to publish {failed} of {len(results)} events")
+        else:
+            logger.debug(f"Published batch of {len(results)} events")
+        return results
+
+    async def deliver(self, batch: List[Tuple[str, Dict[str, Any]]]) -> List[bool]:
+        """
+        Send events straight to the broker and report which were acknowledged.
+        Used by the outbox relay; bypasses buffering.
+        """
         await self._ensure_started()
-
         if not self.producer:
+            return [False] * len(batch)
+        return await self._send_batch(batch)
+
+    async def _enqueue(self, topic: str, event: Dict[str, Any]):
+        """
+        Hand an event to the background flusher.
+        Blocks (backpressure) while the buffer is full, up to KAFKA_ENQUEUE_TIMEOUT_SECONDS.
+        """
+        try:
+            # Fast path; wait_for costs a task per call, so only pay it when the buffer is full
+            self._queue.put_nowait((topic, event))
             return
-
-        event = {
-            "event_type": "ticket.updated",
-            "ticket_id": ticket_id,
-            "updates": updates,
-            "timestamp": updates.get("updated_at")
-        }
+        except asyncio.QueueFull:
+            pass
 
         try:
-            await self.producer.send_and_wait(settings.KAFKA_TOPIC_TICKETS, value=event)
-            logger.info(f"Published ticket.updated event for {ticket_id}")
-        except Exception as e:
-            logger.error(f"Failed to publish ticket.updated event: {e}")
+            await asyncio.wait_for(
+                self._queue.put((topic, event)),
+                timeout=settings.KAFKA_ENQUEUE_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"Kafka buffer full, dropping {event['event_type']} event for {event['ticket_id']}")
+
+    async def _flush_loop(self):
+        """Drain the buffer in batches of up to KAFKA_BATCH_MAX_EVENTS, lingering briefly to fill them"""
+        linger = settings.KAFKA_LINGER_MS / 1000
+        while True:
+            batch = [await self._queue.get()]
+            deadline = asyncio.get_running_loop().time() + linger
+
+            while len(batch) < settings.KAFKA_BATCH_MAX_EVENTS:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._send_batch(batch)
+            except Exception as e:
+                logger.error(f"Kafka flush failed for {len(batch)} events: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def flush(self):
+        """Wait until every buffered event has been handed to the broker"""
+        if self._queue is not None and self._flusher is not None and not self._flusher.done():
+            await self._queue.join()
 
     async def close(self):
-        """Close producer connection"""
+        """Flush buffered events and close producer connection"""
+        await self.flush()
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
         if self.producer:
             await self.producer.stop()
 
 
 # Singleton instance
-kafka_producer = TicketEventProducer()
+kafka_producer = TicketEventProducer(event_transport)
@@ -1,22 +1,344 @@
 """
 Outbound messaging service
-Routes agent replies back to the original channel
+Routes agent replies back to the original channel through a registry of channel
+adapters, each behind its own circuit breaker and concurrency limit
 """
 
+import asyncio
 import boto3
+import importlib.util
 import logging
-from typing import Dict, Any
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Any, List, NamedTuple, Optional
 import httpx
 from app.config import settings
 from app.models import Channel
 
 logger = logging.getLogger(__name__)
 
+# HTTP/2 needs the optional h2 package (pip install httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Provider connection pools: name -> (base URL, speaks HTTP/2).
+# Messenger and WhatsApp both go through the Graph API and share its pool.
+PROVIDERS = {
+    "sendgrid": ("https://api.sendgrid.com", False),
+    "graph": ("https://graph.facebook.com", True),
+    "twitter": ("https://api.twitter.com", True),
+}
+
+# Recipients per SendGrid mail/send request
+SENDGRID_MAX_PERSONALIZATIONS = 1000
+
+# Graph API throttling errors, which come back as HTTP 400 rather than 429
+GRAPH_RATE_LIMIT_CODES = {4, 17, 32, 613, 80007, 130429, 131056}
+
+
+class SendResult(NamedTuple):
+    """Outcome of one provider call"""
+    success: bool
+    retryable: bool = False  # Throttled, server error or network failure: worth another attempt
+    retry_after: Optional[float] = None  # Seconds the provider asked us to wait
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    shed: bool = False  # Rejected locally (circuit open or channel saturated); nothing was sent
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Retry-After (seconds or HTTP date), falling back to Twitter's x-rate-limit-reset epoch"""
+    now = datetime.now(timezone.utc)
+    value = response.headers.get("Retry-After")
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max((parsedate_to_datetime(value) - now).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+    reset = response.headers.get("x-rate-limit-reset")
+    if reset and response.status_code == 429:
+        try:
+            return max(float(reset) - now.timestamp(), 0.0)
+        except ValueError:
+            return None
+    return None
+
+
+def _failure(response: httpx.Response, rate_limit_codes=frozenset()) -> SendResult:
+    """Classify an error response"""
+    status = response.status_code
+    retryable = status in (408, 429) or status >= 500
+    if not retryable and rate_limit_codes:
+        try:
+            code = response.json().get("error", {}).get("code")
+        except ValueError:
+            code = None
+        retryable = code in rate_limit_codes
+    return SendResult(False, retryable, _retry_after(response), f"HTTP {status}: {response.text[:500]}", status)
+
+
+def _provider_unhealthy(result: SendResult) -> bool:
+    """Outcomes that count against a circuit breaker: server errors, timeouts and connection failures.
+    Throttling and client errors mean the provider is up and answering."""
+    return (not result.success and result.retryable
+            and (result.status_code is None or result.status_code >= 500))
+
+
+SendFn = Callable[[str, str, Optional[str]], Awaitable[SendResult]]
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive provider failures and rejects calls
+    instantly for reset_seconds; then lets a single trial call through, whose
+    outcome closes it again or reopens it
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_total = 0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.state = self.HALF_OPEN
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def release(self):
+        """The allowed call never reached the provider; let another trial through"""
+        self._trial_in_flight = False
+
+    def record(self, healthy: bool):
+        self._trial_in_flight = False
+        if healthy:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            return
+
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            logger.warning(f"Circuit for {self.name} opened after {self.failures} consecutive failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.opened_total += 1
+
+    def retry_in(self) -> float:
+        """Seconds until the breaker lets a trial call through"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(self.opened_at + self.reset_seconds - time.monotonic(), 0.0)
+
+
+class LatencyStats:
+    """Call outcomes and a window of recent call latencies"""
+
+    def __init__(self, window: int):
+        self._samples: deque = deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+
+    def record(self, seconds: float, success: bool):
+        self._samples.append(seconds)
+        self.calls += 1
+        if not success:
+            self.failures += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = sorted(self._samples)
+
+        def percentile(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(int(p * len(samples)), len(samples) - 1)] * 1000, 2)
+
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(samples[-1] * 1000, 2) if samples else None
+        }
+
+
+class ChannelAdapter:
+    """A channel's send function behind its own circuit breaker, concurrency limit and latency stats"""
+
+    def __init__(self, channel: Channel, send: SendFn, max_concurrency: int):
+        self.channel = channel
+        self._send = send
+        self.max_concurrency = max_concurrency
+        self.breaker = CircuitBreaker(
+            channel.value,
+            settings.MESSAGING_BREAKER_FAILURE_THRESHOLD,
+            settings.MESSAGING_BREAKER_RESET_SECONDS
+        )
+        self.latency = LatencyStats(settings.MESSAGING_LATENCY_WINDOW)
+        self.rejected = 0  # Circuit open
+        self.shed = 0  # No free slot within MESSAGING_QUEUE_TIMEOUT_SECONDS
+        self.in_flight = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _acquire_slot(self) -> bool:
+        loop = asyncio.get_running_loop()
+        if self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._slots_loop = loop
+
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return True
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=settings.MESSAGING_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def send(self, recipient_id: str, message: str, origin_platform_id: str = None) -> SendResult:
+        return await self.run(self._send, recipient_id, message, origin_platform_id)
+
+    async def run(self, send: Callable[..., Awaitable[SendResult]], *args) -> SendResult:
+        """Make one provider call through this channel's breaker, concurrency limit and stats"""
+        if not self.breaker.allow():
+            self.rejected += 1
+            return SendResult(
+                False, retryable=True, retry_after=self.breaker.retry_in(),
+                error=f"{self.channel.value} circuit open", shed=True
+            )
+        if not await self._acquire_slot():
+            self.breaker.release()
+            self.shed += 1
+            return SendResult(False, retryable=True, error=f"{self.channel.value} at its concurrency limit", shed=True)
+
+        result = None
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            result = await self._call(send, *args)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            if result is None:
+                # Cancelled mid-call
+                self.breaker.release()
+
+        self.latency.record(time.perf_counter() - started, result.success)
+        self.breaker.record(not _provider_unhealthy(result))
+        return result
+
+    async def _call(self, send: Callable[..., Awaitable[SendResult]], *args) -> SendResult:
+        try:
+            return await send(*args)
+        except httpx.TransportError as e:
+            # Connect failures and timeouts; a timed-out send may still have gone through
+            logger.error(f"Failed to send message via {self.channel.value}: {type(e).__name__} {e}")
+            return SendResult(False, retryable=True, error=f"{type(e).__name__}: {e}")
+        except Exception as e:
+            logger.error(f"Failed to send message via {self.channel.value}: {e}")
+            return SendResult(False, error=str(e))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuit": self.breaker.state,
+            "circuit_retry_in_seconds": round(self.breaker.retry_in(), 3),
+            "circuit_opened_total": self.breaker.opened_total,
+            "consecutive_failures": self.breaker.failures,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            **self.latency.snapshot()
+        }
+
 
 class MessagingService:
     def __init__(self):
         self.secrets_client = boto3.client('secretsmanager', region_name=settings.AWS_REGION)
         self._secrets_cache = {}
+        # Long-lived clients, one per provider, bound to the event loop that created them
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._clients_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._adapters: Dict[Channel, ChannelAdapter] = {}
+        self.register_adapter(Channel.EMAIL, self._send_email)
+        self.register_adapter(Channel.FACEBOOK, self._send_facebook_message)
+        self.register_adapter(Channel.WHATSAPP, self._send_whatsapp_message)
+        self.register_adapter(Channel.TWITTER, self._send_twitter_dm)
+        self.register_adapter(Channel.WEB_CHAT, self._send_web_notification)
+
+    def register_adapter(self, channel: Channel, send: SendFn, max_concurrency: int = None) -> ChannelAdapter:
+        """Route a channel's messages through send(recipient_id, message, origin_platform_id)"""
+        adapter = ChannelAdapter(channel, send, max_concurrency or settings.MESSAGING_MAX_IN_FLIGHT)
+        self._adapters[channel] = adapter
+        return adapter
+
+    def adapter_stats(self) -> Dict[str, Any]:
+        return {channel.value: adapter.stats() for channel, adapter in self._adapters.items()}
+
+    def _client(self, provider: str) -> httpx.AsyncClient:
+        """
+        Pooled client for a provider, created on first use.
+        Connections are kept alive between sends (and across warm Lambda invocations),
+        so a reply costs one round trip instead of a TCP and TLS handshake each time.
+        """
+        loop = asyncio.get_running_loop()
+        if self._clients_loop is not loop:
+            # Connections cannot move between event loops; start fresh pools on this one
+            self._clients = {}
+            self._clients_loop = loop
+
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            base_url, supports_http2 = PROVIDERS[provider]
+            client = httpx.AsyncClient(
+                base_url=base_url,
+                timeout=httpx.Timeout(
+                    settings.MESSAGING_READ_TIMEOUT_SECONDS,
+                    connect=settings.MESSAGING_CONNECT_TIMEOUT_SECONDS,
+                    pool=settings.MESSAGING_POOL_TIMEOUT_SECONDS
+                ),
+                transport=httpx.AsyncHTTPTransport(
+                    http2=supports_http2 and settings.MESSAGING_HTTP2 and HTTP2_AVAILABLE,
+                    limits=httpx.Limits(
+                        max_connections=settings.MESSAGING_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.MESSAGING_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=settings.MESSAGING_KEEPALIVE_EXPIRY_SECONDS
+                    ),
+                    # Retries the connect step only; a request that was sent is never replayed
+                    retries=settings.MESSAGING_CONNECT_RETRIES
+                )
+            )
+            self._clients[provider] = client
+        return client
+
+    async def close(self):
+        """Close the provider connection pools (server shutdown)"""
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
 
     async def _get_secret(self, secret_name: str) -> str:
         """Retrieve secret from AWS Secrets Manager with caching"""
@@ -43,160 +365,182 @@ class MessagingService:
         Route message to appropriate channel
         Returns True if successful
         """
-        try:
-            if channel == Channel.EMAIL:
-                return await self._send_email(recipient_id, message)
-            elif channel == Channel.FACEBOOK:
-                return await self._send_facebook_message(recipient_id, message)
-            elif channel == Channel.WHATSAPP:
-                return await self._send_whatsapp_message(recipient_id, message)
-            elif channel == Channel.TWITTER:
-                return await self._send_twitter_dm(recipient_id, message, origin_platform_id)
-            elif channel == Channel.WEB_CHAT:
-                return await self._send_web_notification(recipient_id, message)
-            else:
-                logger.error(f"Unsupported channel: {channel}")
-                return False
+        return (await self.send(channel, recipient_id, message, origin_platform_id)).success
 
-        except Exception as e:
-            logger.error(f"Failed to send message via {channel}: {e}")
-            return False
+    async def send(
+        self,
+        channel: Channel,
+        recipient_id: str,
+        message: str,
+        origin_platform_id: str = None
+    ) -> SendResult:
+        """Route message to appropriate channel, reporting whether a failure is worth retrying"""
+        adapter = self._adapters.get(channel)
+        if adapter is None:
+            logger.error(f"Unsupported channel: {channel}")
+            return SendResult(False, error=f"Unsupported channel: {channel}")
+        return await adapter.send(recipient_id, message, origin_platform_id)
+
+    async def send_email_batch(self, emails: List[str], message: str, subject: str = None) -> SendResult:
+        """
+        Send one email body to many recipients in a single SendGrid request (one
+        personalization each, so recipients don't see each other), through the email adapter
+        """
+        if len(emails) > SENDGRID_MAX_PERSONALIZATIONS:
+            raise ValueError(f"SendGrid accepts at most {SENDGRID_MAX_PERSONALIZATIONS} recipients per request")
+        return await self._adapters[Channel.EMAIL].run(self._send_email_batch, emails, message, subject)
 
-    async def _send_email(self, email: str, message: str) -> bool:
-        """Send email via SendGrid"""
+    async def _send_email(self, email: str, message: str, origin_platform_id: str = None) -> SendResult:
+        """Send email via SendGrid; on tickets opened by email, as a reply to the first email"""
+        headers = None
+        if origin_platform_id and origin_platform_id.startswith("<"):
+            # The customer's answer references it, which threads it back onto the ticket
+            headers = {"In-Reply-To": origin_platform_id, "References": origin_platform_id}
+        return await self._send_email_batch([email], message, headers=headers)
+
+    async def _send_email_batch(
+        self,
+        emails: List[str],
+        message: str,
+        subject: str = None,
+        headers: Dict[str, str] = None
+    ) -> SendResult:
         sendgrid_key = await self._get_secret(settings.SENDGRID_API_KEY_SECRET)
 
         if not sendgrid_key:
             logger.warning("SendGrid API key not configured")
-            return False
+            return SendResult(False, error="SendGrid API key not configured")
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.sendgrid.com/v3/mail/send",
-                headers={
-                    "Authorization": f"Bearer {sendgrid_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "personalizations": [{
-                        "to": [{"email": email}]
-                    }],
-                    "from": {"email": settings.FROM_EMAIL},
-                    "subject": "Response from Support Team",
-                    "content": [{
-                        "type": "text/plain",
-                        "value": message
-                    }]
-                }
-            )
+        mail = {
+            "personalizations": [
+                {"to": [{"email": email}]} for email in emails
+            ],
+            "from": {"email": settings.FROM_EMAIL},
+            "subject": subject or "Response from Support Team",
+            "content": [{
+                "type": "text/plain",
+                "value": message
+            }]
+        }
+        if headers:
+            mail["headers"] = headers
+
+        response = await self._client("sendgrid").post(
+            "/v3/mail/send",
+            headers={
+                "Authorization": f"Bearer {sendgrid_key}",
+                "Content-Type": "application/json"
+            },
+            json=mail
+        )
 
-            if response.status_code == 202:
-                logger.info(f"Email sent successfully to {email}")
-                return True
+        if response.status_code == 202:
+            if len(emails) == 1:
+                logger.info(f"Email sent successfully to {emails[0]}")
             else:
-                logger.error(f"SendGrid error: {response.status_code} - {response.text}")
-                return False
+                logger.info(f"Email sent successfully to {len(emails)} recipients")
+            return SendResult(True)
+        else:
+            logger.error(f"SendGrid error: {response.status_code} - {response.text}")
+            return _failure(response)
 
-    async def _send_facebook_message(self, recipient_id: str, message: str) -> bool:
+    async def _send_facebook_message(self, recipient_id: str, message: str, origin_platform_id: str = None) -> SendResult:
         """Send message via Facebook Messenger API"""
         fb_token = await self._get_secret(settings.FACEBOOK_PAGE_ACCESS_TOKEN_SECRET)
 
         if not fb_token:
             logger.warning("Facebook token not configured")
-            return False
+            return SendResult(False, error="Facebook token not configured")
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://graph.facebook.com/v18.0/me/messages",
-                params={"access_token": fb_token},
-                json={
-                    "recipient": {"id": recipient_id},
-                    "message": {"text": message}
-                }
-            )
+        response = await self._client("graph").post(
+            "/v18.0/me/messages",
+            params={"access_token": fb_token},
+            json={
+                "recipient": {"id": recipient_id},
+                "message": {"text": message}
+            }
+        )
 
-            if response.status_code == 200:
-                logger.info(f"Facebook message sent to {recipient_id}")
-                return True
-            else:
-                logger.error(f"Facebook API error: {response.status_code} - {response.text}")
-                return False
+        if response.status_code == 200:
+            logger.info(f"Facebook message sent to {recipient_id}")
+            return SendResult(True)
+        else:
+            logger.error(f"Facebook API error: {response.status_code} - {response.text}")
+            return _failure(response, GRAPH_RATE_LIMIT_CODES)
 
-    async def _send_whatsapp_message(self, phone_number: str, message: str) -> bool:
+    async def _send_whatsapp_message(self, phone_number: str, message: str, origin_platform_id: str = None) -> SendResult:
         """Send message via WhatsApp Business API"""
         wa_token = await self._get_secret(settings.WHATSAPP_API_TOKEN_SECRET)
 
         if not wa_token:
             logger.warning("WhatsApp token not configured")
-            return False
+            return SendResult(False, error="WhatsApp token not configured")
 
         # Using WhatsApp Cloud API
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://graph.facebook.com/v18.0/YOUR_PHONE_NUMBER_ID/messages",
-                headers={
-                    "Authorization": f"Bearer {wa_token}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "messaging_product": "whatsapp",
-                    "to": phone_number,
-                    "type": "text",
-                    "text": {"body": message}
-                }
-            )
+        response = await self._client("graph").post(
+            "/v18.0/YOUR_PHONE_NUMBER_ID/messages",
+            headers={
+                "Authorization": f"Bearer {wa_token}",
+                "Content-Type": "application/json"
+            },
+            json={
+                "messaging_product": "whatsapp",
+                "to": phone_number,
+                "type": "text",
+                "text": {"body": message}
+            }
+        )
 
-            if response.status_code == 200:
-                logger.info(f"WhatsApp message sent to {phone_number}")
-                return True
-            else:
-                logger.error(f"WhatsApp API error: {response.status_code} - {response.text}")
-                return False
+        if response.status_code == 200:
+            logger.info(f"WhatsApp message sent to {phone_number}")
+            return SendResult(True)
+        else:
+            logger.error(f"WhatsApp API error: {response.status_code} - {response.text}")
+            return _failure(response, GRAPH_RATE_LIMIT_CODES)
 
-    async def _send_twitter_dm(self, recipient_id: str, message: str, conversation_id: str = None) -> bool:
+    async def _send_twitter_dm(self, recipient_id: str, message: str, conversation_id: str = None) -> SendResult:
         """Send direct message via Twitter API v2"""
         twitter_token = await self._get_secret(settings.TWITTER_API_KEY_SECRET)
 
         if not twitter_token:
             logger.warning("Twitter token not configured")
-            return False
+            return SendResult(False, error="Twitter token not configured")
 
         # Twitter API v2 DM endpoint
-        async with httpx.AsyncClient() as client:
-            payload = {
-                "event": {
-                    "type": "message_create",
-                    "message_create": {
-                        "target": {"recipient_id": recipient_id},
-                        "message_data": {"text": message}
-                    }
+        payload = {
+            "event": {
+                "type": "message_create",
+                "message_create": {
+                    "target": {"recipient_id": recipient_id},
+                    "message_data": {"text": message}
                 }
             }
+        }
 
-            response = await client.post(
-                "https://api.twitter.com/2/dm_conversations/with/{}/messages".format(recipient_id),
-                headers={
-                    "Authorization": f"Bearer {twitter_token}",
-                    "Content-Type": "application/json"
-                },
-                json=payload
-            )
+        response = await self._client("twitter").post(
+            "/2/dm_conversations/with/{}/messages".format(recipient_id),
+            headers={
+                "Authorization": f"Bearer {twitter_token}",
+                "Content-Type": "application/json"
+            },
+            json=payload
+        )
 
-            if response.status_code in [200, 201]:
-                logger.info(f"Twitter DM sent to {recipient_id}")
-                return True
-            else:
-                logger.error(f"Twitter API error: {response.status_code} - {response.text}")
-                return False
+        if response.status_code in [200, 201]:
+            logger.info(f"Twitter DM sent to {recipient_id}")
+            return SendResult(True)
+        else:
+            logger.error(f"Twitter API error: {response.status_code} - {response.text}")
+            return _failure(response)
 
-    async def _send_web_notification(self, session_id: str, message: str) -> bool:
+    async def _send_web_notification(self, session_id: str, message: str, origin_platform_id: str = None) -> SendResult:
         """
         Send notification for web chat
         This could publish to Kafka or use WebSockets
         """
         # For now, just log - implement based on your web chat architecture
         logger.info(f"Web notification for session {session_id}: {message}")
-        return True
+        return SendResult(True)
 
 
 # Singleton instance
@@ -0,0 +1,252 @@
+"""
+Object storage for inbound email bodies and attachments
+Objects are written as a stream of chunks, so a large attachment is never held in memory
+whole. S3 in production (multipart upload, at most one part buffered per object); a local
+directory with the same interface for running on one box and in tests. Selected by
+OBJECT_STORE_BACKEND; OBJECT_STORE_ENDPOINT_URL points the S3 backend at an S3-compatible
+stand-in (MinIO, moto server) instead of AWS.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from typing import AsyncIterator, Dict, List, Optional
+
+import boto3
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bytes per read when streaming an object back out
+READ_CHUNK_BYTES = 256 * 1024
+
+
+async def _read_chunks(body) -> AsyncIterator[bytes]:
+    """Stream a file-like object (closed at the end) without blocking the event loop"""
+    try:
+        while True:
+            chunk = await asyncio.to_thread(body.read, READ_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        body.close()
+
+
+class ObjectUpload:
+    """An object being written: write() its chunks in order, then complete() or abort()"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.size = 0
+        self._digest = hashlib.sha256()
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        self._digest.update(chunk)
+        await self._write(chunk)
+
+    async def _write(self, chunk: bytes):
+        raise NotImplementedError
+
+    async def complete(self):
+        """Make the object readable under its key"""
+        raise NotImplementedError
+
+    async def abort(self):
+        """Discard what was written; the key is left untouched"""
+        raise NotImplementedError
+
+
+class ObjectStore:
+    """Interface every object store implements"""
+
+    name = ""
+
+    async def open_upload(self, key: str, content_type: str) -> ObjectUpload:
+        raise NotImplementedError
+
+    async def open_read(self, key: str) -> AsyncIterator[bytes]:
+        """The object's bytes, as chunks to iterate over; raises KeyError if there is no such object"""
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def download_url(self, key: str, file_name: Optional[str], expires_seconds: int) -> Optional[str]:
+        """A time-limited URL the client can fetch the object from, or None to stream it through the API"""
+        return None
+
+
+# S3
+class S3ObjectUpload(ObjectUpload):
+    def __init__(self, client, bucket: str, key: str, content_type: str, part_bytes: int):
+        super().__init__(key)
+        self.client = client
+        self.bucket = bucket
+        self.content_type = content_type
+        self.part_bytes = part_bytes
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[Dict] = []
+
+    async def _write(self, chunk: bytes):
+        self._buffer.extend(chunk)
+        if len(self._buffer) >= self.part_bytes:
+            await self._upload_part()
+
+    async def _upload_part(self):
+        if self._upload_id is None:
+            response = await asyncio.to_thread(
+                self.client.create_multipart_upload,
+                Bucket=self.bucket, Key=self.key, ContentType=self.content_type
+            )
+            self._upload_id = response["UploadId"]
+
+        body, self._buffer = bytes(self._buffer), bytearray()
+        part_number = len(self._parts) + 1
+        response = await asyncio.to_thread(
+            self.client.upload_part,
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=part_number, Body=body
+        )
+        self._parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    async def complete(self):
+        if self._upload_id is None:
+            # Smaller than one part: a single put
+            body, self._buffer = bytes(self._buffer), bytearray()
+            await asyncio.to_thread(
+                self.client.put_object,
+                Bucket=self.bucket, Key=self.key, Body=body, ContentType=self.content_type
+            )
+            return
+
+        if self._buffer:
+            await self._upload_part()
+        await asyncio.to_thread(
+            self.client.complete_multipart_upload,
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, MultipartUpload={"Parts": self._parts}
+        )
+
+    async def abort(self):
+        self._buffer = bytearray()
+        if self._upload_id is None:
+            return
+        try:
+            await asyncio.to_thread(
+                self.client.abort_multipart_upload, Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+            )
+        except Exception as e:
+            # The bucket's abort-incomplete-multipart-upload lifecycle rule cleans it up instead
+            logger.warning(f"Could not abort the upload of {self.key}: {e}")
+
+
+class S3ObjectStore(ObjectStore):
+    name = "s3"
+
+    def __init__(self, bucket: str, endpoint_url: str = "", part_bytes: int = 8 * 1024 * 1024):
+        self.bucket = bucket
+        self.part_bytes = part_bytes
+        self.client = boto3.client("s3", region_name=settings.AWS_REGION, endpoint_url=endpoint_url or None)
+
+    async def open_upload(self, key: str, content_type: str) -> ObjectUpload:
+        return S3ObjectUpload(self.client, self.bucket, key, content_type, self.part_bytes)
+
+    async def open_read(self, key: str) -> AsyncIterator[bytes]:
+        try:
+            response = await asyncio.to_thread(self.client.get_object, Bucket=self.bucket, Key=key)
+        except self.client.exceptions.NoSuchKey:
+            raise KeyError(key)
+        return _read_chunks(response["Body"])
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=key)
+
+    async def download_url(self, key: str, file_name: Optional[str], expires_seconds: int) -> Optional[str]:
+        params = {"Bucket": self.bucket, "Key": key}
+        if file_name:
+            quoted = file_name.replace('"', "")
+            params["ResponseContentDisposition"] = f'attachment; filename="{quoted}"'
+        return await asyncio.to_thread(
+            self.client.generate_presigned_url, "get_object", Params=params, ExpiresIn=expires_seconds
+        )
+
+
+# Local directory
+class LocalObjectUpload(ObjectUpload):
+    def __init__(self, path: str, key: str, file):
+        super().__init__(key)
+        self.path = path
+        self._file = file
+
+    async def _write(self, chunk: bytes):
+        await asyncio.to_thread(self._file.write, chunk)
+
+    async def complete(self):
+        # Written under a temporary name, so a reader never sees a partial object
+        await asyncio.to_thread(self._file.close)
+        os.replace(self._file.name, self.path)
+
+    async def abort(self):
+        await asyncio.to_thread(self._file.close)
+        try:
+            os.remove(self._file.name)
+        except FileNotFoundError:
+            pass
+
+
+class LocalObjectStore(ObjectStore):
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+
+    async def open_upload(self, key: str, content_type: str) -> ObjectUpload:
+        path = self._path(key)
+
+        def open_temp():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            return open(f"{path}.{uuid.uuid4().hex}.part", "wb")
+
+        return LocalObjectUpload(path, key, await asyncio.to_thread(open_temp))
+
+    async def open_read(self, key: str) -> AsyncIterator[bytes]:
+        try:
+            file = await asyncio.to_thread(open, self._path(key), "rb")
+        except FileNotFoundError:
+            raise KeyError(key)
+        return _read_chunks(file)
+
+    async def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+def build_object_store(name: str) -> ObjectStore:
+    """Create an object store by name (see OBJECT_STORE_BACKEND)"""
+    if name == "s3":
+        return S3ObjectStore(
+            settings.OBJECT_STORE_BUCKET, settings.OBJECT_STORE_ENDPOINT_URL, settings.OBJECT_STORE_PART_BYTES
+        )
+    if name == "local":
+        return LocalObjectStore(settings.OBJECT_STORE_LOCAL_DIR)
+    raise ValueError(f"Unsupported object store: {name}")
+
+
+# Singleton instance
+object_store = build_object_store(settings.OBJECT_STORE_BACKEND)
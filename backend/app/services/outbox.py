@@ -0,0 +1,163 @@
+"""
+Outbox relay
+Drains events written to the outbox table (in the same transaction as the ticket
+change) to Kafka, each ticket's events in sequence order, deleting each event only after
+the broker acks it. An event the broker keeps rejecting holds back only its own ticket's
+later events, and after OUTBOX_RELAY_MAX_ATTEMPTS it is moved to the shard's dead letters.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Set
+
+from app.config import settings
+from app.services.dynamodb import db_service
+from app.services.kafka_producer import kafka_producer
+
+logger = logging.getLogger(__name__)
+
+
+def _from_dynamodb(value: Any) -> Any:
+    """DynamoDB returns numbers as Decimal, which json can't serialize"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, dict):
+        return {k: _from_dynamodb(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_from_dynamodb(v) for v in value]
+    return value
+
+
+class OutboxRelay:
+    def __init__(self):
+        self.published_total = 0
+        self.failed_total = 0
+        self.dead_lettered_total = 0
+        self.last_run_at: str = None
+
+    async def relay_shard(self, shard: str) -> int:
+        """
+        Publish the next batch from one shard.
+        A ticket's events after an unacknowledged one are kept for the next run, so they
+        never overtake it; other tickets' events go ahead. When a batch ends inside a held
+        ticket, the next batch is read past it.
+        """
+        held: Set[str] = set()
+        failed: List[Dict[str, Any]] = []
+        published = 0
+        after_ticket_id = None
+
+        while True:
+            items = await db_service.read_outbox(shard, settings.OUTBOX_RELAY_BATCH_SIZE, after_ticket_id)
+            if not items:
+                break
+
+            results = await kafka_producer.deliver([
+                (item["topic"], _from_dynamodb(item["event"])) for item in items
+            ])
+
+            delivered: List[Dict[str, Any]] = []
+            for item, acked in zip(items, results):
+                ticket_id = item["event"]["ticket_id"]
+                if ticket_id in held:
+                    # Possibly published already; sent again after the held event (consumers skip repeats by sequence)
+                    continue
+                if acked:
+                    delivered.append(item)
+                else:
+                    held.add(ticket_id)
+                    failed.append(item)
+
+            if delivered:
+                await db_service.delete_outbox(delivered)
+            published += len(delivered)
+
+            last_ticket_id = items[-1]["event"]["ticket_id"]
+            if len(items) < settings.OUTBOX_RELAY_BATCH_SIZE or last_ticket_id not in held:
+                break
+            after_ticket_id = last_ticket_id
+
+        self.published_total += published
+        if failed:
+            self.failed_total += len(failed)
+            logger.error(f"Outbox relay held back {len(held)} tickets on {shard} ({published} events published)")
+            # With nothing acked the broker itself is likely down, which is no reason to give up on an event
+            if published:
+                for item in failed:
+                    await self._record_failure(item)
+
+        return published
+
+    async def _record_failure(self, item: Dict[str, Any]):
+        attempts = await db_service.record_outbox_failure(item)
+        if attempts < settings.OUTBOX_RELAY_MAX_ATTEMPTS:
+            return
+        await db_service.dead_letter_outbox({**item, "attempts": attempts}, f"Not acknowledged by the broker in {attempts} attempts")
+        self.dead_lettered_total += 1
+        logger.error(
+            f"Dead-lettered {item['event']['event_type']} event {item['event_id']} after {attempts} failed publishes"
+        )
+
+    async def dead_letters(self, limit: int) -> List[Dict[str, Any]]:
+        return [_from_dynamodb(item) for item in await db_service.read_outbox_dead_letters(limit)]
+
+    async def replay_dead_letters(self, limit: int) -> int:
+        """Put dead-lettered events back in their shards; returns how many"""
+        items = await db_service.read_outbox_dead_letters(limit)
+        for item in items:
+            await db_service.replay_outbox_dead_letter(item)
+        return len(items)
+
+    async def run_once(self) -> int:
+        """Relay one batch from every shard concurrently; returns events published"""
+        counts = await asyncio.gather(*(self.relay_shard(shard) for shard in db_service.outbox_shards()))
+        self.last_run_at = datetime.utcnow().isoformat()
+        return sum(counts)
+
+    async def run_forever(self):
+        """Long-running relay loop; polls only when the outbox is drained"""
+        logger.info("Outbox relay started")
+        while True:
+            try:
+                published = await self.run_once()
+            except Exception as e:
+                logger.error(f"Outbox relay error: {e}")
+                published = 0
+
+            if not published:
+                await asyncio.sleep(settings.OUTBOX_RELAY_POLL_SECONDS)
+
+    async def lag(self) -> Dict[str, Any]:
+        """
+        Pending and dead-lettered events (each counted up to OUTBOX_LAG_COUNT_LIMIT per shard)
+        and the age of the event at the head of each shard
+        """
+        now = datetime.now(timezone.utc)
+        cap = settings.OUTBOX_LAG_COUNT_LIMIT
+        shards = {}
+
+        for shard in db_service.outbox_shards():
+            pending, dead_letters, head = await db_service.outbox_backlog(shard, cap)
+            age = None
+            if head:
+                age = (now - datetime.fromisoformat(head)).total_seconds()
+            shards[shard] = {"pending": pending, "dead_letters": dead_letters, "head_event_age_seconds": age}
+
+        ages = [s["head_event_age_seconds"] for s in shards.values() if s["head_event_age_seconds"] is not None]
+        return {
+            "pending": sum(s["pending"] for s in shards.values()),
+            "pending_capped": any(s["pending"] >= cap for s in shards.values()),
+            "dead_letters": sum(s["dead_letters"] for s in shards.values()),
+            "head_event_age_seconds": max(ages) if ages else None,
+            "shards": shards,
+            "published_total": self.published_total,
+            "failed_total": self.failed_total,
+            "dead_lettered_total": self.dead_lettered_total,
+            "last_run_at": self.last_run_at
+        }
+
+
+# Singleton instance
+outbox_relay = OutboxRelay()
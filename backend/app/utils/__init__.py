@@ -1,3 +1,10 @@
 from app.utils.auth import get_current_user, get_current_agent
+from app.utils.pagination import encode_cursor, decode_cursor, InvalidCursorError
 
-__all__ = ["get_current_user", "get_current_agent"]
+__all__ = [
+    "get_current_user",
+    "get_current_agent",
+    "encode_cursor",
+    "decode_cursor",
+    "InvalidCursorError"
+]
@@ -0,0 +1,63 @@
+"""
+Opaque, signed continuation tokens for paginated list endpoints
+Wraps DynamoDB's LastEvaluatedKey so clients can't forge or reuse it across filters
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+from typing import Any, Dict, Optional
+
+from app.config import settings
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a continuation token is malformed, tampered with, or used with other filters"""
+
+
+def _sign(payload: bytes) -> str:
+    digest = hmac.new(
+        settings.PAGINATION_CURSOR_SECRET.encode("utf-8"),
+        payload,
+        hashlib.sha256
+    ).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def encode_cursor(last_evaluated_key: Optional[Dict[str, Any]], filters: Dict[str, Any]) -> Optional[str]:
+    """Build a signed cursor from a LastEvaluatedKey, bound to the filters that produced it"""
+    if not last_evaluated_key:
+        return None
+
+    payload = json.dumps(
+        {"k": last_evaluated_key, "f": filters},
+        separators=(",", ":"),
+        sort_keys=True,
+        default=str
+    ).encode("utf-8")
+
+    body = base64.urlsafe_b64encode(payload).rstrip(b"=").decode("ascii")
+    return f"{body}.{_sign(payload)}"
+
+
+def decode_cursor(cursor: str, filters: Dict[str, Any]) -> Dict[str, Any]:
+    """Verify a cursor and return the ExclusiveStartKey it wraps"""
+    try:
+        body, signature = cursor.split(".", 1)
+        payload = _b64decode(body)
+    except ValueError:
+        raise InvalidCursorError("Malformed cursor")
+
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise InvalidCursorError("Cursor signature mismatch")
+
+    data = json.loads(payload)
+    if data.get("f") != filters:
+        raise InvalidCursorError("Cursor was issued for different filters")
+
+    return data["k"]
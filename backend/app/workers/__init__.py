@@ -0,0 +1,3 @@
+"""
+Background workers that run outside the request path
+"""
@@ -0,0 +1,51 @@
+"""
+Outbound delivery worker
+Run as a long-lived process (python -m app.workers.delivery_worker)
+or as a scheduled Lambda (app.workers.delivery_worker.handler)
+"""
+
+import asyncio
+import logging
+
+from app.services.delivery import delivery_queue
+from app.services.messaging import messaging_service
+
+logger = logging.getLogger(__name__)
+
+# Stop claiming deliveries when the Lambda invocation has less than this left
+LAMBDA_SAFETY_MARGIN_MS = 15000
+
+
+async def _drain(context=None) -> int:
+    processed = 0
+    while True:
+        if context and context.get_remaining_time_in_millis() < LAMBDA_SAFETY_MARGIN_MS:
+            break
+        batch = await delivery_queue.run_once()
+        processed += batch
+        if not batch:
+            break
+    return processed
+
+
+def handler(event, context):
+    """Scheduled Lambda entry point: send everything that is due"""
+    processed = asyncio.get_event_loop().run_until_complete(_drain(context))
+    logger.info(
+        f"Delivery worker processed {processed} deliveries "
+        f"({delivery_queue.delivered_total} delivered, {delivery_queue.retried_total} retrying, "
+        f"{delivery_queue.failed_total} failed)"
+    )
+    return {"processed": processed}
+
+
+async def main():
+    try:
+        await delivery_queue.run_forever()
+    finally:
+        await messaging_service.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
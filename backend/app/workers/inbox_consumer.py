@@ -0,0 +1,80 @@
+"""
+Inbox consumer worker
+Consumes the ticket and message topics and keeps the inbox read models up to date.
+Run as a long-lived process (python -m app.workers.inbox_consumer [--from-offset N])
+or as an MSK-triggered Lambda (app.workers.inbox_consumer.handler)
+"""
+
+import argparse
+import asyncio
+import base64
+import logging
+from typing import Optional
+
+from app.config import settings
+from app.services import event_codec
+from app.services.event_transport import event_transport
+from app.services.inbox import inbox_projector
+
+logger = logging.getLogger(__name__)
+
+
+def handler(event, context):
+    """MSK event source entry point; Lambda commits the offsets once this returns"""
+    batch = [
+        event_codec.decode(base64.b64decode(record["value"]))
+        for records in event.get("records", {}).values()
+        for record in records
+    ]
+    applied = asyncio.get_event_loop().run_until_complete(inbox_projector.apply(batch))
+    logger.info(f"Inbox consumer applied {applied} of {len(batch)} events")
+    return {"applied": applied, "received": len(batch)}
+
+
+async def consume(from_offset: Optional[int] = None):
+    """
+    Apply events in batches, committing offsets only after a batch is written.
+    A failed batch is re-read from its first offset, so nothing is skipped; the
+    projector ignores events it has already applied.
+    """
+    try:
+        consumer = event_transport.consumer(
+            settings.KAFKA_CONSUMER_GROUP,
+            [settings.KAFKA_TOPIC_TICKETS, settings.KAFKA_TOPIC_MESSAGES],
+            from_offset
+        )
+    except RuntimeError as e:
+        logger.error(f"Inbox consumer not started: {e}")
+        return
+
+    await consumer.start()
+    logger.info(f"Inbox consumer started (group {settings.KAFKA_CONSUMER_GROUP}, {event_transport.name} transport)")
+    try:
+        while True:
+            records = await consumer.poll(settings.INBOX_CONSUMER_BATCH_SIZE, settings.INBOX_CONSUMER_POLL_MS)
+            if not records:
+                continue
+
+            try:
+                await inbox_projector.apply([record.value for record in records])
+            except Exception as e:
+                logger.error(f"Inbox consumer batch failed, retrying: {e}")
+                await consumer.rewind()
+                await asyncio.sleep(settings.INBOX_CONSUMER_RETRY_SECONDS)
+                continue
+
+            # One commit per batch, after the read models are written
+            await consumer.commit()
+    finally:
+        await consumer.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Materialize the inbox read models from Kafka")
+    parser.add_argument(
+        "--from-offset", type=int, default=None,
+        help="Replay every partition from this offset (e.g. 0 to rebuild the read models)"
+    )
+    args = parser.parse_args()
+    asyncio.run(consume(args.from_offset))
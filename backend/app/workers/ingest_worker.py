@@ -0,0 +1,81 @@
+"""
+Inbound webhook ingest worker
+Processes the webhook payloads queued by the API.
+Run as a long-lived process (python -m app.workers.ingest_worker)
+or as an SQS-triggered Lambda (app.workers.ingest_worker.handler).
+--list-dead-letters and --replay-dead-letters inspect and replay payloads that
+exhausted their retries.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+
+from app.services.ingest_queue import IngestMessage, ingest_queue
+from app.services.ingestion import webhook_ingestion
+
+logger = logging.getLogger(__name__)
+
+
+async def _process_records(records) -> list:
+    messages = [
+        IngestMessage(
+            message_id=record["messageId"],
+            receipt=record["receiptHandle"],
+            receive_count=int(record.get("attributes", {}).get("ApproximateReceiveCount", 1)),
+            body=json.loads(record["body"])
+        )
+        for record in records
+    ]
+    results = await webhook_ingestion.process_messages(messages)
+    return [message.message_id for message, ok in zip(messages, results) if not ok]
+
+
+def handler(event, context):
+    """
+    SQS event source entry point. Lambda deletes the batch once this returns, except the
+    payloads reported in batchItemFailures, which are redelivered after the visibility timeout.
+    """
+    records = event.get("Records", [])
+    failed = asyncio.get_event_loop().run_until_complete(_process_records(records))
+    logger.info(f"Ingest worker processed {len(records) - len(failed)} of {len(records)} payloads")
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed]}
+
+
+async def list_dead_letters(limit: int):
+    for message in await ingest_queue.dead_letters(limit):
+        print(json.dumps({
+            "message_id": message.message_id,
+            "receive_count": message.receive_count,
+            "platform": message.body.get("platform"),
+            "received_at": message.body.get("received_at"),
+            "payload": message.body.get("payload")
+        }))
+
+
+async def replay_dead_letters(limit: int):
+    moved = await ingest_queue.redrive(limit)
+    logger.info(f"Moved {moved} payloads from the dead-letter queue back to the ingest queue")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Process queued inbound webhook payloads")
+    parser.add_argument(
+        "--list-dead-letters", action="store_true",
+        help="Print payloads in the dead-letter queue (one JSON object per line) and exit"
+    )
+    parser.add_argument(
+        "--replay-dead-letters", action="store_true",
+        help="Move payloads from the dead-letter queue back to the ingest queue and exit"
+    )
+    parser.add_argument("--limit", type=int, default=100, help="Payloads to list or replay")
+    args = parser.parse_args()
+
+    if args.list_dead_letters:
+        asyncio.run(list_dead_letters(args.limit))
+    elif args.replay_dead_letters:
+        asyncio.run(replay_dead_letters(args.limit))
+    else:
+        asyncio.run(webhook_ingestion.run_forever())
@@ -0,0 +1,87 @@
+"""
+Outbox relay worker
+Run as a long-lived process (python -m app.workers.outbox_relay)
+or as a scheduled Lambda (app.workers.outbox_relay.handler).
+--list-dead-letters and --replay-dead-letters inspect and replay events the broker
+kept rejecting.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+
+from app.services.kafka_producer import kafka_producer
+from app.services.outbox import outbox_relay
+
+logger = logging.getLogger(__name__)
+
+# Stop draining when the Lambda invocation has less than this left
+LAMBDA_SAFETY_MARGIN_MS = 5000
+
+
+async def _drain(context=None) -> int:
+    published = 0
+    while True:
+        if context and context.get_remaining_time_in_millis() < LAMBDA_SAFETY_MARGIN_MS:
+            break
+        batch = await outbox_relay.run_once()
+        published += batch
+        if not batch:
+            break
+    return published
+
+
+def handler(event, context):
+    """Scheduled Lambda entry point: drain the outbox, then report lag"""
+    loop = asyncio.get_event_loop()
+    published = loop.run_until_complete(_drain(context))
+    lag = loop.run_until_complete(outbox_relay.lag())
+    logger.info(f"Outbox relay published {published} events, {lag['pending']} pending")
+    return {"published": published, "pending": lag["pending"]}
+
+
+async def main():
+    try:
+        await outbox_relay.run_forever()
+    finally:
+        await kafka_producer.close()
+
+
+async def list_dead_letters(limit: int):
+    for item in await outbox_relay.dead_letters(limit):
+        print(json.dumps({
+            "event_id": item["event_id"],
+            "topic": item["topic"],
+            "attempts": item.get("attempts"),
+            "last_error": item.get("last_error"),
+            "dead_lettered_at": item.get("dead_lettered_at"),
+            "event": item["event"]
+        }))
+
+
+async def replay_dead_letters(limit: int):
+    moved = await outbox_relay.replay_dead_letters(limit)
+    logger.info(f"Moved {moved} events from the dead letters back to the outbox")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Relay outbox events to Kafka")
+    parser.add_argument(
+        "--list-dead-letters", action="store_true",
+        help="Print dead-lettered events (one JSON object per line) and exit"
+    )
+    parser.add_argument(
+        "--replay-dead-letters", action="store_true",
+        help="Move dead-lettered events back to the outbox and exit"
+    )
+    parser.add_argument("--limit", type=int, default=100, help="Events to list or replay")
+    args = parser.parse_args()
+
+    if args.list_dead_letters:
+        asyncio.run(list_dead_letters(args.limit))
+    elif args.replay_dead_letters:
+        asyncio.run(replay_dead_letters(args.limit))
+    else:
+        asyncio.run(main())
@@ -0,0 +1,32 @@
+"""
+One-off ticket index backfill
+Run once (python -m app.workers.ticket_index_backfill) on a tickets table written
+before StatusIndex/AgentIndex existed, before or straight after deploying the stack
+update that adds them. It removes NULL assigned_agent_id values, which DynamoDB
+rejects as an index key, and rewrites status_timestamp values that don't start with
+the ticket's status. Running it again changes nothing.
+"""
+
+import argparse
+import asyncio
+import logging
+
+from app.services.dynamodb import db_service
+
+logger = logging.getLogger(__name__)
+
+
+async def main(page_size: int):
+    counts = await db_service.backfill_ticket_index_keys(page_size)
+    logger.info(
+        f"Scanned {counts['scanned']} tickets: updated {counts['updated']}, "
+        f"skipped {counts['skipped']} changed by a live write"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Give existing tickets valid StatusIndex/AgentIndex keys")
+    parser.add_argument("--page-size", type=int, default=500, help="Tickets read per scan page")
+    args = parser.parse_args()
+    asyncio.run(main(args.page_size))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Event pipeline load test
+Publishes synthetic ticket events through the producer and consumes them back through
+the same transport on one box, reporting throughput for each side.
+
+    python benchmark_events.py --transport memory --tickets 20000
+    python benchmark_events.py --transport file --log-dir /tmp/event-log --encoding binary
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+parser = argparse.ArgumentParser(description="Measure event publish/consume throughput")
+parser.add_argument("--transport", choices=["memory", "file"], default="memory")
+parser.add_argument("--log-dir", default="./event-log", help="EVENT_LOG_DIR for the file transport")
+parser.add_argument("--encoding", choices=["json", "binary"], default="json")
+parser.add_argument("--mode", choices=["buffered", "sync"], default="buffered", help="KAFKA_PUBLISH_MODE")
+parser.add_argument("--tickets", type=int, default=10000)
+parser.add_argument("--messages-per-ticket", type=int, default=3)
+args = parser.parse_args()
+
+# Settings are read at import time
+os.environ["EVENT_TRANSPORT"] = args.transport
+os.environ["EVENT_LOG_DIR"] = args.log_dir
+os.environ["KAFKA_EVENT_ENCODING"] = args.encoding
+os.environ["KAFKA_PUBLISH_MODE"] = args.mode
+
+from app.config import settings  # noqa: E402
+from app.services import events  # noqa: E402
+from app.services.event_transport import event_transport  # noqa: E402
+from app.services.kafka_producer import kafka_producer  # noqa: E402
+
+
+def ticket_events(ticket_id: str):
+    """One ticket's lifecycle: created, messages, then a status change"""
+    now = "2025-01-19T10:00:00"
+    topic_events = [events.ticket_created({
+        "ticket_id": ticket_id,
+        "customer": {"internal_id": "cust_bench"},
+        "status": "new",
+        "priority": "medium",
+        "source": {"channel": "whatsapp"},
+        "subject": "Benchmark ticket",
+        "message_count": 1,
+        "created_at": now
+    })]
+    for n in range(args.messages_per_ticket):
+        topic_events.append(events.message_added(ticket_id, {
+            "message_id": f"msg_{n}",
+            "sender_type": "customer",
+            "timestamp": now
+        }))
+    topic_events.append(events.ticket_updated(ticket_id, {"status": "new"}, {"status": "open"}, now))
+    return events.sequenced(topic_events, len(topic_events))
+
+
+async def consume(run_prefix: str, expected: int, started: asyncio.Event) -> float:
+    consumer = event_transport.consumer(
+        f"benchmark-{run_prefix}",
+        [settings.KAFKA_TOPIC_TICKETS, settings.KAFKA_TOPIC_MESSAGES]
+    )
+    await consumer.start()
+    started.set()
+
+    received = 0
+    try:
+        while received < expected:
+            records = await consumer.poll(settings.INBOX_CONSUMER_BATCH_SIZE, 1000)
+            # A reused file log also holds earlier runs
+            received += sum(1 for record in records if record.key.startswith(run_prefix))
+            await consumer.commit()
+    finally:
+        await consumer.stop()
+    return time.perf_counter()
+
+
+async def main():
+    run_prefix = f"tkt_{uuid.uuid4().hex[:6]}"
+    batches = [ticket_events(f"{run_prefix}{n:08d}") for n in range(args.tickets)]
+    expected = sum(len(batch) for batch in batches)
+
+    started = asyncio.Event()
+    consumer_task = asyncio.create_task(consume(run_prefix, expected, started))
+    await started.wait()
+
+    start = time.perf_counter()
+    for batch in batches:
+        await kafka_producer.publish_events(batch)
+    await kafka_producer.flush()
+    published_at = time.perf_counter()
+    consumed_at = await consumer_task
+    await kafka_producer.close()
+
+    print(f"Transport: {args.transport}, encoding: {args.encoding}, publish mode: {args.mode}")
+    print(f"Events: {expected} ({args.tickets} tickets)")
+    print(f"Publish:  {published_at - start:8.3f}s  {expected / (published_at - start):12,.0f} events/s")
+    print(f"Consume:  {consumed_at - start:8.3f}s  {expected / (consumed_at - start):12,.0f} events/s (end to end)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
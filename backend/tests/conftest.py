@@ -0,0 +1,82 @@
+"""
+Shared fixtures: AWS (DynamoDB, S3) mocked with moto for the whole session
+Settings are read when app modules are imported, so the environment is set first.
+"""
+
+import os
+import sys
+import tempfile
+
+os.environ.update({
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "EVENT_TRANSPORT": "memory",
+    "WEBHOOK_INGEST_MODE": "inline",
+    "INGEST_LOCAL_QUEUE_PATH": os.path.join(tempfile.mkdtemp(), "ingest-queue.db"),
+    "OBJECT_STORE_BACKEND": "s3",
+    "OBJECT_STORE_BUCKET": "support-attachments-test",
+    "EMAIL_WEBHOOK_PASSWORD": "inbound-parse-secret",
+    # The S3 minimum, so a few MiB is enough to exercise multipart uploads
+    "OBJECT_STORE_PART_BYTES": str(5 * 1024 * 1024)
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3  # noqa: E402
+import pytest  # noqa: E402
+from moto import mock_aws  # noqa: E402
+
+# Tables the ingestion path uses: name setting -> (key schema, global secondary indexes)
+TABLES = {
+    "DYNAMODB_TICKETS_TABLE": (("ticket_id",), {
+        "CustomerIndex": ("customer_id", "status_timestamp"),
+        "StatusIndex": ("status", "status_timestamp"),
+        "AgentIndex": ("assigned_agent_id", "status_timestamp")
+    }),
+    "DYNAMODB_CUSTOMERS_TABLE": (("internal_id",), {"ChannelIdentityIndex": ("channel_identity",)}),
+    "DYNAMODB_CONVERSATIONS_TABLE": (("ticket_id", "message_id"), {}),
+    "DYNAMODB_CHANNEL_ROUTES_TABLE": (("channel_key",), {}),
+    "DYNAMODB_OUTBOX_TABLE": (("shard", "event_id"), {}),
+    "DYNAMODB_INBOX_TABLE": (("inbox_id", "ticket_id"), {}),
+    "DYNAMODB_DELIVERIES_TABLE": (("ticket_id", "message_id"), {}),
+    "DYNAMODB_WEBHOOK_RECEIPTS_TABLE": (("receipt_key",), {}),
+    "DYNAMODB_EMAIL_THREADS_TABLE": (("message_id",), {})
+}
+
+
+def _key_schema(keys):
+    return [{"AttributeName": key, "KeyType": key_type} for key, key_type in zip(keys, ("HASH", "RANGE"))]
+
+
+@pytest.fixture(scope="session", autouse=True)
+def aws():
+    with mock_aws():
+        from app.config import settings
+
+        dynamodb = boto3.client("dynamodb", region_name=settings.AWS_REGION)
+        for setting, (keys, indexes) in TABLES.items():
+            attributes = dict.fromkeys([*keys, *(key for index in indexes.values() for key in index)])
+            table = {
+                "TableName": getattr(settings, setting),
+                "AttributeDefinitions": [{"AttributeName": name, "AttributeType": "S"} for name in attributes],
+                "KeySchema": _key_schema(keys),
+                "BillingMode": "PAY_PER_REQUEST"
+            }
+            if indexes:
+                table["GlobalSecondaryIndexes"] = [
+                    {"IndexName": name, "KeySchema": _key_schema(index), "Projection": {"ProjectionType": "ALL"}}
+                    for name, index in indexes.items()
+                ]
+            dynamodb.create_table(**table)
+        boto3.client("s3", region_name=settings.AWS_REGION).create_bucket(Bucket=settings.OBJECT_STORE_BUCKET)
+        yield
+
+
+@pytest.fixture
+def bucket(aws):
+    """The attachments bucket, emptied after each test"""
+    from app.config import settings
+
+    bucket = boto3.resource("s3", region_name=settings.AWS_REGION).Bucket(settings.OBJECT_STORE_BUCKET)
+    yield bucket
+    bucket.objects.all().delete()
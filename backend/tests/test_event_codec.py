@@ -0,0 +1,64 @@
+"""
+Event encodings: binary round trip, schema versions and JSON fallback
+"""
+
+import json
+
+import pytest
+
+from app.config import settings
+from app.services import event_codec
+from app.services.events import SCHEMA_VERSION
+
+EVENT = {
+    "event_type": "ticket.updated",
+    "ticket_id": "tkt_abc123",
+    "sequence": 300,
+    "schema_version": SCHEMA_VERSION,
+    "changes": {
+        "status": {"old": "open", "new": "resolved"},
+        "tags": {"old": [], "new": ["billing", "ünïcode"]}
+    },
+    "assigned_agent_id": None,
+    "is_bot_handoff": False,  # Not in the field table: written inline
+    "score": -1.5,
+    "offset": -(2 ** 40)
+}
+
+
+def test_binary_round_trip():
+    data = event_codec.encode_binary(EVENT)
+
+    assert data[:2] == bytes((event_codec.MAGIC, SCHEMA_VERSION))
+    assert event_codec.decode(data) == EVENT
+
+
+def test_known_fields_are_written_by_index():
+    data = event_codec.encode_binary(EVENT)
+
+    assert b"event_type" not in data
+    assert b"is_bot_handoff" in data
+    assert len(data) < len(json.dumps(EVENT).encode("utf-8"))
+
+
+def test_unsupported_schema_version_is_rejected():
+    data = bytearray(event_codec.encode_binary(EVENT))
+    data[1] = max(event_codec.FIELDS) + 1
+
+    with pytest.raises(ValueError, match="schema version"):
+        event_codec.decode(bytes(data))
+
+
+def test_unencodable_value_is_rejected():
+    with pytest.raises(TypeError):
+        event_codec.encode_binary({"ticket_id": object()})
+
+
+@pytest.mark.parametrize("encoding", ["json", "binary"])
+def test_decode_accepts_either_encoding(monkeypatch, encoding):
+    monkeypatch.setattr(settings, "KAFKA_EVENT_ENCODING", encoding)
+
+    data = event_codec.encode(EVENT)
+
+    assert (data[0] == event_codec.MAGIC) == (encoding == "binary")
+    assert event_codec.decode(data) == EVENT
@@ -0,0 +1,204 @@
+"""
+Inbound email: streaming Inbound Parse posts into object storage, size limits,
+threading replies onto tickets and cleanup when a post can't be queued
+"""
+
+import hashlib
+import json
+import os
+import uuid
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.main import app
+from app.services.dynamodb import db_service
+from app.services.inbound_email import receive_email, thread_headers
+from app.services.ingestion import webhook_ingestion
+
+BOUNDARY = "xYzZY"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def _field(name, value, file_name=None, content_type=None):
+    disposition = f'form-data; name="{name}"'
+    if file_name:
+        disposition += f'; filename="{file_name}"'
+    head = f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n"
+    if content_type:
+        head += f"Content-Type: {content_type}\r\n"
+    return head.encode() + b"\r\n" + (value if isinstance(value, bytes) else value.encode()) + b"\r\n"
+
+
+def _email(message_id, in_reply_to=None, references=None, text="Hello", attachments=(), sender="Jane Doe <jane@example.com>"):
+    """An Inbound Parse post (parsed mode) as SendGrid sends it"""
+    headers = f"Message-ID: {message_id}\nDate: Wed, 14 Oct 2026 10:00:00 +0200\n"
+    if in_reply_to:
+        headers += f"In-Reply-To: {in_reply_to}\n"
+    if references:
+        headers += f"References: {references}\n"
+
+    body = b"".join([
+        _field("headers", headers),
+        _field("from", sender),
+        _field("to", "support@example.com"),
+        _field("subject", "Printer broken"),
+        _field("text", text),
+        _field("attachment-info", json.dumps({
+            f"attachment{n}": {"filename": file_name, "type": "application/pdf"}
+            for n, (file_name, _) in enumerate(attachments, 1)
+        })),
+        *(
+            _field(f"attachment{n}", data, file_name, "application/pdf")
+            for n, (file_name, data) in enumerate(attachments, 1)
+        )
+    ])
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+async def _chunks(data, size=64 * 1024):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _message_id():
+    return f"<{uuid.uuid4().hex}@mail.example.com>"
+
+
+def _client(auth=("sendgrid", "inbound-parse-secret")):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", auth=auth)
+
+
+@pytest.mark.asyncio
+async def test_receive_email_streams_attachment_to_s3(bucket):
+    attachment = os.urandom(6 * 1024 * 1024 + 1)  # More than one upload part
+    message_id = _message_id()
+
+    payload = await receive_email(
+        CONTENT_TYPE, _chunks(_email(message_id, attachments=[("report.pdf", attachment)]))
+    )
+
+    assert payload["message_id"] == message_id
+    assert payload["from"] == "Jane Doe <jane@example.com>"
+    assert payload["text"] == "Hello"
+    assert set(payload["bodies"]) == {"text"}
+
+    [stored] = payload["attachments"]
+    assert stored["attachment_id"] == "attachment1"
+    assert stored["file_name"] == "report.pdf"
+    assert stored["file_type"] == "application/pdf"
+    assert stored["size_bytes"] == len(attachment)
+    assert stored["sha256"] == hashlib.sha256(attachment).hexdigest()
+    assert bucket.Object(stored["storage_key"]).get()["Body"].read() == attachment
+
+
+@pytest.mark.asyncio
+async def test_email_over_size_limit_returns_413(bucket, monkeypatch):
+    monkeypatch.setattr(settings, "EMAIL_MAX_BYTES", 1024 * 1024)
+    body = _email(_message_id(), attachments=[("big.bin", os.urandom(2 * 1024 * 1024))])
+
+    async with _client() as client:
+        response = await client.post(
+            "/api/webhooks/email", content=_chunks(body), headers={"content-type": CONTENT_TYPE}
+        )
+
+    assert response.status_code == 413
+    assert list(bucket.objects.all()) == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("auth", [None, ("sendgrid", "wrong")])
+async def test_email_without_credentials_returns_401(bucket, auth):
+    body = _email(_message_id(), attachments=[("report.pdf", b"%PDF-1.4")])
+
+    async with _client(auth) as client:
+        response = await client.post("/api/webhooks/email", content=body, headers={"content-type": CONTENT_TYPE})
+
+    assert response.status_code == 401
+    assert list(bucket.objects.all()) == []
+
+
+def test_thread_headers():
+    headers = thread_headers(
+        "Message-ID: <c@x>\n"
+        "In-Reply-To: <b@x>\n"
+        "References: <a@x>\n <b@x>\n"
+        "Date: Wed, 14 Oct 2026 10:00:00 +0200\n"
+    )
+
+    assert headers == {
+        "message_id": "<c@x>",
+        "in_reply_to": ["<b@x>"],
+        "references": ["<a@x>", "<b@x>"],
+        "sent_at": "2026-10-14T08:00:00"
+    }
+
+
+@pytest.mark.asyncio
+async def test_reply_threads_onto_existing_ticket(bucket):
+    first, reply = _message_id(), _message_id()
+
+    async with _client() as client:
+        for body in (_email(first), _email(reply, in_reply_to=first, references=first, text="Any news?")):
+            response = await client.post("/api/webhooks/email", content=body, headers={"content-type": CONTENT_TYPE})
+            assert response.status_code == 200
+
+    customer_id = (await db_service.get_or_create_customer("jane@example.com", "email"))["internal_id"]
+    ticket_id = await db_service.find_email_thread([first], customer_id)
+    assert ticket_id is not None
+    assert await db_service.find_email_thread([reply], customer_id) == ticket_id
+
+    ticket = await db_service.get_ticket(ticket_id)
+    assert ticket.source.origin_platform_id == first
+    assert ticket.message_count == 2
+    assert sorted(message.content for message in ticket.timeline) == ["Any news?", "Hello"]
+
+
+@pytest.mark.asyncio
+async def test_reply_from_another_sender_opens_new_ticket(bucket):
+    first, reply = _message_id(), _message_id()
+
+    async with _client() as client:
+        for body in (
+            _email(first),
+            _email(reply, in_reply_to=first, references=first, text="Not mine", sender="mallory@example.net")
+        ):
+            response = await client.post("/api/webhooks/email", content=body, headers={"content-type": CONTENT_TYPE})
+            assert response.status_code == 200
+
+    jane = (await db_service.get_or_create_customer("jane@example.com", "email"))["internal_id"]
+    mallory = (await db_service.get_or_create_customer("mallory@example.net", "email"))["internal_id"]
+    ticket_id = await db_service.find_email_thread([first], jane)
+    assert await db_service.find_email_thread([first], mallory) is None
+    assert await db_service.find_email_thread([reply], mallory) not in (None, ticket_id)
+    assert (await db_service.get_ticket(ticket_id)).message_count == 1
+
+
+@pytest.mark.asyncio
+async def test_redelivered_email_leaves_no_objects(bucket):
+    body = _email(_message_id(), attachments=[("report.pdf", b"%PDF-1.4")])
+
+    async with _client() as client:
+        for _ in range(2):
+            response = await client.post("/api/webhooks/email", content=body, headers={"content-type": CONTENT_TYPE})
+            assert response.status_code == 200
+
+    # One post's text body and attachment; the redelivery's copies were removed
+    assert len({stored.key.rsplit("/", 1)[0] for stored in bucket.objects.all()}) == 1
+    assert len(list(bucket.objects.all())) == 2
+
+
+@pytest.mark.asyncio
+async def test_stored_objects_removed_when_enqueue_fails(bucket, monkeypatch):
+    async def unavailable(platform, payload):
+        raise RuntimeError("queue unavailable")
+
+    monkeypatch.setattr(webhook_ingestion, "accept", unavailable)
+    body = _email(_message_id(), attachments=[("report.pdf", b"%PDF-1.4")])
+
+    async with _client() as client:
+        response = await client.post("/api/webhooks/email", content=body, headers={"content-type": CONTENT_TYPE})
+
+    assert response.status_code == 500
+    assert list(bucket.objects.all()) == []
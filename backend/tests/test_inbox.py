@@ -0,0 +1,146 @@
+"""
+Inbox projection: events applied out of order, redelivered or replayed
+"""
+
+import uuid
+
+import pytest
+
+from app.services import inbox
+from app.services.dynamodb import db_service
+from app.services.inbox import InboxProjector, agent_inbox, inbox_projector, status_inbox
+
+
+def _created(ticket_id, sequence=1):
+    return {
+        "event_type": "ticket.created",
+        "ticket_id": ticket_id,
+        "sequence": sequence,
+        "timestamp": "2026-10-17T10:00:00",
+        "subject": "Refund",
+        "status": "new",
+        "priority": "medium",
+        "source": "whatsapp",
+        "customer_id": "cust_1",
+        "message_count": 1
+    }
+
+
+def _updated(ticket_id, sequence, minute, **changes):
+    return {
+        "event_type": "ticket.updated",
+        "ticket_id": ticket_id,
+        "sequence": sequence,
+        "timestamp": f"2026-10-17T10:{minute:02d}:00",
+        "changes": {field: {"old": old, "new": new} for field, (old, new) in changes.items()}
+    }
+
+
+def _message(ticket_id, sequence, sender_type="customer"):
+    return {
+        "event_type": "message.added",
+        "ticket_id": ticket_id,
+        "sequence": sequence,
+        "timestamp": "2026-10-17T10:30:00",
+        "sender_type": sender_type
+    }
+
+
+async def _rows(ticket_id, *inbox_ids):
+    """The ticket's state row and its rows in the given inboxes, keyed by inbox_id"""
+    keys = [(f"{inbox.STATE_PREFIX}{ticket_id}", ticket_id), *((inbox_id, ticket_id) for inbox_id in inbox_ids)]
+    rows = {}
+    for inbox_id, key_ticket_id in keys:
+        item = (await db_service.get_inbox_items([(inbox_id, key_ticket_id)])).get(ticket_id)
+        if item:
+            rows[inbox_id] = item
+    return rows
+
+
+@pytest.fixture
+def ticket_id(aws):
+    return f"tkt_{uuid.uuid4().hex[:12]}"
+
+
+@pytest.mark.asyncio
+async def test_late_event_does_not_overwrite_newer_value(ticket_id):
+    await inbox_projector.apply([_created(ticket_id)])
+    await inbox_projector.apply([_updated(ticket_id, 3, 20, status=("open", "resolved"))])
+
+    # Sequence 2 arrives after 3: it is applied (counted), but status stays resolved
+    assert await inbox_projector.apply([
+        _updated(ticket_id, 2, 10, status=("new", "open"), assigned_agent_id=(None, "agent-1"))
+    ]) == 1
+
+    rows = await _rows(ticket_id, status_inbox("open"), status_inbox("resolved"), agent_inbox("agent-1"))
+    state = rows.pop(f"{inbox.STATE_PREFIX}{ticket_id}")
+    assert state["status"] == "resolved"
+    assert state["assigned_agent_id"] == "agent-1"
+    assert state["applied_through"] == 3
+    assert state["applied_sequences"] == []
+    assert state["field_sequences"] == {
+        "subject": 1, "priority": 1, "channel": 1, "customer_id": 1, "created_at": 1,
+        "status": 3, "assigned_agent_id": 2
+    }
+    assert state["updated_at"] == "2026-10-17T10:20:00"
+    assert set(rows) == {status_inbox("resolved"), agent_inbox("agent-1")}
+
+
+@pytest.mark.asyncio
+async def test_redelivered_events_are_skipped(ticket_id):
+    batch = [_created(ticket_id), _message(ticket_id, 2), _message(ticket_id, 3, sender_type="agent")]
+    assert await inbox_projector.apply(batch) == 3
+    skipped = inbox_projector.skipped_total
+
+    # Redelivery of the whole poll, and a duplicate within one batch
+    assert await inbox_projector.apply(batch) == 0
+    assert await inbox_projector.apply([_message(ticket_id, 4), _message(ticket_id, 4)]) == 1
+
+    assert inbox_projector.skipped_total == skipped + 4
+    state = (await _rows(ticket_id))[f"{inbox.STATE_PREFIX}{ticket_id}"]
+    assert state["message_count"] == 4  # One with ticket.created, then 2, 3 and 4 once each
+    assert state["last_sender_type"] == "customer"
+    assert state["applied_through"] == 4
+
+
+@pytest.mark.asyncio
+async def test_message_before_ticket_created(ticket_id):
+    await inbox_projector.apply([_message(ticket_id, 2, sender_type="agent")])
+    await inbox_projector.apply([_created(ticket_id)])
+
+    state = (await _rows(ticket_id))[f"{inbox.STATE_PREFIX}{ticket_id}"]
+    assert state["message_count"] == 2
+    assert state["last_sender_type"] == "agent"
+    assert state["status"] == "new"
+    assert state["applied_through"] == 2
+
+
+def test_gap_is_tracked_until_filled():
+    state = {}
+    for sequence in (1, 3, 4):
+        assert InboxProjector._first_delivery(state, {"event_type": "message.added", "sequence": sequence})
+
+    assert (state["applied_through"], state["applied_sequences"]) == (1, [3, 4])
+    assert not InboxProjector._first_delivery(state, {"event_type": "message.added", "sequence": 3})
+
+    assert InboxProjector._first_delivery(state, {"event_type": "ticket.updated", "sequence": 2})
+    assert (state["applied_through"], state["applied_sequences"]) == (4, [])
+
+
+def test_gap_given_up_past_pending_limit(monkeypatch):
+    monkeypatch.setattr(inbox, "MAX_PENDING_SEQUENCES", 2)
+    state = {"applied_through": 1}
+
+    for sequence in (3, 4, 5):
+        InboxProjector._first_delivery(state, {"event_type": "message.added", "sequence": sequence})
+
+    # Sequence 2 never came; past the limit the state moves on without it
+    assert (state["applied_through"], state["applied_sequences"]) == (5, [])
+    assert not InboxProjector._first_delivery(state, {"event_type": "ticket.updated", "sequence": 2})
+
+
+def test_legacy_high_water_mark_still_skips():
+    state = {"ticket_sequence": 5, "message_sequence": 2}
+
+    assert not InboxProjector._first_delivery(state, {"event_type": "ticket.updated", "sequence": 4})
+    assert InboxProjector._first_delivery(state, {"event_type": "message.added", "sequence": 4})
@@ -0,0 +1,138 @@
+"""
+Webhook ingestion: per-sender ordering of concurrent processing and of coalesced bursts
+"""
+
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.models import Channel
+from app.services.ingestion import BurstCoalescer, InboundMessage, dispatch_ordered
+
+
+@pytest.mark.asyncio
+async def test_dispatch_keeps_each_sender_in_order():
+    items = [(sender, n) for n in range(5) for sender in "abcd"]
+    handled = []
+    in_flight = set()
+    most_in_flight = 0
+
+    async def handle(batch):
+        nonlocal most_in_flight
+        sender = batch[0][0]
+        assert sender not in in_flight  # Never two calls for one sender at once
+        in_flight.add(sender)
+        most_in_flight = max(most_in_flight, len(in_flight))
+        await asyncio.sleep(0.001 * ((ord(sender) + batch[0][1]) % 3))  # Senders finish out of step
+        handled.extend(batch)
+        in_flight.discard(sender)
+
+    errors = await dispatch_ordered(items, key=lambda item: item[0], handle=handle, concurrency=3)
+
+    assert errors == [None] * len(items)
+    assert most_in_flight == 3
+    for sender in "abcd":
+        assert [n for s, n in handled if s == sender] == list(range(5))
+
+
+@pytest.mark.asyncio
+async def test_dispatch_batches_consecutive_items_of_a_sender():
+    items = [("a", 0), ("b", 0), ("a", 1), ("a", 2), ("b", 1)]
+    calls = []
+
+    async def handle(batch):
+        calls.append(batch)
+
+    await dispatch_ordered(items, key=lambda item: item[0], handle=handle, concurrency=1, batch_size=2)
+
+    assert calls == [[("a", 0), ("a", 1)], [("a", 2)], [("b", 0), ("b", 1)]]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_stops_a_sender_after_a_failure():
+    items = [("a", 0), ("b", 0), ("a", 1), ("b", 1), ("a", 2)]
+    handled = []
+    failure = RuntimeError("write failed")
+
+    async def handle(batch):
+        if batch == [("a", 1)]:
+            raise failure
+        handled.extend(batch)
+
+    errors = await dispatch_ordered(items, key=lambda item: item[0], handle=handle, concurrency=2)
+
+    # ("a", 2) is never attempted, so a retry of ("a", 1) can't land after it
+    assert handled.count(("a", 2)) == 0
+    assert sorted(handled) == [("a", 0), ("b", 0), ("b", 1)]
+    assert errors == [None, None, failure, None, failure]
+
+
+def _inbound(sender_id, text):
+    return InboundMessage(
+        channel=Channel.WHATSAPP,
+        sender_id=sender_id,
+        platform_message_id=f"wamid.{sender_id}.{text}",
+        text=text,
+        subject="WhatsApp conversation",
+        timestamp="2026-10-17T10:00:00",
+        channel_specific_data={}
+    )
+
+
+@pytest.fixture
+def coalesce(monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_COALESCE_WINDOW_MS", 20)
+    monkeypatch.setattr(settings, "INGEST_COALESCE_MAX_MESSAGES", 2)
+
+
+@pytest.mark.asyncio
+async def test_burst_is_written_once(coalesce):
+    writes = []
+
+    async def write(messages):
+        writes.append([message.text for message in messages])
+
+    coalescer = BurstCoalescer(write)
+    await asyncio.gather(
+        coalescer.add([_inbound("alice", "hi")]),
+        coalescer.add([_inbound("alice", "there")]),
+        coalescer.add([_inbound("bob", "hello")])
+    )
+
+    assert sorted(writes) == [["hello"], ["hi", "there"]]
+    assert coalescer.stats()["bursts_total"] == 2
+
+
+@pytest.mark.asyncio
+async def test_later_bursts_fail_after_an_earlier_one_fails(coalesce):
+    release = asyncio.Event()
+    writes = []
+
+    async def write(messages):
+        texts = [message.text for message in messages]
+        if texts == ["one", "two"]:
+            await release.wait()
+            raise RuntimeError("ticket write failed")
+        writes.append(texts)
+
+    coalescer = BurstCoalescer(write)
+    # The first burst closes at the size limit and is still being written when the next opens
+    first = asyncio.ensure_future(coalescer.add([_inbound("alice", "one"), _inbound("alice", "two")]))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(coalescer.add([_inbound("alice", "three")]))
+    other = asyncio.ensure_future(coalescer.add([_inbound("bob", "hello")]))
+    await asyncio.sleep(0.05)  # Past the window: the second burst waits on the first
+    release.set()
+
+    first_error, second_error, other_error = await asyncio.gather(first, second, other, return_exceptions=True)
+
+    assert str(first_error) == "ticket write failed"
+    assert isinstance(second_error, RuntimeError)
+    assert second_error.__cause__ is first_error
+    assert other_error is None
+    assert writes == [["hello"]]  # "three" was never written ahead of the redelivered burst
+
+    # Once the failed bursts are done, the sender's next burst is written normally
+    await coalescer.add([_inbound("alice", "four")])
+    assert writes == [["hello"], ["four"]]
@@ -0,0 +1,125 @@
+"""
+Outbox relay: per-ticket ordering around an event the broker rejects, dead letters and lag
+"""
+
+import pytest
+
+from app.config import settings
+from app.services.dynamodb import db_service
+from app.services.kafka_producer import kafka_producer
+from app.services.outbox import outbox_relay
+
+SHARD = "shard#0"
+
+
+@pytest.fixture
+def outbox(aws, monkeypatch):
+    """Events put straight into one shard, and the outbox emptied after each test"""
+    monkeypatch.setattr(db_service, "outbox_shards", lambda: [SHARD])
+    table = db_service.outbox_table
+
+    def put(ticket_id, sequence, created_at="2026-10-17T10:00:00+00:00"):
+        table.put_item(Item={
+            "shard": SHARD,
+            "event_id": f"{ticket_id}#{sequence:012d}",
+            "topic": "support-tickets",
+            "event": {"event_type": "ticket.updated", "ticket_id": ticket_id, "sequence": sequence},
+            "created_at": created_at
+        })
+
+    yield put
+    for item in table.scan()["Items"]:
+        table.delete_item(Key={"shard": item["shard"], "event_id": item["event_id"]})
+
+
+def _broker(monkeypatch, rejected=()):
+    """Ack every event except those in rejected ((ticket_id, sequence) pairs); returns what was sent"""
+    sent = []
+
+    async def deliver(batch):
+        sent.extend((event["ticket_id"], event["sequence"]) for _, event in batch)
+        return [(event["ticket_id"], event["sequence"]) not in rejected for _, event in batch]
+
+    monkeypatch.setattr(kafka_producer, "deliver", deliver)
+    return sent
+
+
+def _pending():
+    return sorted(item["event_id"] for item in db_service.outbox_table.scan()["Items"] if item["shard"] == SHARD)
+
+
+@pytest.mark.asyncio
+async def test_rejected_event_holds_back_only_its_ticket(outbox, monkeypatch):
+    for sequence in (1, 2, 3):
+        outbox("tkt_a", sequence)
+        outbox("tkt_b", sequence)
+    _broker(monkeypatch, rejected={("tkt_a", 2)})
+
+    assert await outbox_relay.relay_shard(SHARD) == 4
+
+    assert _pending() == ["tkt_a#000000000002", "tkt_a#000000000003"]
+
+
+@pytest.mark.asyncio
+async def test_batch_ending_in_held_ticket_reads_past_it(outbox, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_RELAY_BATCH_SIZE", 2)
+    for sequence in (1, 2, 3):
+        outbox("tkt_a", sequence)
+    outbox("tkt_b", 1)
+    sent = _broker(monkeypatch, rejected={("tkt_a", 1)})
+
+    assert await outbox_relay.relay_shard(SHARD) == 1
+
+    assert ("tkt_b", 1) in sent
+    assert _pending() == [f"tkt_a#{sequence:012d}" for sequence in (1, 2, 3)]
+
+
+@pytest.mark.asyncio
+async def test_event_dead_lettered_after_max_attempts(outbox, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_RELAY_MAX_ATTEMPTS", 2)
+    outbox("tkt_a", 1)
+    outbox("tkt_a", 2)
+    outbox("tkt_b", 1)
+    _broker(monkeypatch, rejected={("tkt_a", 1)})
+
+    await outbox_relay.relay_shard(SHARD)
+    assert _pending() == ["tkt_a#000000000001", "tkt_a#000000000002"]
+    outbox("tkt_b", 2)  # Something else gets through, so the broker is up
+    await outbox_relay.relay_shard(SHARD)
+
+    assert _pending() == ["tkt_a#000000000002"]
+    [dead] = await outbox_relay.dead_letters(10)
+    assert dead["event_id"] == "tkt_a#000000000001"
+    assert dead["attempts"] == 2
+
+    assert await outbox_relay.replay_dead_letters(10) == 1
+    assert _pending() == ["tkt_a#000000000001", "tkt_a#000000000002"]
+    assert await outbox_relay.dead_letters(10) == []
+
+
+@pytest.mark.asyncio
+async def test_broker_down_counts_no_attempts(outbox, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_RELAY_MAX_ATTEMPTS", 1)
+    outbox("tkt_a", 1)
+    outbox("tkt_b", 1)
+    _broker(monkeypatch, rejected={("tkt_a", 1), ("tkt_b", 1)})
+
+    assert await outbox_relay.relay_shard(SHARD) == 0
+
+    assert _pending() == ["tkt_a#000000000001", "tkt_b#000000000001"]
+    assert await outbox_relay.dead_letters(10) == []
+
+
+@pytest.mark.asyncio
+async def test_lag_counts_up_to_the_limit(outbox, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_LAG_COUNT_LIMIT", 2)
+    outbox("tkt_a", 1, created_at="2026-10-17T09:00:00+00:00")
+    outbox("tkt_b", 1)
+    outbox("tkt_c", 1)
+
+    lag = await outbox_relay.lag()
+
+    assert lag["pending"] == 2
+    assert lag["pending_capped"] is True
+    assert lag["dead_letters"] == 0
+    assert lag["shards"][SHARD]["head_event_age_seconds"] > 0
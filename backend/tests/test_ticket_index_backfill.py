@@ -0,0 +1,83 @@
+"""
+Ticket index backfill: tickets written before StatusIndex/AgentIndex get valid keys
+"""
+
+import boto3
+import pytest
+
+from app.config import settings
+from app.services.dynamodb import db_service
+
+
+@pytest.fixture
+def legacy_tickets(aws, monkeypatch):
+    """Tickets table as the old stacks created it (CustomerIndex only), put in place of the real one"""
+    dynamodb = boto3.resource("dynamodb", region_name=settings.AWS_REGION)
+    table = dynamodb.create_table(
+        TableName="support-tickets-legacy",
+        KeySchema=[{"AttributeName": "ticket_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "ticket_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST"
+    )
+    monkeypatch.setattr(db_service, "tickets_table", table)
+    yield table
+    table.delete()
+
+
+def _legacy_ticket(ticket_id, status, status_timestamp, **attributes):
+    return {
+        "ticket_id": ticket_id,
+        "status": status,
+        "status_timestamp": status_timestamp,
+        "created_at": "2025-01-01T12:00:00",
+        **attributes
+    }
+
+
+@pytest.mark.asyncio
+async def test_backfill_fixes_index_keys(legacy_tickets):
+    legacy_tickets.put_item(Item=_legacy_ticket(
+        "tkt_unassigned", "new", "new#2025-01-01T12:00:00", assigned_agent_id=None
+    ))
+    legacy_tickets.put_item(Item=_legacy_ticket(
+        "tkt_enum_name", "resolved", "TicketStatus.RESOLVED#2025-01-02T09:30:00", assigned_agent_id="agent-1"
+    ))
+    legacy_tickets.put_item(Item=_legacy_ticket(
+        "tkt_current", "open", "open#2025-01-03T08:00:00", assigned_agent_id="agent-1"
+    ))
+
+    counts = await db_service.backfill_ticket_index_keys(page_size=2)
+
+    assert counts == {"scanned": 3, "updated": 2, "skipped": 0}
+    unassigned = legacy_tickets.get_item(Key={"ticket_id": "tkt_unassigned"})["Item"]
+    assert "assigned_agent_id" not in unassigned
+    assert unassigned["status_timestamp"] == "new#2025-01-01T12:00:00"
+    enum_name = legacy_tickets.get_item(Key={"ticket_id": "tkt_enum_name"})["Item"]
+    assert enum_name["status_timestamp"] == "resolved#2025-01-02T09:30:00"
+    assert enum_name["assigned_agent_id"] == "agent-1"
+
+    assert await db_service.backfill_ticket_index_keys() == {"scanned": 3, "updated": 0, "skipped": 0}
+
+
+@pytest.mark.asyncio
+async def test_backfill_skips_ticket_changed_since_scan(legacy_tickets, monkeypatch):
+    legacy_tickets.put_item(Item=_legacy_ticket(
+        "tkt_raced", "new", "TicketStatus.NEW#2025-01-01T12:00:00", assigned_agent_id=None
+    ))
+    index_key_fix = db_service._index_key_fix
+
+    def fix_after_live_write(item):
+        # A live update assigns the ticket between the scan and the backfill's write
+        legacy_tickets.update_item(
+            Key={"ticket_id": item["ticket_id"]},
+            UpdateExpression="SET assigned_agent_id = :agent, status_timestamp = :status_timestamp",
+            ExpressionAttributeValues={":agent": "agent-2", ":status_timestamp": "new#2025-01-01T12:05:00"}
+        )
+        return index_key_fix(item)
+
+    monkeypatch.setattr(db_service, "_index_key_fix", fix_after_live_write)
+
+    assert await db_service.backfill_ticket_index_keys() == {"scanned": 1, "updated": 0, "skipped": 1}
+    raced = legacy_tickets.get_item(Key={"ticket_id": "tkt_raced"})["Item"]
+    assert raced["assigned_agent_id"] == "agent-2"
+    assert raced["status_timestamp"] == "new#2025-01-01T12:05:00"
@@ -0,0 +1,75 @@
+"""
+Ticket endpoints: response shapes of agent writes
+"""
+
+import httpx
+import pytest
+
+from app.main import app
+from app.services.delivery import delivery_queue
+from app.utils.auth import get_current_user
+
+
+@pytest.fixture
+def client(aws, monkeypatch):
+    """Client signed in as an agent; deliveries are recorded instead of queued"""
+    app.dependency_overrides[get_current_user] = lambda: {"sub": "agent-1"}
+    queued = []
+
+    async def enqueue(ticket, message):
+        queued.append(message.message_id)
+
+    monkeypatch.setattr(delivery_queue, "enqueue", enqueue)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+    client.queued = queued
+    yield client
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+async def _ticket(client):
+    response = await client.post("/api/tickets/create", json={
+        "source": {"channel": "web_chat"},
+        "customer": {"channel_identity": "visitor-routes"},
+        "subject": "Refund",
+        "initial_message": "Where is my refund?"
+    })
+    assert response.status_code == 201
+    return response.json()
+
+
+@pytest.mark.asyncio
+async def test_add_message_returns_ticket_with_timeline(client):
+    ticket = await _ticket(client)
+
+    response = await client.post(f"/api/tickets/{ticket['ticket_id']}/message", json={
+        "content": "I've processed your refund.",
+        "sender_type": "agent",
+        "visibility": "public"
+    })
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["ticket_id"] == ticket["ticket_id"]
+    assert [message["content"] for message in body["timeline"]] == [
+        "Where is my refund?", "I've processed your refund."
+    ]
+    assert client.queued == [body["timeline"][-1]["message_id"]]
+
+
+@pytest.mark.asyncio
+async def test_update_returns_ticket_with_timeline(client):
+    ticket = await _ticket(client)
+
+    response = await client.put(f"/api/tickets/{ticket['ticket_id']}", json={"priority": "high"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["priority"] == "high"
+    assert [message["content"] for message in body["timeline"]] == ["Where is my refund?"]
+
+
+@pytest.mark.asyncio
+async def test_add_message_to_missing_ticket(client):
+    response = await client.post("/api/tickets/tkt_missing/message", json={"content": "Hello"})
+
+    assert response.status_code == 404
@@ -0,0 +1,117 @@
+"""
+Ticket writes: event sequences and reads before outbox writes, cached counts, message IDs
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from app.config import settings
+from app.services.dynamodb import db_service
+
+
+@pytest.fixture
+def outbox_mode(aws, monkeypatch):
+    """Events written to the outbox, which is emptied after each test"""
+    monkeypatch.setattr(settings, "EVENT_OUTBOX_ENABLED", True)
+    yield
+    for item in db_service.outbox_table.scan()["Items"]:
+        db_service.outbox_table.delete_item(Key={"shard": item["shard"], "event_id": item["event_id"]})
+
+
+@pytest.fixture
+def ticket_reads(monkeypatch):
+    """Keyword arguments of every get_item on the tickets table"""
+    reads = []
+    get_item = db_service.tickets_table.get_item
+
+    def counting_get_item(**kwargs):
+        reads.append(kwargs)
+        return get_item(**kwargs)
+
+    monkeypatch.setattr(db_service.tickets_table, "get_item", counting_get_item)
+    return reads
+
+
+async def _ticket():
+    return await db_service.create_ticket({
+        "source": {"channel": "whatsapp"},
+        "customer": {"internal_id": "cust_writes", "channel_identity": "+15550100"},
+        "subject": "Order status",
+        "timeline": [{"sender_type": "customer", "content": "Where is my order?"}]
+    })
+
+
+def _outbox_sequences(ticket_id):
+    items = db_service.outbox_table.scan()["Items"]
+    return sorted(int(item["event"]["sequence"]) for item in items if item["event"]["ticket_id"] == ticket_id)
+
+
+@pytest.mark.asyncio
+async def test_message_append_after_own_write_is_one_call(outbox_mode, ticket_reads):
+    ticket = await _ticket()
+
+    await db_service.add_message_to_ticket(ticket.ticket_id, {"sender_type": "customer", "content": "Hello?"})
+    await db_service.add_message_to_ticket(ticket.ticket_id, {"sender_type": "customer", "content": "Anyone?"})
+
+    assert ticket_reads == []
+    assert _outbox_sequences(ticket.ticket_id) == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_stale_event_seq_is_re_read(outbox_mode, ticket_reads):
+    ticket = await _ticket()
+    db_service._event_seqs.set(ticket.ticket_id, 7)  # As if another process had written since
+
+    await db_service.add_message_to_ticket(ticket.ticket_id, {"sender_type": "customer", "content": "Hello?"})
+
+    [read] = ticket_reads
+    assert read["ConsistentRead"] is True
+    assert set(read["ExpressionAttributeNames"].values()) == {"ticket_id", "event_seq"}
+    assert _outbox_sequences(ticket.ticket_id) == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_update_reads_only_the_fields_it_changes(outbox_mode, ticket_reads):
+    ticket = await _ticket()
+
+    [result] = await db_service.bulk_update_tickets([ticket.ticket_id], {"priority": "high"})
+
+    assert result["success"] is True
+    [read] = ticket_reads
+    assert set(read["ExpressionAttributeNames"].values()) == {"ticket_id", "event_seq", "priority"}
+    assert (await db_service.get_ticket(ticket.ticket_id)).priority.value == "high"
+
+
+@pytest.mark.asyncio
+async def test_message_append_to_missing_ticket(outbox_mode):
+    assert await db_service.add_message_to_ticket("tkt_missing", {"sender_type": "customer", "content": "Hi"}) is None
+
+
+@pytest.mark.asyncio
+async def test_count_read_during_status_change_is_not_kept(aws, monkeypatch):
+    ticket = await _ticket()
+    run = db_service._run
+
+    async def count_before_write(fn, *args, **kwargs):
+        if fn == db_service.tickets_table.update_item:
+            await db_service.count_tickets(status="new")  # A concurrent request
+        return await run(fn, *args, **kwargs)
+
+    monkeypatch.setattr(db_service, "_run", count_before_write)
+    before = await db_service.count_tickets(status="new")
+    await db_service.update_ticket(ticket.ticket_id, {"status": "open"})
+    monkeypatch.setattr(db_service, "_run", run)
+
+    assert await db_service.count_tickets(status="new") == before - 1
+
+
+def test_message_ids_keep_write_order_past_255():
+    timestamp = datetime(2026, 10, 17, 10, 0, tzinfo=timezone.utc)
+
+    ids = [db_service._new_message_id(timestamp, position) for position in (1, 255, 256, 4096)]
+
+    assert sorted(ids) == ids
+    assert len({len(message_id) for message_id in ids}) == 1
+    with pytest.raises(ValueError):
+        db_service._new_message_id(timestamp, db_service.MESSAGE_POSITION_MAX + 1)
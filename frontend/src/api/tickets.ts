@@ -21,6 +21,9 @@ export interface Ticket {
   };
   subject: string;
   timeline: Message[];
+  last_message?: Message;
+  last_agent_message?: Message;
+  message_count: number;
 }
 
 export interface Message {
@@ -39,6 +42,7 @@ export interface TicketFilters {
   assigned_agent_id?: string;
   page?: number;
   page_size?: number;
+  cursor?: string;
 }
 
 export const ticketsApi = {
@@ -50,10 +50,7 @@ const Dashboard: React.FC = () => {
     navigate(`/tickets/${ticketId}`);
   };
 
-  const getLastMessage = (ticket: Ticket) => {
-    if (ticket.timeline.length === 0) return null;
-    return ticket.timeline[ticket.timeline.length - 1];
-  };
+  const getLastMessage = (ticket: Ticket) => ticket.last_message ?? null;
 
   return (
     <Space direction="vertical" size="large" style={{ width: '100%' }}>
@@ -230,7 +227,7 @@ const Dashboard: React.FC = () => {
                           <Space size="small">
                             <MessageOutlined style={{ fontSize: 12 }} />
                             <Text type="secondary" style={{ fontSize: 12 }}>
-                              {ticket.timeline.length} {ticket.timeline.length === 1 ? 'msg' : 'msgs'}
+                              {ticket.message_count} {ticket.message_count === 1 ? 'msg' : 'msgs'}
                             </Text>
                           </Space>
                         </Col>